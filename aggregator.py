@@ -2,9 +2,16 @@ from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import List, Optional
 import json
+import time
 
+from metrics import gauge, histogram
+from profiling import DEBUG_TIMING
 from signals import SignalOutput
 
+AGGREGATE_SECONDS = histogram('index_aggregate_seconds', 'Time to aggregate signals into the index').labels()
+INDEX_SCORE = gauge('index_score', 'Latest Khamenei index score').labels()
+INDEX_CONFIDENCE = gauge('index_confidence', 'Confidence of the latest index').labels()
+
 
 @dataclass 
 class KhameneiIndex:
@@ -15,9 +22,11 @@ class KhameneiIndex:
     timestamp: datetime
     days_remaining: int
     market_deadline: str
+    # Per-signal fetch breakdown and aggregate time in ms; only with INDEX_DEBUG_TIMING=1
+    timings: Optional[dict] = None
     
     def to_dict(self):
-        return {
+        d = {
             "score": round(self.score, 1),
             "confidence": round(self.confidence, 2),
             "level": self.level,
@@ -26,6 +35,9 @@ class KhameneiIndex:
             "days_remaining": self.days_remaining,
             "market_deadline": self.market_deadline
         }
+        if self.timings is not None:
+            d["timings"] = self.timings
+        return d
     
     def to_json(self):
         return json.dumps(self.to_dict(), indent=2)
@@ -35,6 +47,87 @@ class KhameneiIndex:
         return f"{emoji} KHAMENEI INDEX: {self.score:.1f}/100 ({self.level}) [conf: {self.confidence:.0%}] | {self.days_remaining} days to {self.market_deadline}"
 
 
+class IndexHistory:
+    """Fixed-size ring buffer of KhameneiIndex entries in timestamp order.
+    
+    Appends overwrite the oldest slot; lookups by time are a binary search over
+    the logical (oldest-first) order. With a `step`, an index in the same step
+    as the newest entry replaces it, so the buffer holds the latest index per
+    step and covers capacity * step of time however often signals update.
+    """
+    
+    def __init__(self, capacity: int, step: Optional[timedelta] = None):
+        self.capacity = capacity
+        self.step = step
+        self._items = [None] * capacity
+        self._start = 0
+        self._size = 0
+    
+    def __len__(self):
+        return self._size
+    
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError("history index out of range")
+        return self._items[(self._start + i) % self.capacity]
+    
+    def __iter__(self):
+        for i in range(self._size):
+            yield self._items[(self._start + i) % self.capacity]
+    
+    def _slot(self, when: datetime) -> int:
+        return (when - datetime.min) // self.step
+    
+    def append(self, index: "KhameneiIndex"):
+        if self.step and self._size and self._slot(index.timestamp) == self._slot(self[-1].timestamp):
+            self._items[(self._start + self._size - 1) % self.capacity] = index
+        elif self._size < self.capacity:
+            self._items[(self._start + self._size) % self.capacity] = index
+            self._size += 1
+        else:
+            self._items[self._start] = index
+            self._start = (self._start + 1) % self.capacity
+    
+    def bisect_left(self, when: datetime) -> int:
+        """Logical position of the first entry at or after `when`."""
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid].timestamp < when:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+    
+    def since(self, when: datetime) -> list:
+        return [self[i] for i in range(self.bisect_left(when), self._size)]
+
+
+def time_pressure_multiplier(days: int) -> float:
+    """
+    As deadline approaches, signals become more significant.
+    - 60+ days out: 1.0x (baseline)
+    - 30 days out: 1.2x
+    - 14 days out: 1.5x
+    - 7 days out: 2.0x
+    - 3 days out: 3.0x
+    """
+    if days >= 60:
+        return 1.0
+    elif days >= 30:
+        return 1.0 + (60 - days) / 150  # 1.0 to 1.2
+    elif days >= 14:
+        return 1.2 + (30 - days) / 53   # 1.2 to 1.5
+    elif days >= 7:
+        return 1.5 + (14 - days) / 14   # 1.5 to 2.0
+    elif days >= 3:
+        return 2.0 + (7 - days) / 4     # 2.0 to 3.0
+    else:
+        return 3.0
+
+
 class KhameneiAggregator:
     def __init__(self, market_deadline: str = "2026-03-31"):
         """
@@ -49,39 +142,25 @@ class KhameneiAggregator:
             "state_media_silence": 0.00,
         }
         self.thresholds = {"yellow": 35, "red": 65}
-        self.history = []
+        # Alert on a score jump of more than `points` within `minutes`
+        self.roc_alert = {"minutes": 10, "points": 20}
+        # Minutes of history, one entry per minute like the backtest and sweep
+        # ticks; the scheduler re-aggregates far more often than that
         self.max_history = 60
+        self.history = IndexHistory(self.max_history, step=timedelta(minutes=1))
     
-    def get_days_remaining(self):
-        now = datetime.utcnow()
+    def get_days_remaining(self, now: Optional[datetime] = None):
+        now = now or datetime.utcnow()
         delta = self.deadline_date - now
         return max(0, delta.days)
     
-    def get_time_pressure_multiplier(self):
-        """
-        As deadline approaches, signals become more significant.
-        - 60+ days out: 1.0x (baseline)
-        - 30 days out: 1.2x
-        - 14 days out: 1.5x
-        - 7 days out: 2.0x
-        - 3 days out: 3.0x
-        """
-        days = self.get_days_remaining()
-        
-        if days >= 60:
-            return 1.0
-        elif days >= 30:
-            return 1.0 + (60 - days) / 150  # 1.0 to 1.2
-        elif days >= 14:
-            return 1.2 + (30 - days) / 53   # 1.2 to 1.5
-        elif days >= 7:
-            return 1.5 + (14 - days) / 14   # 1.5 to 2.0
-        elif days >= 3:
-            return 2.0 + (7 - days) / 4     # 2.0 to 3.0
-        else:
-            return 3.0
+    def get_time_pressure_multiplier(self, now: Optional[datetime] = None):
+        return time_pressure_multiplier(self.get_days_remaining(now))
     
-    def aggregate(self, signals):
+    def aggregate(self, signals, now: Optional[datetime] = None):
+        """Combine signals into an index. `now` defaults to the wall clock; replays pass the tick time."""
+        started = time.perf_counter()
+        now = now or datetime.utcnow()
         signal_map = {s.name: s for s in signals}
         weighted_sum = 0.0
         weighted_confidence = 0.0
@@ -103,7 +182,7 @@ class KhameneiAggregator:
             confidence = 0
         
         # Apply time pressure multiplier
-        time_multiplier = self.get_time_pressure_multiplier()
+        time_multiplier = self.get_time_pressure_multiplier(now)
         score = min(100, raw_score * time_multiplier)
         
         if score >= self.thresholds["red"]:
@@ -114,11 +193,17 @@ class KhameneiAggregator:
             level = "GREEN"
         
         signal_summary = {}
+        timings = {} if DEBUG_TIMING else None
         for s in signals:
+            raw = s.raw_value
+            if DEBUG_TIMING and "timings" in raw:
+                # Reported once, under index.timings
+                timings[s.name] = raw["timings"]
+                raw = {k: v for k, v in raw.items() if k != "timings"}
             signal_summary[s.name] = {
                 "value": round(s.value, 1),
                 "confidence": round(s.confidence, 2),
-                "raw": s.raw_value
+                "raw": raw
             }
         
         # Add time pressure info
@@ -132,32 +217,37 @@ class KhameneiAggregator:
             confidence=confidence,
             level=level,
             signals=signal_summary,
-            timestamp=datetime.utcnow(),
-            days_remaining=self.get_days_remaining(),
-            market_deadline=self.market_deadline
+            timestamp=now,
+            days_remaining=self.get_days_remaining(now),
+            market_deadline=self.market_deadline,
+            timings=timings
         )
         
         self.history.append(index)
-        if len(self.history) > self.max_history:
-            self.history.pop(0)
+        INDEX_SCORE.set(score)
+        INDEX_CONFIDENCE.set(confidence)
+        elapsed = time.perf_counter() - started
+        AGGREGATE_SECONDS.observe(elapsed)
+        if timings is not None:
+            timings["aggregate_ms"] = round(elapsed * 1000, 3)
         
         return index
     
-    def get_rate_of_change(self, minutes=10):
+    def get_rate_of_change(self, minutes=10, now: Optional[datetime] = None):
         if len(self.history) < 2:
             return None
-        cutoff = datetime.utcnow() - timedelta(minutes=minutes)
-        recent = [h for h in self.history if h.timestamp >= cutoff]
-        if len(recent) < 2:
+        cutoff = (now or datetime.utcnow()) - timedelta(minutes=minutes)
+        first = self.history.bisect_left(cutoff)
+        if len(self.history) - first < 2:
             return None
-        return recent[-1].score - recent[0].score
+        return self.history[-1].score - self.history[first].score
     
     def should_alert(self, current, last_alerted_level):
         if current.level != last_alerted_level:
             return True
         if current.level == "RED":
             return True
-        roc = self.get_rate_of_change(10)
-        if roc and roc > 20:
+        roc = self.get_rate_of_change(self.roc_alert["minutes"], now=current.timestamp)
+        if roc and roc > self.roc_alert["points"]:
             return True
         return False
@@ -0,0 +1,241 @@
+"""
+Historical replay of the Khamenei Index.
+Pulls a date range out of storage in a few bulk queries, rebuilds every
+signal at each tick with the same window code the live signals use, and runs
+the result through KhameneiAggregator. Signal outputs are computed once per
+range, so replaying with other weights/thresholds only costs the aggregation
+pass.
+
+    python backtest.py --start 2026-01-01 --end 2026-02-01 [--step 60] [--out timeline.csv]
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from aggregator import KhameneiAggregator
+from signals import SignalOutput
+from signals.rate_store import RateStore
+from signals.rial_signal import RialSignal, CURRENCIES
+from signals.silence_signal import SilenceSignal, MAX_PLAUSIBLE_GAP_HOURS
+from signals.telegram_signal import TelegramSignal
+from storage import Storage, create_storage
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReplayTick:
+    timestamp: datetime
+    score: float
+    confidence: float
+    level: str
+    alert: bool
+    telegram: float
+    rial: float
+    silence: float
+
+    def to_dict(self):
+        row = asdict(self)
+        row["timestamp"] = self.timestamp.isoformat()
+        row["score"] = round(self.score, 2)
+        row["confidence"] = round(self.confidence, 3)
+        return row
+
+
+class Backtest:
+    """Replays [start, end] at `step_seconds` ticks.
+
+    rate_store: stored Bonbast history; defaults to the local rate file, read-only.
+    max_rate_age: a stored rate older than this at a tick counts as a failed fetch.
+    """
+
+    def __init__(self, storage: Storage, start: datetime, end: datetime, step_seconds: int = 60,
+                 rate_store: Optional[RateStore] = None, max_rate_age: timedelta = timedelta(minutes=10)):
+        self.storage = storage
+        self.start = start
+        self.end = end
+        self.step = timedelta(seconds=step_seconds)
+        self.max_rate_age = max_rate_age
+
+        self.telegram = TelegramSignal(storage)
+        self.silence = SilenceSignal(storage)
+        # The real store is opened read-only in load() unless one was passed in
+        self.rial = RialSignal(store=rate_store if rate_store is not None else RateStore(path=None))
+        self._rate_store = rate_store
+
+        self.mentions = []
+        self.regime_posts = []
+        self.signals = None
+        self.timings = {}
+
+    def ticks(self) -> list:
+        ticks = []
+        t = self.start
+        while t <= self.end:
+            ticks.append(t)
+            t += self.step
+        return ticks
+
+    async def load(self):
+        """Fetch everything the replay needs: mentions, regime channel activity, stored rates."""
+        started = time.perf_counter()
+
+        window = timedelta(hours=self.telegram.window_hours)
+        self.mentions = await self.storage.mention_window(self.start - window, upper=self.end)
+
+        await self.silence._resolve_channel_ids()
+        ids = sorted({cid for channel_ids in self.silence.channel_ids.values() for cid in channel_ids})
+        if ids:
+            lower = self.start - timedelta(hours=MAX_PLAUSIBLE_GAP_HOURS + 1)
+            # Last post per channel per minute is all the silence signal can see at minute ticks
+            self.regime_posts = await self.storage.post_minutes(ids, lower, self.end)
+
+        if self._rate_store is None:
+            lookback = self.start - timedelta(seconds=self.rial.store.retention_seconds)
+            self.rial.store = RateStore(read_only=True, since=lookback)
+
+        self.timings["load_s"] = round(time.perf_counter() - started, 2)
+        logger.info(
+            f"Loaded {len(self.mentions)} mentions, {len(self.regime_posts)} regime post-minutes, "
+            f"{self.rial.store.sample_count()} rate samples in {self.timings['load_s']}s"
+        )
+
+    def build_signals(self) -> list:
+        """One (telegram, rial, silence) SignalOutput triple per tick."""
+        started = time.perf_counter()
+        window = timedelta(hours=self.telegram.window_hours)
+        self.telegram._reset_window()
+
+        mentions = sorted(self.mentions, key=lambda row: row[3])
+        posts = self.regime_posts
+        last_posts = {}
+        m = p = 0
+        signals = []
+        for t in self.ticks():
+            while m < len(mentions) and mentions[m][3] <= t:
+                channel_id, message_id, msg_text, msg_date, channel = mentions[m]
+                self.telegram._add(msg_date, (channel_id, message_id), channel, msg_text)
+                m += 1
+            self.telegram._expire(t - window)
+
+            while p < len(posts) and posts[p][1] <= t:
+                last_posts[posts[p][0]] = posts[p][1]
+                p += 1
+
+            signals.append((
+                self.telegram._build_output(t),
+                self._rial_at(t),
+                self.silence._build_output(t, last_posts),
+            ))
+
+        self.signals = signals
+        self.timings["signals_s"] = round(time.perf_counter() - started, 2)
+        return signals
+
+    def _rial_at(self, t: datetime) -> SignalOutput:
+        sample = self.rial.store.sample_at("usd", t)
+        if sample is None or t - sample[0] > self.max_rate_age:
+            return SignalOutput(
+                name=self.rial.name,
+                value=0,
+                raw_value={"error": "no_stored_rate"},
+                confidence=0,
+                timestamp=t
+            )
+        rates = {code: self.rial.store.rate_at(code, t) for code in CURRENCIES}
+        rates = {code: rate for code, rate in rates.items() if rate}
+        return self.rial._build_output(t, rates, "replay")
+
+    def replay(self, aggregator: Optional[KhameneiAggregator] = None) -> list:
+        """Run the aggregator and alert rule over every tick; returns the timeline."""
+        if self.signals is None:
+            self.build_signals()
+        aggregator = aggregator or KhameneiAggregator()
+        started = time.perf_counter()
+
+        last_alerted_level = "GREEN"
+        timeline = []
+        for telegram, rial, silence in self.signals:
+            now = telegram.timestamp
+            index = aggregator.aggregate([telegram, rial, silence], now=now)
+            alert = aggregator.should_alert(index, last_alerted_level)
+            if alert:
+                last_alerted_level = index.level
+            timeline.append(ReplayTick(
+                timestamp=now,
+                score=index.score,
+                confidence=index.confidence,
+                level=index.level,
+                alert=alert,
+                telegram=telegram.value,
+                rial=rial.value,
+                silence=silence.value,
+            ))
+
+        self.timings["replay_s"] = round(time.perf_counter() - started, 2)
+        return timeline
+
+
+def summarize(timeline: list) -> dict:
+    levels = {"GREEN": 0, "YELLOW": 0, "RED": 0}
+    for tick in timeline:
+        levels[tick.level] += 1
+    return {
+        "ticks": len(timeline),
+        "levels": levels,
+        "alerts": sum(1 for tick in timeline if tick.alert),
+        "max_score": round(max((tick.score for tick in timeline), default=0), 1),
+    }
+
+
+def write_csv(timeline: list, path: str):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(ReplayTick.__dataclass_fields__))
+        writer.writeheader()
+        writer.writerows(tick.to_dict() for tick in timeline)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--start', required=True, type=datetime.fromisoformat, help='UTC, e.g. 2026-01-01')
+    parser.add_argument('--end', required=True, type=datetime.fromisoformat, help='UTC, inclusive')
+    parser.add_argument('--step', type=int, default=60, help='tick spacing in seconds')
+    parser.add_argument('--deadline', default='2026-03-31', help='market deadline for the time pressure multiplier')
+    parser.add_argument('--out', default=None, help='write the timeline as CSV')
+    args = parser.parse_args()
+
+    storage = create_storage()
+    await storage.connect()
+    try:
+        backtest = Backtest(storage, args.start, args.end, step_seconds=args.step)
+        await backtest.load()
+    finally:
+        await storage.close()
+
+    backtest.build_signals()
+    timeline = backtest.replay(KhameneiAggregator(market_deadline=args.deadline))
+
+    summary = summarize(timeline)
+    print(f"Replayed {summary['ticks']} ticks: {summary['levels']}, {summary['alerts']} alerts, max score {summary['max_score']}")
+    print(f"Timings: {backtest.timings}")
+    for tick in timeline:
+        if tick.alert:
+            print(f"  {tick.timestamp:%Y-%m-%d %H:%M} {tick.level:<6} score {tick.score:5.1f}")
+
+    if args.out:
+        write_csv(timeline, args.out)
+        print(f"Timeline written to {args.out}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
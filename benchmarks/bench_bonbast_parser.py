@@ -0,0 +1,83 @@
+"""
+Bonbast extraction benchmark: fast-path parser vs. the original BeautifulSoup chain.
+Checks both extract the same USD sell rate from every saved fixture, then times them.
+
+    python -m benchmarks.bench_bonbast_parser [--repeat 50]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from signals.bonbast_parser import parse_sell_rate
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+
+def parse_rate_soup(html: str):
+    """Reference: the original html.parser DOM and three selector strategies."""
+    soup = BeautifulSoup(html, 'html.parser')
+    current_rate = None
+
+    usd_sell = soup.select_one('#usd_sell')
+    if usd_sell:
+        current_rate = int(usd_sell.text.strip().replace(',', ''))
+
+    if not current_rate:
+        for row in soup.select('tr'):
+            cells = row.select('td')
+            if len(cells) >= 3 and 'usd' in row.get('id', '').lower():
+                current_rate = int(cells[1].text.strip().replace(',', ''))
+                break
+
+    if not current_rate:
+        usd_elem = soup.select_one('[data-currency="usd"]')
+        if usd_elem:
+            sell = usd_elem.select_one('.sell')
+            if sell:
+                current_rate = int(sell.text.strip().replace(',', ''))
+
+    return current_rate
+
+
+def time_it(fn, html: str, repeat: int) -> float:
+    """Best single-call time over `repeat` runs."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(html)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    fixtures = sorted(FIXTURES.glob('bonbast_*.html'))
+    mismatches = 0
+    for path in fixtures:
+        html = path.read_text(encoding='utf-8')
+        expected = parse_rate_soup(html)
+        rate, strategy = parse_sell_rate(html, 'usd')
+        if rate != expected:
+            mismatches += 1
+
+        soup_s = time_it(parse_rate_soup, html, args.repeat)
+        fast_s = time_it(lambda h: parse_sell_rate(h, 'usd'), html, args.repeat)
+        print(
+            f"{path.name:<24} {len(html) // 1024:>4}KB  rate={rate} (soup={expected})  "
+            f"strategy={strategy:<9}  soup {soup_s * 1000:7.2f}ms  fast {fast_s * 1000:7.3f}ms  "
+            f"{soup_s / fast_s:7.1f}x"
+        )
+
+    print(f"{len(fixtures)} fixtures, {mismatches} rate mismatches")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
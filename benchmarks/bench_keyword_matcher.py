@@ -0,0 +1,133 @@
+"""
+Keyword scoring benchmark: compiled matcher vs. the original per-keyword scan.
+Checks both give identical scores on generated corpora, then times them on a
+mention-heavy corpus and on a live-like mix, where most messages mention no
+Khamenei keyword (the scraper scores every live message).
+
+    python -m benchmarks.bench_keyword_matcher [--messages 100000]
+"""
+
+import argparse
+import platform
+import random
+import time
+
+from signals.telegram_signal import (
+    KHAMENEI_KEYWORDS,
+    CRITICAL_KEYWORDS,
+    ROUTINE_KEYWORDS,
+    score_message,
+)
+
+FILLER = (
+    'این یک متن خبری است که در کانال منتشر شده و درباره موضوعات مختلف سیاسی '
+    'و اقتصادی صحبت می کند و جزئیات بیشتری ارائه می دهد گزارش خبرنگار از تهران '
+    'امروز مقامات رسمی در نشست خبری اعلام کردند که بررسی ها ادامه دارد'
+).split()
+
+EXTRA_PHRASES = ['مرگ بر خامنه ای', 'مرگ بر', 'حال', 'خبرگان', 'جانشین', 'حالت']
+# Share of mentions in the live-like corpus, as in benchmarks.traffic's profiles
+LIVE_MENTION_RATE = 0.05
+
+
+def score_message_scan(text: str) -> int:
+    """Reference: the original implementation, one `in` scan per keyword."""
+    if not text:
+        return -1
+
+    score = 0
+
+    has_khamenei = any(kw in text for kw in KHAMENEI_KEYWORDS)
+    if not has_khamenei:
+        return -1
+
+    slogan_patterns = ['مرگ بر خامنه', 'مرگ بر']
+    is_slogan = any(pattern in text for pattern in slogan_patterns)
+
+    for kw in CRITICAL_KEYWORDS:
+        if kw in text:
+            if kw == 'مرگ' and is_slogan:
+                continue
+            score += 2
+
+    for kw in ROUTINE_KEYWORDS:
+        if kw in text:
+            score -= 1
+
+    if any(kw in text for kw in ['بیمارستان', 'بستری', 'سکته']):
+        if any(kw in text for kw in ['وخیم', 'بحرانی', 'حال']):
+            score += 3
+
+    if 'جانشین' in text and 'خبرگان' in text:
+        score += 3
+
+    if any(kw in text for kw in ['فوت', 'درگذشت']) and not is_slogan:
+        score = max(score, 4)
+
+    return max(-1, min(5, score))
+
+
+def make_corpus(n: int, seed: int = 42, mention_rate: float = 0.9) -> list:
+    """Messages of 20-80 words with keywords sprinkled in, as spelled in the lists."""
+    rng = random.Random(seed)
+    keywords = CRITICAL_KEYWORDS + ROUTINE_KEYWORDS + EXTRA_PHRASES
+    corpus = []
+    for _ in range(n):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(20, 80))]
+        if rng.random() < mention_rate:
+            words.insert(rng.randrange(len(words)), rng.choice(KHAMENEI_KEYWORDS))
+        for _ in range(rng.choice([0, 0, 1, 1, 2, 3])):
+            words.insert(rng.randrange(len(words)), rng.choice(keywords))
+        corpus.append(' '.join(words))
+    return corpus
+
+
+def time_it(fn, corpus, repeat: int) -> float:
+    """Best of `repeat` runs over the whole corpus."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in corpus:
+            fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.messages, args.seed)
+    live = make_corpus(args.messages, args.seed + 1, mention_rate=LIVE_MENTION_RATE)
+
+    mismatches = [t for t in corpus + live if score_message(t) != score_message_scan(t)]
+    print(f"Regression corpus: {len(corpus) + len(live)} messages, {len(mismatches)} score mismatches")
+    if mismatches:
+        for text in mismatches[:5]:
+            print(f"  scan={score_message_scan(text)} matcher={score_message(text)}: {text[:80]}")
+        raise SystemExit(1)
+
+    # Same corpus with ZWNJ spelled as a space: only the normalizing matcher still sees these keywords
+    variants = [t.replace('\u200c', ' ') for t in corpus]
+    recovered = sum(
+        1 for orig, var in zip(corpus, variants)
+        if score_message_scan(var) != score_message_scan(orig) and score_message(var) == score_message(orig)
+    )
+    print(f"ZWNJ-as-space variants: {recovered} messages scored correctly only after normalization")
+
+    print(f"Python {platform.python_version()}")
+    for label, texts in [("mention-heavy (90% mentions)", corpus),
+                         (f"live mix ({LIVE_MENTION_RATE:.0%} mentions)", live)]:
+        scan_s = time_it(score_message_scan, texts, args.repeat)
+        matcher_s = time_it(score_message, texts, args.repeat)
+        print(f"{label}:")
+        print(f"  Per-keyword scan: {scan_s:.3f}s ({scan_s / len(texts) * 1e6:.1f} us/msg)")
+        print(f"  Compiled matcher: {matcher_s:.3f}s ({matcher_s / len(texts) * 1e6:.1f} us/msg)")
+        print(f"  Speedup: {scan_s / matcher_s:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
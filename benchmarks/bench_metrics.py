@@ -0,0 +1,62 @@
+"""
+Metrics overhead: cost of one observation for each metric type, against an
+empty loop, so the hot-path instrumentation stays under a microsecond.
+
+    python -m benchmarks.bench_metrics [--iterations 1000000]
+"""
+
+import argparse
+import time
+
+from metrics import Registry
+
+
+def per_call_ns(fn, iterations: int, repeat: int = 5) -> float:
+    """Best of `repeat` runs, in ns per call, with the loop overhead included."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        best = min(best, time.perf_counter() - started)
+    return best / iterations * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    registry = Registry()
+    counter = registry.counter('bench_total', 'x').labels()
+    gauge = registry.gauge('bench_gauge', 'x').labels()
+    histogram = registry.histogram('bench_seconds', 'x').labels()
+    labelled = registry.histogram('bench_labelled_seconds', 'x', labels=('signal',))
+
+    def timed_observe():
+        started = time.perf_counter()
+        histogram.observe(time.perf_counter() - started)
+
+    cases = [
+        ("empty call", lambda: None),
+        ("counter.inc", counter.inc),
+        ("gauge.set", lambda: gauge.set(1.0)),
+        ("histogram.observe", lambda: histogram.observe(0.0003)),
+        ("labels().observe", lambda: labelled.labels('telegram_velocity').observe(0.0003)),
+        ("perf_counter x2 + observe", timed_observe),
+    ]
+    baseline = None
+    print(f"{'case':<28} {'ns/call':>8} {'net ns':>8}")
+    for name, fn in cases:
+        ns = per_call_ns(fn, args.iterations)
+        if baseline is None:
+            baseline = ns
+        print(f"{name:<28} {ns:>8.0f} {ns - baseline:>8.0f}")
+
+    started = time.perf_counter()
+    body = registry.render()
+    print(f"render: {len(body)} bytes in {(time.perf_counter() - started) * 1000:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
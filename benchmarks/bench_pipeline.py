@@ -0,0 +1,288 @@
+"""
+End-to-end pipeline benchmark: synthetic traffic through the scraper's message
+path, the batched writer and storage, TelegramSignal.fetch and
+KhameneiAggregator.aggregate, on the wall clock.
+Reports sustained messages/s, per-message processing time, ingest-to-index
+latency (scraper receives a mention -> it is in the signal's window and an
+index has been aggregated), poll/aggregate timings and peak RSS, and compares
+them with the saved baseline for the same profile, backend and Python version
+(major.minor; interpreter upgrades move these numbers on their own).
+
+Runs offline on in-memory SQLite by default; --backend clickhouse uses the
+configured server (and writes the synthetic rows into it). Per-message INFO
+logging is silenced so the output stays readable.
+
+    python -m benchmarks.bench_pipeline [--profile breaking] [--rate 500] [--duration 30]
+    python -m benchmarks.bench_pipeline --profile steady --unpaced --duration 300   # as fast as it goes
+    python -m benchmarks.bench_pipeline --save-baseline        # record this run as the baseline
+    python -m benchmarks.bench_pipeline --check                # exit 1 on a regression
+"""
+
+import os
+
+# Never connects; TelegramClient only insists the credentials are set
+os.environ.setdefault('TELEGRAM_API_ID', '1')
+os.environ.setdefault('TELEGRAM_API_HASH', 'benchmark')
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import resource
+import time
+from dataclasses import asdict, replace
+from datetime import datetime, timezone
+
+from telethon.sessions import MemorySession
+
+from aggregator import KhameneiAggregator
+from benchmarks.traffic import PROFILES, TrafficGenerator
+from entity_cache import EntityInfo
+from scraper import TelegramScraper
+from signals.telegram_signal import TelegramSignal
+from storage import SQLiteStorage, create_storage
+from writer import BatchWriter
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baselines', 'pipeline.json')
+
+# metric -> (higher is better, allowed relative change before it counts as a regression)
+TOLERANCES = {
+    "messages_per_s": (True, 0.10),
+    "process_us_p50": (False, 0.50),
+    "process_us_p99": (False, 0.50),
+    "latency_ms_p50": (False, 0.50),
+    "latency_ms_p99": (False, 0.50),
+    "fetch_ms_p50": (False, 0.50),
+    "fetch_ms_p99": (False, 0.50),
+    "aggregate_ms_p50": (False, 0.50),
+    "peak_rss_mb": (False, 0.25),
+}
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class PipelineBench:
+    """One run of one traffic profile through scraper -> writer -> storage -> signal -> aggregator."""
+
+    def __init__(self, storage, generator: TrafficGenerator, poll_interval: float, paced: bool = True):
+        self.storage = storage
+        self.generator = generator
+        self.poll_interval = poll_interval
+        self.paced = paced
+
+        self.writer = BatchWriter(storage.insert_messages, name="bench")
+        self.scraper = TelegramScraper([], session=MemorySession(), writer=self.writer, storage=storage)
+        # No notification socket listens here; publishing still runs, sends are dropped
+        self.signal = TelegramSignal(storage)
+        self.aggregator = KhameneiAggregator()
+
+        # (channel_id, message_id) -> perf_counter when the scraper got it
+        self.pending = {}
+        self.process_s = []
+        self.latency_s = []
+        self.fetch_s = []
+        self.aggregate_s = []
+        self.messages = 0
+        self.mentions = 0
+        self.max_lag_s = 0.0
+        self._producing = True
+
+    def _register_channels(self):
+        # What _resolve_channels leaves behind for a fresh database
+        for channel in self.generator.channels:
+            self.scraper.entities.put(channel.peer_id, EntityInfo(channel.id, channel.username, channel.title),
+                                      ttl=float('inf'))
+            self.scraper.dedup.load(channel.id, [], complete=True)
+
+    async def _produce(self) -> float:
+        started = time.perf_counter()
+        for offset, message, is_edit in self.generator.events():
+            due = started + offset
+            if self.paced:
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                self.max_lag_s = max(self.max_lag_s, time.perf_counter() - due)
+            elif self.messages % 100 == 0:
+                # Let the writer and the poller run between chunks
+                await asyncio.sleep(0)
+
+            message.stamp(datetime.now(timezone.utc), is_edit)
+            received = time.perf_counter()
+            await self.scraper._process_message(message, is_edit=is_edit, live=True)
+            self.process_s.append(time.perf_counter() - received)
+            self.messages += 1
+            # Keyed like the signal's window: the stored (unmarked) channel id
+            key = (message.channel.id, message.id)
+            if is_edit:
+                # The edit may have dropped the mention; its latency would be ambiguous anyway
+                self.pending.pop(key, None)
+            elif message.kind != 'noise':
+                self.mentions += 1
+                self.pending[key] = received
+        return time.perf_counter() - started
+
+    async def _tick(self):
+        started = time.perf_counter()
+        output = await self.signal.fetch()
+        fetched = time.perf_counter()
+        self.aggregator.aggregate([output])
+        done = time.perf_counter()
+        self.fetch_s.append(fetched - started)
+        self.aggregate_s.append(done - fetched)
+
+        window = self.signal._entries
+        for key in [k for k in self.pending if k in window]:
+            self.latency_s.append(done - self.pending.pop(key))
+
+    async def _poll(self):
+        while self._producing or self.pending:
+            started = time.perf_counter()
+            await self._tick()
+            await asyncio.sleep(max(0.0, self.poll_interval - (time.perf_counter() - started)))
+
+    async def run(self, drain_timeout: float = 10.0) -> dict:
+        self._register_channels()
+        # Fills the window once, like the index runner's first fetch
+        await self._tick()
+        poller = asyncio.get_running_loop().create_task(self._poll())
+
+        elapsed = await self._produce()
+        self._producing = False
+        await self.writer.close()
+        try:
+            await asyncio.wait_for(poller, drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        writer = self.writer.report()
+        return {
+            "messages": self.messages,
+            "mentions": self.mentions,
+            "unindexed_mentions": len(self.pending),
+            "elapsed_s": round(elapsed, 2),
+            "messages_per_s": round(self.messages / elapsed, 1),
+            "max_lag_ms": round(self.max_lag_s * 1000, 1),
+            "process_us_p50": round(percentile(self.process_s, 50) * 1e6, 1),
+            "process_us_p99": round(percentile(self.process_s, 99) * 1e6, 1),
+            "latency_ms_p50": round(percentile(self.latency_s, 50) * 1000, 1),
+            "latency_ms_p99": round(percentile(self.latency_s, 99) * 1000, 1),
+            "latency_ms_max": round(max(self.latency_s, default=0) * 1000, 1),
+            "polls": len(self.fetch_s),
+            "fetch_ms_p50": round(percentile(self.fetch_s, 50) * 1000, 2),
+            "fetch_ms_p99": round(percentile(self.fetch_s, 99) * 1000, 2),
+            "aggregate_ms_p50": round(percentile(self.aggregate_s, 50) * 1000, 3),
+            "flushes": writer["flushes"],
+            "avg_batch_rows": writer["avg_batch_rows"],
+            "avg_flush_ms": writer["avg_flush_ms"],
+            # ru_maxrss is KB on Linux
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+
+
+def load_baselines() -> dict:
+    try:
+        with open(BASELINE_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(key: str, result: dict, settings: dict):
+    baselines = load_baselines()
+    baselines[key] = {
+        "recorded_at": datetime.utcnow().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "settings": settings,
+        "result": result,
+    }
+    os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+    with open(BASELINE_FILE, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(result: dict, baseline: dict, flag: bool = True) -> list:
+    """Print result next to the baseline; returns the metrics that regressed (none unless `flag`)."""
+    regressions = []
+    print(f"{'metric':<20} {'now':>12} {'baseline':>12} {'change':>8}")
+    for metric, value in result.items():
+        base = baseline.get(metric)
+        if metric not in TOLERANCES or not base:
+            print(f"{metric:<20} {value:>12}")
+            continue
+        change = (value - base) / base
+        higher_is_better, tolerance = TOLERANCES[metric]
+        regressed = flag and (-change > tolerance if higher_is_better else change > tolerance)
+        if regressed:
+            regressions.append(metric)
+        print(f"{metric:<20} {value:>12} {base:>12} {change:>+7.0%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='breaking')
+    parser.add_argument('--rate', type=float, help='messages/s outside bursts')
+    parser.add_argument('--duration', type=float, help='seconds of traffic')
+    parser.add_argument('--channels', type=int)
+    parser.add_argument('--mention-rate', type=float)
+    parser.add_argument('--critical-rate', type=float)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--unpaced', action='store_true', help='ignore the schedule and push messages as fast as possible')
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help=f'seconds between signal polls (live: {TelegramSignal.interval}s)')
+    parser.add_argument('--backend', choices=['sqlite', 'clickhouse'], default='sqlite')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true', help='exit 1 if a metric regressed against the baseline')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    overrides = {
+        field: value for field, value in [
+            ("rate", args.rate), ("duration", args.duration), ("channels", args.channels),
+            ("mention_rate", args.mention_rate), ("critical_rate", args.critical_rate), ("seed", args.seed),
+        ] if value is not None
+    }
+    profile = replace(PROFILES[args.profile], **overrides)
+    storage = SQLiteStorage(':memory:') if args.backend == 'sqlite' else create_storage('clickhouse')
+    await storage.connect()
+    await storage.setup_database()
+
+    bench = PipelineBench(storage, TrafficGenerator(profile), args.poll_interval, paced=not args.unpaced)
+    try:
+        result = await bench.run()
+    finally:
+        await storage.close()
+
+    mode = 'unpaced' if args.unpaced else 'paced'
+    python = '.'.join(platform.python_version_tuple()[:2])
+    key = f"{args.profile}/{args.backend}/{mode}/py{python}"
+    settings = {"profile": asdict(profile), "poll_interval": args.poll_interval}
+    print(f"Pipeline benchmark {key}: {json.dumps(settings['profile'])}")
+
+    baseline = load_baselines().get(key)
+    comparable = baseline is not None and baseline["settings"] == settings
+    if baseline and not comparable:
+        print(f"Baseline for {key} was recorded with different settings; showing it for reference only")
+    regressions = compare(result, baseline["result"] if baseline else {}, flag=comparable)
+
+    if args.save_baseline:
+        save_baseline(key, result, settings)
+        print(f"Saved baseline {key} to {BASELINE_FILE}")
+    elif baseline is None:
+        print(f"No baseline for {key} yet; record one with --save-baseline")
+    elif regressions:
+        print(f"Regressed against the baseline: {', '.join(regressions)}")
+        if args.check:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
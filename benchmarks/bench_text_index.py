@@ -0,0 +1,103 @@
+"""
+Telegram mention query: full scan vs. ngram skip index vs. keyword view, for
+the first fetch of the window and for an incremental poll (rows written in the
+last poll interval + overlap).
+Needs a live ClickHouse (same .env as the scraper) with the indexes materialized
+and, for the keyword view cases, CLICKHOUSE_KEYWORD_VIEW=1 set when the scraper ran.
+--explain prints how many granules each index leaves to read.
+
+    python -m benchmarks.bench_text_index [--hours 24] [--repeat 5] [--explain]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from db import Database
+from signals.telegram_signal import OVERLAP_SECONDS, TelegramSignal
+from storage import TEXT_INDEX_NGRAM, TEXT_INDEX_SHORT_KEYWORDS, ClickHouseStorage
+
+
+async def explain(db, query: str) -> str:
+    """Granules left after each index, e.g. 'MinMax 2/40, Partition 2/2, idx_message_date 1/2'."""
+    result = await db.query(f"EXPLAIN indexes = 1 {query}")
+    steps = []
+    name = None
+    for (line,) in result.result_rows:
+        line = line.strip()
+        if line.startswith("Type:") and name is None:
+            name = line.split(":", 1)[1].strip()
+        elif line.startswith("Name:"):
+            name = line.split(":", 1)[1].strip()
+        elif line.startswith("Granules:") and name:
+            steps.append(f"{name} {line.split(':', 1)[1].strip()}")
+            name = None
+    return ", ".join(steps)
+
+
+async def run_case(db, query, repeat):
+    timings = []
+    summary = {}
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await db.query(query)
+        timings.append((time.perf_counter() - started) * 1000)
+        summary = result.summary
+        rows = len(result.result_rows)
+    return {
+        "rows": rows,
+        "read_rows": int(summary.get("read_rows", 0)),
+        "read_bytes": int(summary.get("read_bytes", 0)),
+        "p50_ms": statistics.median(timings),
+        "min_ms": min(timings),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--explain', action='store_true', help='print granules selected per index')
+    args = parser.parse_args()
+
+    db = Database()
+    await db.connect()
+    now = datetime.utcnow()
+    since = now - timedelta(hours=args.hours)
+    # What a poll asks for: rows written since the previous one, minus the overlap
+    written_since = now - timedelta(seconds=TelegramSignal.interval + OVERLAP_SECONDS)
+
+    messages = ClickHouseStorage(db)
+    view = ClickHouseStorage(db, mentions_table='khamenei_mentions')
+    cases = [
+        ("full scan", messages.mention_query(since, settings="SETTINGS use_skip_indexes = 0")),
+        ("skip indexes", messages.mention_query(since)),
+        ("keyword view", view.mention_query(since)),
+        ("poll, full scan", messages.mention_query(since, settings="SETTINGS use_skip_indexes = 0",
+                                                   written_since=written_since, versions=True)),
+        ("poll, skip indexes", messages.mention_query(since, written_since=written_since, versions=True)),
+        ("poll, keyword view", view.mention_query(since, written_since=written_since, versions=True)),
+    ]
+
+    if TEXT_INDEX_SHORT_KEYWORDS:
+        print(f"Keywords shorter than the {TEXT_INDEX_NGRAM}-character ngrams, the text index can't skip for them: "
+              f"{', '.join(TEXT_INDEX_SHORT_KEYWORDS)}")
+    print(f"{'case':<20} {'rows':>6} {'read_rows':>12} {'read_MB':>9} {'p50_ms':>8} {'min_ms':>8}")
+    for name, query in cases:
+        try:
+            r = await run_case(db, query, args.repeat)
+        except Exception as e:
+            print(f"{name:<20} failed: {e}")
+            continue
+        print(f"{name:<20} {r['rows']:>6} {r['read_rows']:>12} {r['read_bytes'] / 1e6:>9.1f} {r['p50_ms']:>8.1f} {r['min_ms']:>8.1f}")
+        if args.explain:
+            print(f"{'':<20} {await explain(db, query)}")
+
+    await db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
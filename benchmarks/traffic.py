@@ -0,0 +1,171 @@
+"""
+Synthetic Persian channel traffic for the pipeline benchmarks.
+Messages are spread over channels with a skewed (Zipf-like) activity, a share
+of them mention Khamenei, and a share of those are critical. A burst window
+multiplies the rate and the critical share to mimic breaking news. Messages
+are duck-typed stand-ins for Telethon's Message, with just the attributes
+TelegramScraper._process_message reads.
+"""
+
+import json
+import random
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from benchmarks.bench_keyword_matcher import FILLER
+from signals.telegram_signal import KHAMENEI_KEYWORDS, ROUTINE_KEYWORDS
+
+# Score >= 3 with score_message: death, illness + severity, succession + assembly
+CRITICAL_TEMPLATES = [
+    'گزارش ها از درگذشت {kw} حکایت دارد',
+    '{kw} در بیمارستان بستری شد و حال عمومی او وخیم است',
+    'جلسه اضطراری مجلس خبرگان برای تعیین جانشین {kw}',
+    'خبر فوت {kw} هنوز رسما تایید نشده است',
+]
+# Mentions that score <= 0: routine news and slogans
+ROUTINE_TEMPLATES = [
+    '{kw} در {routine} امروز گفت',
+    'متن کامل {routine} {kw}',
+    'شعار مرگ بر {kw} در تجمع امشب',
+]
+
+
+@dataclass
+class TrafficProfile:
+    rate: float = 200.0              # messages/s across all channels
+    duration: float = 20.0           # seconds
+    channels: int = 40
+    mention_rate: float = 0.05       # share of messages mentioning Khamenei
+    critical_rate: float = 0.02      # share of mentions that are critical
+    edit_rate: float = 0.01          # share of messages that are later edits of an earlier one
+    burst_at: Optional[float] = None  # seconds into the run
+    burst_seconds: float = 5.0
+    burst_multiplier: float = 10.0
+    burst_mention_rate: float = 0.4
+    burst_critical_rate: float = 0.5
+    seed: int = 42
+
+
+PROFILES = {
+    "steady": TrafficProfile(),
+    "breaking": TrafficProfile(burst_at=5.0),
+    "quiet": TrafficProfile(rate=20.0, channels=100),
+}
+
+
+@dataclass
+class FakeChannel:
+    id: int
+    username: str
+    title: str
+
+    @property
+    def peer_id(self) -> int:
+        # Marked id, as in message.chat_id (utils.get_peer_id of a Channel)
+        return -(10 ** 12 + self.id)
+
+
+class FakeMessage:
+    """The parts of telethon.tl.types.Message the scraper touches."""
+
+    def __init__(self, channel: FakeChannel, message_id: int, text: str, kind: str):
+        self.id = message_id
+        self.channel = channel
+        self.chat_id = channel.peer_id
+        # Channel posts are sent by the channel itself
+        self.sender_id = channel.peer_id
+        self.text = text
+        self.kind = kind
+        self.date = None
+        self.edit_date = None
+        self.views = 100 + message_id * 37 % 50000
+        self.forwards = message_id % 200
+        self.replies = None
+        self.media = None
+        self.forward = None
+        self.reply_to = None
+
+    def stamp(self, now: datetime, is_edit: bool = False):
+        """Set the timestamps at dispatch, so dates follow the wall clock like live traffic."""
+        if is_edit:
+            self.edit_date = now
+        else:
+            self.date = now
+
+    def edited(self, text: str, kind: str) -> "FakeMessage":
+        clone = FakeMessage.__new__(FakeMessage)
+        clone.__dict__.update(self.__dict__)
+        clone.text = text
+        clone.kind = kind
+        return clone
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "_": "Message", "id": self.id, "peer_id": {"_": "PeerChannel", "channel_id": self.chat_id},
+            "date": self.date.isoformat() if self.date else None, "message": self.text,
+            "views": self.views, "forwards": self.forwards, "post": True,
+        }, ensure_ascii=False)
+
+
+class TrafficGenerator:
+    """Yields (offset seconds, FakeMessage, is_edit) in time order for one profile."""
+
+    def __init__(self, profile: TrafficProfile):
+        self.profile = profile
+        self.rng = random.Random(profile.seed)
+        self.channels = [
+            FakeChannel(id=1_000_000 + i, username=f"bench_channel_{i}", title=f"کانال خبری {i}")
+            for i in range(profile.channels)
+        ]
+        # A few channels post most of the traffic
+        self.weights = [1 / (i + 1) for i in range(profile.channels)]
+        self.next_id = {c.id: 1 for c in self.channels}
+        self.recent = []
+
+    def in_burst(self, offset: float) -> bool:
+        p = self.profile
+        return p.burst_at is not None and p.burst_at <= offset < p.burst_at + p.burst_seconds
+
+    def _text(self, kind: str) -> str:
+        words = [self.rng.choice(FILLER) for _ in range(self.rng.randint(15, 60))]
+        if kind == 'noise':
+            return ' '.join(words)
+        kw = self.rng.choice(KHAMENEI_KEYWORDS)
+        templates = CRITICAL_TEMPLATES if kind == 'critical' else ROUTINE_TEMPLATES
+        phrase = self.rng.choice(templates).format(kw=kw, routine=self.rng.choice(ROUTINE_KEYWORDS))
+        words.insert(self.rng.randrange(len(words)), phrase)
+        return ' '.join(words)
+
+    def _kind(self, burst: bool) -> str:
+        p = self.profile
+        mention_rate = p.burst_mention_rate if burst else p.mention_rate
+        critical_rate = p.burst_critical_rate if burst else p.critical_rate
+        if self.rng.random() >= mention_rate:
+            return 'noise'
+        return 'critical' if self.rng.random() < critical_rate else 'routine'
+
+    def events(self):
+        p = self.profile
+        offset = 0.0
+        while True:
+            burst = self.in_burst(offset)
+            rate = p.rate * (p.burst_multiplier if burst else 1.0)
+            offset += self.rng.expovariate(rate)
+            if offset >= p.duration:
+                return
+            burst = self.in_burst(offset)
+            kind = self._kind(burst)
+
+            if self.recent and self.rng.random() < p.edit_rate:
+                original = self.rng.choice(self.recent)
+                yield offset, original.edited(self._text(kind), kind), True
+                continue
+
+            channel = self.rng.choices(self.channels, weights=self.weights)[0]
+            message = FakeMessage(channel, self.next_id[channel.id], self._text(kind), kind)
+            self.next_id[channel.id] += 1
+            self.recent.append(message)
+            if len(self.recent) > 1000:
+                del self.recent[:500]
+            yield offset, message, False
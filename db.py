@@ -0,0 +1,81 @@
+"""
+Shared async ClickHouse access for the scraper and the index runner.
+One pooled client per process; every query, command and insert goes through a
+semaphore so a slow server backs up here instead of on the event loop.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+import clickhouse_connect
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+CLICKHOUSE_HOST = os.getenv('CLICKHOUSE_HOST', 'localhost')
+CLICKHOUSE_PORT = int(os.getenv('CLICKHOUSE_PORT', 8443))
+CLICKHOUSE_USER = os.getenv('CLICKHOUSE_USER', 'default')
+CLICKHOUSE_PASSWORD = os.getenv('CLICKHOUSE_PASSWORD', '')
+CLICKHOUSE_DATABASE = os.getenv('CLICKHOUSE_DATABASE', 'telegram')
+CLICKHOUSE_MAX_CONCURRENCY = int(os.getenv('CLICKHOUSE_MAX_CONCURRENCY', 8))
+
+
+class Database:
+    """Async ClickHouse client with bounded concurrency."""
+
+    def __init__(self, database: str = CLICKHOUSE_DATABASE, max_concurrency: int = CLICKHOUSE_MAX_CONCURRENCY):
+        self.database = database
+        self.max_concurrency = max_concurrency
+        self.client = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.stats = {"queries": 0, "inserts": 0, "errors": 0, "in_flight": 0, "total_ms": 0.0}
+
+    async def connect(self):
+        self.client = await clickhouse_connect.get_async_client(
+            host=CLICKHOUSE_HOST,
+            port=CLICKHOUSE_PORT,
+            username=CLICKHOUSE_USER,
+            password=CLICKHOUSE_PASSWORD,
+            secure=True,
+            # Requests run concurrently; a shared session id would reject them
+            autogenerate_session_id=False,
+        )
+        logger.info(f"Connected to ClickHouse at {CLICKHOUSE_HOST}:{CLICKHOUSE_PORT}")
+
+    async def _run(self, kind: str, fn, *args, **kwargs):
+        async with self._semaphore:
+            self.stats["in_flight"] += 1
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+            finally:
+                self.stats["in_flight"] -= 1
+                self.stats[kind] += 1
+                self.stats["total_ms"] += (time.perf_counter() - started) * 1000
+
+    async def query(self, sql: str):
+        return await self._run("queries", self.client.query, sql)
+
+    async def command(self, sql: str):
+        return await self._run("queries", self.client.command, sql)
+
+    async def insert(self, table: str, rows: list, column_names: list):
+        return await self._run("inserts", self.client.insert, table, rows, column_names=column_names)
+
+    def report(self) -> dict:
+        calls = self.stats["queries"] + self.stats["inserts"]
+        return {
+            **{k: v for k, v in self.stats.items() if k != "total_ms"},
+            "avg_ms": round(self.stats["total_ms"] / calls, 2) if calls else 0,
+        }
+
+    async def close(self):
+        if self.client:
+            await self.client.close()
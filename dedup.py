@@ -0,0 +1,146 @@
+"""
+In-process dedup index for (channel_id, message_id) pairs.
+Telegram channel message ids are dense and increasing, so each channel is kept
+as a bitmap over a sliding window of ids below its high-water mark.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelBitmap:
+    """Bitmap of seen message ids in [base, base + len(bits) * 8).
+
+    Ids below `floor` are unknown (slid out of the window or never loaded);
+    ids between floor and base are known to be absent.
+    """
+
+    def __init__(self, max_ids: int):
+        self.max_bytes = max(1, max_ids // 8)
+        self.floor = 0
+        self.base = None
+        self.bits = bytearray()
+        self.high_water = 0
+        self.count = 0
+
+    def _span_end(self) -> int:
+        return self.base + len(self.bits) * 8
+
+    def load(self, message_ids: list, complete: bool):
+        """Replace the bitmap with ids loaded from the database.
+
+        complete: the ids are the channel's entire history, so anything below
+        the window is known to be absent rather than unknown.
+        """
+        self.bits = bytearray()
+        self.base = None
+        self.count = 0
+        self.floor = 0
+        if not message_ids:
+            return
+
+        top = max(message_ids)
+        low = max(min(message_ids), top - self.max_bytes * 8 + 1)
+        self.base = low - low % 8
+        self.bits = bytearray((top - self.base) // 8 + 1)
+        for message_id in message_ids:
+            if message_id >= self.base:
+                offset = message_id - self.base
+                self.bits[offset >> 3] |= 1 << (offset & 7)
+        self.count = sum(bin(b).count("1") for b in self.bits)
+        self.high_water = top
+        if not complete or low > min(message_ids):
+            self.floor = self.base
+
+    def _ensure(self, message_id: int) -> bool:
+        """Grow or slide the window so it covers message_id. False if it can't."""
+        if self.base is None:
+            self.base = message_id - message_id % 8
+            self.bits = bytearray(1)
+            return True
+
+        if message_id < self.base:
+            new_base = message_id - message_id % 8
+            extra = (self.base - new_base) // 8
+            if len(self.bits) + extra > self.max_bytes:
+                # Can't record it; ids below the window become unknown
+                self.floor = max(self.floor, self.base)
+                return False
+            self.bits[0:0] = bytes(extra)
+            self.base = new_base
+            return True
+
+        if message_id >= self._span_end():
+            needed = (message_id - self.base) // 8 + 1
+            if needed > self.max_bytes:
+                # Slide forward: forget the oldest ids, they fall back to the database check
+                drop = needed - self.max_bytes
+                self.count -= sum(bin(b).count("1") for b in self.bits[:drop])
+                del self.bits[:drop]
+                self.base += drop * 8
+                self.floor = max(self.floor, self.base)
+                needed = self.max_bytes
+            self.bits.extend(bytes(needed - len(self.bits)))
+        return True
+
+    def contains(self, message_id: int):
+        """True/False when the id is known, None when the caller must check the database."""
+        if message_id < self.floor:
+            return None
+        if self.base is None or message_id < self.base or message_id >= self._span_end():
+            return False
+        offset = message_id - self.base
+        return bool(self.bits[offset >> 3] & (1 << (offset & 7)))
+
+    def add(self, message_id: int):
+        if not self._ensure(message_id):
+            return
+        offset = message_id - self.base
+        mask = 1 << (offset & 7)
+        if not self.bits[offset >> 3] & mask:
+            self.bits[offset >> 3] |= mask
+            self.count += 1
+        self.high_water = max(self.high_water, message_id)
+
+
+class DedupIndex:
+    """O(1) existence checks for messages already stored in ClickHouse.
+
+    Memory is bounded by max_ids_per_channel bits per channel. Ids that slid out
+    of a channel's window report None so the caller can fall back to a query.
+    """
+
+    def __init__(self, max_ids_per_channel: int = 1 << 20):
+        self.max_ids_per_channel = max_ids_per_channel
+        self.channels = {}
+
+    def _channel(self, channel_id: int) -> ChannelBitmap:
+        bitmap = self.channels.get(channel_id)
+        if bitmap is None:
+            bitmap = self.channels[channel_id] = ChannelBitmap(self.max_ids_per_channel)
+        return bitmap
+
+    def load(self, channel_id: int, message_ids: list, complete: bool = True):
+        """Bulk-load ids already in the database for one channel."""
+        self._channel(channel_id).load(message_ids, complete)
+
+    def contains(self, channel_id: int, message_id: int):
+        bitmap = self.channels.get(channel_id)
+        if bitmap is None:
+            return None
+        return bitmap.contains(message_id)
+
+    def add(self, channel_id: int, message_id: int):
+        self._channel(channel_id).add(message_id)
+
+    def memory_bytes(self) -> int:
+        return sum(len(b.bits) for b in self.channels.values())
+
+    def report(self) -> dict:
+        return {
+            "channels": len(self.channels),
+            "known_messages": sum(b.count for b in self.channels.values()),
+            "memory_bytes": self.memory_bytes(),
+            "max_memory_bytes": len(self.channels) * (self.max_ids_per_channel // 8),
+        }
@@ -0,0 +1,67 @@
+"""
+Bounded LRU + TTL cache of Telegram chat/sender metadata.
+Keeps the per-message path from calling get_chat()/get_sender() for peers we
+already know about.
+"""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class EntityInfo:
+    id: int
+    username: Optional[str]
+    title: Optional[str]
+
+    @classmethod
+    def from_entity(cls, entity) -> "EntityInfo":
+        return cls(
+            id=entity.id,
+            username=getattr(entity, 'username', None),
+            title=getattr(entity, 'title', None),
+        )
+
+
+class EntityCache:
+    """Maps marked peer ids (message.chat_id / message.sender_id) to EntityInfo."""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 6 * 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, peer_id: int) -> Optional[EntityInfo]:
+        entry = self._entries.get(peer_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        info, expires = entry
+        if expires < time.monotonic():
+            del self._entries[peer_id]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(peer_id)
+        self.hits += 1
+        return info
+
+    def put(self, peer_id: int, info: EntityInfo, ttl: Optional[float] = None):
+        self._entries[peer_id] = (info, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._entries.move_to_end(peer_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def report(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+        }
@@ -0,0 +1,76 @@
+"""
+Shared outbound HTTP.
+One long-lived httpx client per process (keep-alive, bounded pools, HTTP/2 when
+the h2 package is installed) plus per-request connect/transfer timings taken
+from httpcore's trace hooks.
+"""
+
+import importlib.util
+import logging
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+
+def create_http_client(timeout: float = 10.0, max_connections: int = 10,
+                       max_keepalive_connections: int = 5, keepalive_expiry: float = 120.0) -> httpx.AsyncClient:
+    """Client meant to live as long as the runner; close it with `await client.aclose()`."""
+    client = httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        headers=DEFAULT_HEADERS,
+    )
+    logger.info(f"HTTP client ready (http2={'on' if HTTP2_AVAILABLE else 'off, h2 not installed'})")
+    return client
+
+
+class RequestTimer:
+    """httpcore `trace` callback recording when each phase of one request started and finished."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.events = {}
+
+    async def __call__(self, name: str, info: dict):
+        # "connection.connect_tcp.started", "http11.receive_response_body.complete", ... -
+        # drop the protocol prefix so HTTP/1.1 and HTTP/2 line up
+        self.events[name.split('.', 1)[1]] = time.perf_counter()
+
+    def _span_ms(self, start: str, end: str) -> float:
+        if start not in self.events or end not in self.events:
+            return 0.0
+        return round((self.events[end] - self.events[start]) * 1000, 1)
+
+    def timings(self) -> dict:
+        connect_end = 'start_tls.complete' if 'start_tls.complete' in self.events else 'connect_tcp.complete'
+        return {
+            "reused_connection": 'connect_tcp.started' not in self.events,
+            "connect_ms": self._span_ms('connect_tcp.started', connect_end),
+            "wait_ms": self._span_ms('send_request_headers.started', 'receive_response_headers.complete'),
+            "transfer_ms": self._span_ms('receive_response_body.started', 'receive_response_body.complete'),
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+        }
+
+
+async def timed_request(client: httpx.AsyncClient, method: str, url: str, **kwargs):
+    """Send a request and return (response, timings dict)."""
+    timer = RequestTimer()
+    extensions = {**kwargs.pop('extensions', {}), "trace": timer}
+    response = await client.request(method, url, extensions=extensions, **kwargs)
+    timings = timer.timings()
+    timings["http_version"] = response.http_version
+    return response, timings
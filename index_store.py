@@ -0,0 +1,121 @@
+"""
+Persistence for index ticks and signal outputs.
+Every tick is queued on background BatchWriters, so the poll loop never waits
+on ClickHouse; dashboards and longer-horizon lookbacks read the tables.
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+
+from db import Database
+from writer import BatchWriter
+
+logger = logging.getLogger(__name__)
+
+INDEX_COLUMNS = [
+    "timestamp", "score", "raw_score", "time_multiplier", "confidence", "level",
+    "days_remaining", "market_deadline", "signals",
+]
+SIGNAL_COLUMNS = ["tick", "name", "value", "confidence", "fetched_at", "raw"]
+
+
+def _json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class IndexStore:
+    """Writes `index_ticks` and `signal_outputs` through batched async inserts."""
+
+    def __init__(self, db: Database, max_latency: float = 5.0):
+        self.db = db
+        self.database = db.database
+        # Ticks arrive once a minute; batching is about riding out ClickHouse hiccups
+        self.index_writer = BatchWriter(self._insert_ticks, name="index_ticks", max_rows=500, max_latency=max_latency)
+        self.signal_writer = BatchWriter(self._insert_signals, name="signal_outputs", max_rows=2000, max_latency=max_latency)
+
+    async def setup(self):
+        await self.db.command(f"""
+        CREATE TABLE IF NOT EXISTS {self.database}.index_ticks (
+            timestamp DateTime64(3),
+            score Float32,
+            raw_score Float32,
+            time_multiplier Float32,
+            confidence Float32,
+            level LowCardinality(String),
+            days_remaining UInt16,
+            market_deadline Date,
+            signals String
+        ) ENGINE = MergeTree()
+        PARTITION BY toYYYYMM(timestamp)
+        ORDER BY timestamp
+        """)
+        await self.db.command(f"""
+        CREATE TABLE IF NOT EXISTS {self.database}.signal_outputs (
+            tick DateTime64(3),
+            name LowCardinality(String),
+            value Float32,
+            confidence Float32,
+            fetched_at DateTime64(3),
+            raw String
+        ) ENGINE = MergeTree()
+        PARTITION BY toYYYYMM(tick)
+        ORDER BY (name, tick)
+        """)
+        logger.info(f"Index tables ready in {self.database}")
+
+    def record(self, index, signals: list):
+        """Queue one tick: the index and the signal outputs it was built from. Never blocks."""
+        pressure = index.signals.get("_time_pressure", {})
+        self.index_writer.add({
+            "timestamp": index.timestamp,
+            "score": index.score,
+            "raw_score": pressure.get("raw_score", 0),
+            "time_multiplier": pressure.get("multiplier", 1.0),
+            "confidence": index.confidence,
+            "level": index.level,
+            "days_remaining": index.days_remaining,
+            "market_deadline": datetime.strptime(index.market_deadline, "%Y-%m-%d").date(),
+            "signals": _json(index.signals),
+        })
+        for s in signals:
+            self.signal_writer.add({
+                "tick": index.timestamp,
+                "name": s.name,
+                "value": s.value,
+                "confidence": s.confidence,
+                "fetched_at": s.timestamp,
+                "raw": _json(s.raw_value),
+            })
+
+    async def _insert_ticks(self, rows: list):
+        await self.db.insert(
+            f"{self.database}.index_ticks",
+            [[row[c] for c in INDEX_COLUMNS] for row in rows],
+            column_names=INDEX_COLUMNS,
+        )
+
+    async def _insert_signals(self, rows: list):
+        await self.db.insert(
+            f"{self.database}.signal_outputs",
+            [[row[c] for c in SIGNAL_COLUMNS] for row in rows],
+            column_names=SIGNAL_COLUMNS,
+        )
+
+    async def score_change(self, minutes: int, now: datetime = None):
+        """Score change over an arbitrary horizon from stored ticks; None with fewer than two."""
+        since = (now or datetime.utcnow()) - timedelta(minutes=minutes)
+        result = await self.db.query(f"""
+        SELECT count(), argMax(score, timestamp) - argMin(score, timestamp)
+        FROM {self.database}.index_ticks
+        WHERE timestamp >= toDateTime64('{since.strftime('%Y-%m-%d %H:%M:%S')}', 3)
+        """)
+        count, change = result.result_rows[0]
+        return change if count >= 2 else None
+
+    def report(self) -> dict:
+        return {"index_ticks": self.index_writer.report(), "signal_outputs": self.signal_writer.report()}
+
+    async def close(self):
+        await self.index_writer.close()
+        await self.signal_writer.close()
@@ -7,11 +7,10 @@ Runs all signals and aggregates into a single index.
 import asyncio
 import os
 import json
+import time
 from datetime import datetime
 from dotenv import load_dotenv
-import clickhouse_connect
 import logging
-import httpx
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,20 +20,31 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-CLICKHOUSE_HOST = os.getenv('CLICKHOUSE_HOST', 'localhost')
-CLICKHOUSE_PORT = int(os.getenv('CLICKHOUSE_PORT', 8443))
-CLICKHOUSE_USER = os.getenv('CLICKHOUSE_USER', 'default')
-CLICKHOUSE_PASSWORD = os.getenv('CLICKHOUSE_PASSWORD', '')
-CLICKHOUSE_DATABASE = os.getenv('CLICKHOUSE_DATABASE', 'telegram')
 ALERT_WEBHOOK_URL = os.getenv('ALERT_WEBHOOK_URL', '')
+# Signals now update every few seconds; don't re-send a standing RED more often than this
+ALERT_REPEAT_SECONDS = int(os.getenv('ALERT_REPEAT_SECONDS', 60))
+# Local /metrics endpoint; 0 disables it
+METRICS_PORT = int(os.getenv('INDEX_METRICS_PORT', 9102))
 
+from http_client import create_http_client, timed_request
 from signals.telegram_signal import TelegramSignal
 from signals.rial_signal import RialSignal
 from signals.silence_signal import SilenceSignal
 from aggregator import KhameneiAggregator
+from index_store import IndexStore
+from storage import ClickHouseStorage, create_storage
+from signal_runner import SignalRunner
+from scheduler import SignalScheduler
+from notify import MentionSubscriber, NOTIFY_SOCKET
+from metrics import MetricsServer, counter, histogram
+from profiling import Profiler
 
+ALERTS = counter('alerts_total', 'Alert webhook posts', labels=('level', 'result'))
+ALERT_SECONDS = histogram('alert_send_seconds', 'Alert webhook post latency').labels()
+PUSHED = counter('index_pushed_messages_total', 'Critical messages pushed by the scraper').labels()
 
-async def send_alert(index, webhook_url: str):
+
+async def send_alert(index, webhook_url: str, client):
     if not webhook_url:
         return
     
@@ -61,28 +71,43 @@ async def send_alert(index, webhook_url: str):
         ]
     }
     
+    started = time.perf_counter()
     try:
-        async with httpx.AsyncClient() as client:
-            await client.post(webhook_url, json=payload)
-            logger.info(f"Alert sent: {index.level}")
+        r, timings = await timed_request(client, "POST", webhook_url, json=payload)
+        r.raise_for_status()
+        ALERTS.labels(index.level, "sent").inc()
+        logger.info(f"Alert sent: {index.level} (connect {timings['connect_ms']}ms, total {timings['total_ms']}ms)")
     except Exception as e:
+        ALERTS.labels(index.level, "failed").inc()
         logger.error(f"Failed to send alert: {e}")
+    finally:
+        ALERT_SECONDS.observe(time.perf_counter() - started)
 
 
 async def run_index():
-    ch_client = clickhouse_connect.get_client(
-        host=CLICKHOUSE_HOST,
-        port=CLICKHOUSE_PORT,
-        username=CLICKHOUSE_USER,
-        password=CLICKHOUSE_PASSWORD,
-        secure=True,
-    )
-    logger.info(f"Connected to ClickHouse at {CLICKHOUSE_HOST}")
+    storage = create_storage()
+    await storage.connect()
+    # One keep-alive pool for Bonbast polls and webhook posts
+    http = create_http_client()
+    if isinstance(storage, ClickHouseStorage):
+        index_store = IndexStore(storage.db)
+        await index_store.setup()
+    else:
+        # Index history tables live in ClickHouse; offline runs only print the index
+        index_store = None
     
-    telegram_signal = TelegramSignal(ch_client, CLICKHOUSE_DATABASE)
-    rial_signal = RialSignal()
-    silence_signal = SilenceSignal(ch_client, CLICKHOUSE_DATABASE)
+    telegram_signal = TelegramSignal(storage)
+    rial_signal = RialSignal(client=http)
+    silence_signal = SilenceSignal(storage)
     aggregator = KhameneiAggregator(market_deadline="2026-03-31")
+    runner = SignalRunner(
+        [telegram_signal, rial_signal, silence_signal],
+        timeouts={
+            telegram_signal.name: 30,
+            rial_signal.name: 15,
+            silence_signal.name: 15,
+        },
+    )
     
     last_alerted_level = "GREEN"
     
@@ -94,31 +119,84 @@ async def run_index():
     logger.info("Starting Khamenei Index monitoring...")
     logger.info("=" * 60)
     
-    poll_interval = 60
+    scheduler = SignalScheduler(runner)
+    await scheduler.start()
+    last_alert_sent = 0.0
+    # Webhook posts in flight; kept so they aren't garbage collected mid-send
+    alert_tasks = set()
     
-    while True:
-        try:
-            telegram_result = telegram_signal.fetch()
-            rial_result = await rial_signal.fetch()
-            silence_result = silence_signal.fetch()
-            
-            signals = [telegram_result, rial_result, silence_result]
-            index = aggregator.aggregate(signals)
-            
-            print(f"\n{index}")
-            print(f"  Telegram: {telegram_result.value:.1f} (critical: {telegram_result.raw_value.get('critical_count', 0)}, routine: {telegram_result.raw_value.get('routine_count', 0)})")
-            print(f"  Rial:     {rial_result.value:.1f} (1h change: {rial_result.raw_value.get('change_1h_pct', 0):.2f}%)")
-            print(f"  Silence:  {silence_result.value:.1f} (max gap: {silence_result.raw_value.get('max_silence_hours', 0):.1f}h)")
-            
-            if aggregator.should_alert(index, last_alerted_level):
-                logger.warning(f"ALERT TRIGGERED: {last_alerted_level} → {index.level}")
-                await send_alert(index, ALERT_WEBHOOK_URL)
-                last_alerted_level = index.level
-            
-        except Exception as e:
-            logger.error(f"Error in main loop: {e}", exc_info=True)
-        
-        await asyncio.sleep(poll_interval)
+    def on_critical_message(payload):
+        # Pushed by the scraper as soon as a critical message lands; the next poll dedups it by key
+        output = telegram_signal.push(
+            payload["date"],
+            (payload["channel_id"], payload["message_id"]),
+            payload["channel"],
+            payload["text"],
+            # Scored on the full text; the payload's text is cut at MAX_TEXT_CHARS
+            score=payload.get("score"),
+            version=payload.get("version"),
+        )
+        scheduler.inject(telegram_signal, output)
+        PUSHED.inc()
+        logger.info(f"Pushed critical message from {payload['channel']} ({(time.time() - payload['published_at']) * 1000:.1f}ms after publish)")
+    
+    subscriber = MentionSubscriber(on_critical_message)
+    if NOTIFY_SOCKET:
+        subscriber.start()
+    metrics = MetricsServer(METRICS_PORT)
+    # SIGUSR1 / SIGUSR2, or /debug/profile and /debug/tasks on the metrics port
+    profiler = Profiler("index")
+    profiler.install(metrics)
+    await metrics.start()
+    
+    try:
+        # Re-aggregate whenever any signal updates, with the others' latest (decayed) outputs
+        async for signals, updated in scheduler.updates():
+            try:
+                by_name = {s.name: s for s in signals}
+                telegram_result = by_name[telegram_signal.name]
+                rial_result = by_name[rial_signal.name]
+                silence_result = by_name[silence_signal.name]
+                index = aggregator.aggregate(signals)
+                if index_store:
+                    index_store.record(index, signals)
+                
+                print(f"\n{index}")
+                print(f"  Telegram: {telegram_result.value:.1f} (critical: {telegram_result.raw_value.get('critical_count', 0)}, routine: {telegram_result.raw_value.get('routine_count', 0)})")
+                print(f"  Rial:     {rial_result.value:.1f} (1h change: {rial_result.raw_value.get('change_1h_pct', 0):.2f}%)")
+                http_timings = rial_result.raw_value.get('http') or {}
+                if rial_signal.name in updated and http_timings:
+                    print(f"  Bonbast:  {rial_result.raw_value.get('source')} (connect {http_timings['connect_ms']}ms, wait {http_timings['wait_ms']}ms, transfer {http_timings['transfer_ms']}ms)")
+                print(f"  Silence:  {silence_result.value:.1f} (max gap: {silence_result.raw_value.get('max_silence_hours', 0):.1f}h)")
+                print(f"  Updated:  {', '.join(f'{name} {runner.latencies.get(name)}ms' for name in sorted(updated))}")
+                if index.timings:
+                    print(f"  Timings:  {json.dumps(index.timings)}")
+                
+                if aggregator.should_alert(index, last_alerted_level):
+                    # Level changes go out immediately; repeats (standing RED, score jumps) at most once per ALERT_REPEAT_SECONDS
+                    if index.level != last_alerted_level or time.monotonic() - last_alert_sent >= ALERT_REPEAT_SECONDS:
+                        logger.warning(f"ALERT TRIGGERED: {last_alerted_level} → {index.level}")
+                        # In the background: a slow webhook mustn't hold up the next re-aggregation
+                        task = asyncio.get_running_loop().create_task(send_alert(index, ALERT_WEBHOOK_URL, http))
+                        alert_tasks.add(task)
+                        task.add_done_callback(alert_tasks.discard)
+                        last_alert_sent = time.monotonic()
+                    last_alerted_level = index.level
+                
+            except Exception as e:
+                logger.error(f"Error in main loop: {e}", exc_info=True)
+    finally:
+        if alert_tasks:
+            await asyncio.gather(*alert_tasks, return_exceptions=True)
+        subscriber.close()
+        await profiler.close()
+        await metrics.close()
+        await scheduler.stop()
+        runner.shutdown()
+        await http.aclose()
+        if index_store:
+            await index_store.close()
+        await storage.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+"""
+In-process metrics served in the Prometheus text format.
+Counters, gauges and fixed-bucket histograms. An observation is an attribute
+update (plus a bisect for histograms), well under a microsecond, so the
+instrumentation stays on in production. Modules declare their metrics at import
+like loggers; each process serves the shared registry on its own local port.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from bisect import bisect_left
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Seconds: 50us (a dedup hit) up to 10s (a ClickHouse insert on a bad day)
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Gauge:
+    """A value that is set, or read from `fn` at scrape time."""
+    __slots__ = ("value", "fn")
+
+    def __init__(self):
+        self.value = 0.0
+        self.fn = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def get(self) -> float:
+        return self.fn() if self.fn is not None else self.value
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        # One slot per upper bound, plus +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Family:
+    """One metric name with its help text and a child per label-value tuple.
+
+    Hot paths should keep the child from labels() rather than look it up per call.
+    """
+
+    def __init__(self, name: str, kind: str, help: str, labels: tuple, buckets: tuple = None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = buckets
+        self.children = {}
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}, got {values}")
+            if self.kind == "counter":
+                child = Counter()
+            elif self.kind == "gauge":
+                child = Gauge()
+            else:
+                child = Histogram(self.buckets)
+            self.children[values] = child
+        return child
+
+    def _label_str(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(self.label_names, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self.children.items()):
+            if self.kind == "counter":
+                lines.append(f"{self.name}{self._label_str(values)} {_number(child.value)}")
+            elif self.kind == "gauge":
+                try:
+                    value = child.get()
+                except Exception as e:
+                    logger.debug(f"Gauge {self.name} failed: {e}")
+                    continue
+                lines.append(f"{self.name}{self._label_str(values)} {_number(value)}")
+            else:
+                cumulative = 0
+                for bound, count in zip(self.buckets, child.counts):
+                    cumulative += count
+                    le = f'le="{_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{self._label_str(values, le)} {cumulative}")
+                cumulative += child.counts[-1]
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{self._label_str(values, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{self._label_str(values)} {_number(child.sum)}")
+                lines.append(f"{self.name}_count{self._label_str(values)} {cumulative}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+class Registry:
+    def __init__(self):
+        self.families = {}
+
+    def _family(self, name: str, kind: str, help: str, labels: tuple, buckets: tuple = None) -> Family:
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = Family(name, kind, help, labels, buckets)
+        elif family.kind != kind or family.label_names != tuple(labels):
+            raise ValueError(f"Metric {name} already registered as a {family.kind} with labels {family.label_names}")
+        return family
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Family:
+        return self._family(name, "counter", help, labels)
+
+    def gauge(self, name: str, help: str, labels: tuple = ()) -> Family:
+        return self._family(name, "gauge", help, labels)
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Family:
+        return self._family(name, "histogram", help, labels, tuple(sorted(buckets)))
+
+    def render(self) -> str:
+        lines = []
+        for family in list(self.families.values()):
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+_STARTED = time.time()
+gauge("process_start_time_seconds", "Unix time the process started").labels().set(_STARTED)
+
+
+class MetricsServer:
+    """Serves GET /metrics over plain HTTP/1.0 on the event loop; port 0 disables it.
+
+    Other local endpoints (e.g. profiling) are added with add_route().
+    """
+
+    def __init__(self, port: int, host: str = METRICS_HOST, registry: Registry = REGISTRY):
+        self.port = port
+        self.host = host
+        self.registry = registry
+        # path -> async fn(query params) -> response text
+        self.routes = {}
+        self._server = None
+
+    def add_route(self, path: str, handler):
+        self.routes[path] = handler
+
+    async def start(self):
+        if not self.port:
+            return
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5.0)
+            # Headers are ignored, but read them so the client doesn't see a reset
+            while await asyncio.wait_for(reader.readline(), 5.0) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.split()
+            url = urlsplit(parts[1].decode()) if len(parts) >= 2 and parts[0] == b"GET" else None
+            if url is None:
+                status, body = "405 Method Not Allowed", b"GET only\n"
+            elif url.path == "/metrics":
+                status, body = "200 OK", self.registry.render().encode()
+            elif url.path in self.routes:
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                try:
+                    status, body = "200 OK", (await self.routes[url.path](params)).encode()
+                except (ValueError, RuntimeError) as e:
+                    status, body = "400 Bad Request", f"{e}\n".encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.0 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
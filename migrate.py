@@ -0,0 +1,140 @@
+"""
+Move `messages` to the ReplacingMergeTree schema (ZSTD text columns,
+LowCardinality channel columns, latest edit wins).
+Copies the old table into a new one a partition at a time on the server,
+checks the counts, swaps the tables and rebuilds the materialized views. Stop
+the scraper while it runs; on restart it backfills whatever was posted in
+between. Safe to re-run: a partition is dropped from the new table before it
+is copied again.
+
+    python migrate.py [--optimize] [--drop-old]
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+from db import Database, CLICKHOUSE_DATABASE
+from storage import ClickHouseStorage, messages_table_sql
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+NEW_TABLE = 'messages_v2'
+OLD_TABLE = 'messages_old'
+# Rebuilt from `messages` by setup_database() after the swap
+VIEWS = ['channel_last_post_mv', 'khamenei_mentions_mv']
+DERIVED_TABLES = ['khamenei_mentions']
+
+
+async def table_size(db: Database, table: str) -> dict:
+    result = await db.query(f"""
+    SELECT sum(rows), sum(data_compressed_bytes), sum(data_uncompressed_bytes)
+    FROM system.parts
+    WHERE database = '{CLICKHOUSE_DATABASE}' AND table = '{table}' AND active
+    """)
+    rows, compressed, uncompressed = result.result_rows[0]
+    return {"rows": rows or 0, "compressed_mb": round((compressed or 0) / 2**20, 1),
+            "uncompressed_mb": round((uncompressed or 0) / 2**20, 1)}
+
+
+async def copy_partitions(db: Database, columns: list):
+    result = await db.query(f"""
+    SELECT DISTINCT partition FROM system.parts
+    WHERE database = '{CLICKHOUSE_DATABASE}' AND table = 'messages' AND active
+    ORDER BY partition
+    """)
+    partitions = [row[0] for row in result.result_rows]
+    column_list = ", ".join(columns)
+    for partition in partitions:
+        started = time.perf_counter()
+        await db.command(f"ALTER TABLE {CLICKHOUSE_DATABASE}.{NEW_TABLE} DROP PARTITION {partition}")
+        await db.command(f"""
+        INSERT INTO {CLICKHOUSE_DATABASE}.{NEW_TABLE} ({column_list})
+        SELECT {column_list} FROM {CLICKHOUSE_DATABASE}.messages
+        WHERE toYYYYMM(message_date) = {partition}
+        """)
+        logger.info(f"Copied partition {partition} in {time.perf_counter() - started:.1f}s")
+    return partitions
+
+
+async def migrate(optimize: bool = False, drop_old: bool = False):
+    manager = ClickHouseStorage()
+    await manager.connect()
+    db = manager.db
+    try:
+        engine = await manager._table_engine('messages')
+        if engine is None:
+            logger.info("No messages table yet; the scraper creates it with the new schema")
+            return
+        if engine.startswith('Replacing'):
+            logger.info(f"messages already uses {engine}, nothing to migrate")
+            return
+
+        before = await table_size(db, 'messages')
+        logger.info(f"Old table: {before}")
+
+        await db.command(messages_table_sql(f"{CLICKHOUSE_DATABASE}.{NEW_TABLE}"))
+        result = await db.query(f"""
+        SELECT name FROM system.columns
+        WHERE database = '{CLICKHOUSE_DATABASE}' AND table = 'messages'
+        ORDER BY position
+        """)
+        columns = [row[0] for row in result.result_rows]
+
+        partitions = await copy_partitions(db, columns)
+
+        old_count = (await db.query(f"SELECT count() FROM {CLICKHOUSE_DATABASE}.messages")).result_rows[0][0]
+        new_count = (await db.query(f"SELECT count() FROM {CLICKHOUSE_DATABASE}.{NEW_TABLE}")).result_rows[0][0]
+        if old_count != new_count:
+            raise RuntimeError(
+                f"Row count mismatch after copy ({old_count} old, {new_count} new); "
+                f"was the scraper still running? Leaving {NEW_TABLE} in place, re-run to retry"
+            )
+
+        for view in VIEWS:
+            await db.command(f"DROP VIEW IF EXISTS {CLICKHOUSE_DATABASE}.{view}")
+        for table in DERIVED_TABLES:
+            await db.command(f"DROP TABLE IF EXISTS {CLICKHOUSE_DATABASE}.{table}")
+
+        await db.command(f"EXCHANGE TABLES {CLICKHOUSE_DATABASE}.messages AND {CLICKHOUSE_DATABASE}.{NEW_TABLE}")
+        await db.command(f"RENAME TABLE {CLICKHOUSE_DATABASE}.{NEW_TABLE} TO {CLICKHOUSE_DATABASE}.{OLD_TABLE}")
+        logger.info(f"Swapped in the new schema; old data kept as {OLD_TABLE}")
+
+        # Recreates the views; khamenei_mentions is backfilled if the keyword view is enabled
+        await manager.setup_database()
+
+        if optimize:
+            # Collapse edit duplicates now instead of waiting for background merges
+            for partition in partitions:
+                started = time.perf_counter()
+                await db.command(f"OPTIMIZE TABLE {CLICKHOUSE_DATABASE}.messages PARTITION {partition} FINAL")
+                logger.info(f"Merged partition {partition} in {time.perf_counter() - started:.1f}s")
+
+        after = await table_size(db, 'messages')
+        logger.info(f"New table: {after}")
+        if before["compressed_mb"]:
+            logger.info(f"Compressed size {before['compressed_mb']}MB -> {after['compressed_mb']}MB "
+                        f"({after['compressed_mb'] / before['compressed_mb']:.0%})")
+
+        if drop_old:
+            await db.command(f"DROP TABLE {CLICKHOUSE_DATABASE}.{OLD_TABLE}")
+            logger.info(f"Dropped {OLD_TABLE}")
+    finally:
+        await manager.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--optimize', action='store_true', help='merge each partition afterwards to drop edit duplicates now')
+    parser.add_argument('--drop-old', action='store_true', help=f'drop {OLD_TABLE} once the swap succeeded')
+    args = parser.parse_args()
+    asyncio.run(migrate(optimize=args.optimize, drop_old=args.drop_old))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Local push channel from the scraper to the index runner.
+The scraper publishes critical messages as JSON datagrams on a Unix socket the
+runner listens on. Datagrams are fire-and-forget: if the runner isn't up the
+message is dropped here and still reaches the index through the normal poll.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_SOCKET = os.getenv('INDEX_NOTIFY_SOCKET', '/tmp/khamenei_index.sock')
+# Keeps a datagram well under the default Unix socket buffer
+MAX_TEXT_CHARS = 1000
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        # Telethon dates are aware; the index works in naive UTC like ClickHouse returns
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class MentionPublisher:
+    """Scraper side. publish() never blocks and never raises."""
+
+    def __init__(self, path: str = NOTIFY_SOCKET):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.stats = {"published": 0, "dropped": 0}
+
+    def publish(self, channel_id: int, message_id: int, channel: str, text: str, date: datetime, score: int,
+                edit_date: datetime = None):
+        """`score` is for the full text; only the first MAX_TEXT_CHARS of it are sent."""
+        payload = {
+            "channel_id": channel_id,
+            "message_id": message_id,
+            "channel": channel,
+            "text": text[:MAX_TEXT_CHARS],
+            "date": _naive_utc(date).isoformat(),
+            # Stored version of this message, so the runner can tell an edit from a repeat
+            "version": _naive_utc(edit_date or date).isoformat(),
+            "score": score,
+            "published_at": time.time(),
+        }
+        try:
+            self.sock.sendto(json.dumps(payload, ensure_ascii=False).encode(), self.path)
+            self.stats["published"] += 1
+        except OSError as e:
+            # No listener (FileNotFoundError / ConnectionRefusedError) or its buffer is full
+            self.stats["dropped"] += 1
+            logger.debug(f"Dropped notification for {channel_id}/{message_id}: {e}")
+
+    def close(self):
+        self.sock.close()
+
+
+class MentionSubscriber:
+    """Runner side. Binds the socket and hands each notification to `handler` on the event loop."""
+
+    def __init__(self, handler, path: str = NOTIFY_SOCKET):
+        self.handler = handler
+        self.path = path
+        self.sock = None
+        self.stats = {"received": 0, "invalid": 0}
+
+    def start(self):
+        if os.path.exists(self.path):
+            # Left over from a previous run
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        asyncio.get_running_loop().add_reader(self.sock.fileno(), self._on_readable)
+        logger.info(f"Listening for scraper notifications on {self.path}")
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                return
+            try:
+                payload = json.loads(data)
+                payload["date"] = datetime.fromisoformat(payload["date"])
+                payload["version"] = datetime.fromisoformat(payload["version"]) if payload.get("version") else None
+            except (ValueError, KeyError) as e:
+                self.stats["invalid"] += 1
+                logger.warning(f"Ignoring malformed notification: {e}")
+                continue
+            self.stats["received"] += 1
+            try:
+                self.handler(payload)
+            except Exception as e:
+                logger.error(f"Notification handler failed: {e}", exc_info=True)
+
+    def close(self):
+        if self.sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.sock = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
@@ -0,0 +1,279 @@
+"""
+On-demand profiling for the long-running processes.
+A Profiler watches event-loop lag all the time and, when asked, runs a cProfile
+or stack-sampling session for N seconds or dumps every asyncio task's stack.
+Sessions are started with signals (SIGUSR1 profiles for PROFILE_SECONDS,
+again to stop early; SIGUSR2 dumps tasks and loop lag) or over the local
+metrics port (/debug/profile?seconds=N&mode=cprofile|sample, /debug/tasks).
+Results go to PROFILE_DIR.
+
+Timings collects a per-tick breakdown (query, parse, score, ...) that signals
+attach to their output when INDEX_DEBUG_TIMING=1.
+"""
+
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import time
+import traceback
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from metrics import histogram
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_SECONDS = float(os.getenv('PROFILE_SECONDS', 30))
+# Attach per-tick timing breakdowns to signal outputs and the index
+DEBUG_TIMING = os.getenv('INDEX_DEBUG_TIMING', '0') == '1'
+
+LOOP_LAG = histogram('event_loop_lag_seconds', 'How late the event loop ran a timer', labels=('process',))
+
+
+class Timings:
+    """Named section durations in ms for one tick; sections that repeat add up."""
+    __slots__ = ("ms",)
+
+    def __init__(self):
+        self.ms = {}
+
+    @contextmanager
+    def section(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.ms[name] = self.ms.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+    def report(self) -> dict:
+        return {name: round(ms, 3) for name, ms in self.ms.items()}
+
+
+class LoopLagMonitor:
+    """Sleeps `interval` in a loop and records how late each wakeup was."""
+
+    def __init__(self, name: str, interval: float = 0.1, window: int = 600):
+        self.interval = interval
+        self.lags = deque(maxlen=window)
+        self.metric = LOOP_LAG.labels(name)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="loop-lag-monitor")
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.lags.append(lag)
+            self.metric.observe(lag)
+
+    def report(self) -> dict:
+        """Lag over the last `window` wakeups, in ms."""
+        if not self.lags:
+            return {}
+        ordered = sorted(self.lags)
+        return {
+            "samples": len(ordered),
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2),
+        }
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+def dump_tasks(loop: asyncio.AbstractEventLoop = None, limit: int = 20) -> str:
+    """Every pending task on the loop with the stack it is suspended in."""
+    tasks = asyncio.all_tasks(loop or asyncio.get_running_loop())
+    out = io.StringIO()
+    out.write(f"{len(tasks)} tasks\n")
+    for task in sorted(tasks, key=lambda t: t.get_name()):
+        out.write(f"\n--- {task.get_name()}: {task.get_coro()!r}\n")
+        frames = task.get_stack(limit=limit)
+        summary = traceback.StackSummary.extract((frame, frame.f_lineno) for frame in frames)
+        out.writelines(summary.format())
+    return out.getvalue()
+
+
+class StackSampler:
+    """Samples the main thread's Python stack on a wall-clock interval timer.
+
+    Output is in folded (flamegraph) format. The SIGALRM handler runs on the
+    main thread (the event loop's) and sees the interrupted frame, so busy
+    stretches are caught as reliably as time idling in select().
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._previous = None
+
+    def start(self):
+        self._previous = signal.signal(signal.SIGALRM, self._sample)
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        if stack:
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self._previous)
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, top: int = 30) -> str:
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        lines = [f"{self.samples} samples every {self.interval * 1000:g}ms", "", "self %   function"]
+        lines += [f"{count / self.samples:6.1%}   {name}" for name, count in own.most_common(top)]
+        lines += ["", "total %  function"]
+        lines += [f"{count / self.samples:6.1%}   {name}" for name, count in total.most_common(top)]
+        return "\n".join(lines) + "\n"
+
+
+class Profiler:
+    """Profiling surface for one process: loop lag, task dumps and timed profile sessions."""
+
+    def __init__(self, name: str, directory: str = PROFILE_DIR):
+        self.name = name
+        self.directory = directory
+        self.lag = LoopLagMonitor(name)
+        self._session = None
+        self._stop_early = None
+        # Sessions started from signal handlers; kept so they aren't garbage collected mid-run
+        self._tasks = set()
+
+    def install(self, server=None):
+        """Start the lag monitor, hook SIGUSR1/SIGUSR2 and, given a MetricsServer, its /debug routes."""
+        loop = asyncio.get_running_loop()
+        self.lag.start()
+        loop.add_signal_handler(signal.SIGUSR1, self._on_profile_signal)
+        loop.add_signal_handler(signal.SIGUSR2, self._on_dump_signal)
+        if server is not None:
+            server.add_route("/debug/profile", self._profile_route)
+            server.add_route("/debug/tasks", self._tasks_route)
+
+    def _path(self, kind: str, ext: str) -> str:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S.%f")[:-3]
+        return os.path.join(self.directory, f"{self.name}-{os.getpid()}-{stamp}-{kind}.{ext}")
+
+    def _on_profile_signal(self):
+        if self._session is not None:
+            logger.info("Stopping the profile session early")
+            self._stop_early.set()
+            return
+        self._spawn(self.profile(PROFILE_SECONDS))
+
+    def _on_dump_signal(self):
+        self._spawn(self.dump())
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def profile(self, seconds: float, mode: str = "cprofile") -> str:
+        """Profile the event loop thread for `seconds`; returns the summary and writes it with the raw data."""
+        if self._session is not None:
+            raise RuntimeError("a profile session is already running")
+        if mode not in ("cprofile", "sample"):
+            raise ValueError(f"unknown profile mode {mode!r}")
+
+        self._stop_early = asyncio.Event()
+        if mode == "cprofile":
+            session = cProfile.Profile()
+            session.enable()
+        else:
+            session = StackSampler()
+            session.start()
+        self._session = session
+        logger.info(f"Profiling ({mode}) for {seconds:g}s")
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._stop_early.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if mode == "cprofile":
+                session.disable()
+            else:
+                session.stop()
+            self._session = None
+        elapsed = time.perf_counter() - started
+        return await asyncio.to_thread(self._write_profile, session, mode, elapsed)
+
+    def _write_profile(self, session, mode: str, elapsed: float) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        header = f"{self.name} pid {os.getpid()}: {mode} profile over {elapsed:.1f}s, loop lag {self.lag.report()}\n\n"
+        if mode == "cprofile":
+            raw_path = self._path("cprofile", "prof")
+            session.dump_stats(raw_path)
+            out = io.StringIO()
+            stats = pstats.Stats(session, stream=out)
+            stats.sort_stats("cumulative").print_stats(40)
+            stats.sort_stats("tottime").print_stats(20)
+            summary = header + out.getvalue()
+        else:
+            raw_path = self._path("sample", "folded")
+            with open(raw_path, "w") as f:
+                f.write(session.folded())
+            summary = header + session.summary()
+        summary_path = self._path(mode, "txt")
+        with open(summary_path, "w") as f:
+            f.write(summary)
+        logger.info(f"Wrote profile to {summary_path} and {raw_path}")
+        return f"{summary_path}\n{raw_path}\n\n{summary}"
+
+    async def dump(self) -> str:
+        """Write every task's stack plus the recent loop lag; returns the dump."""
+        text = f"{self.name} pid {os.getpid()}, loop lag {self.lag.report()}\n{dump_tasks()}"
+        path = self._path("tasks", "txt")
+        await asyncio.to_thread(self._write, path, text)
+        logger.info(f"Wrote task dump to {path}")
+        return f"{path}\n\n{text}"
+
+    def _write(self, path: str, text: str):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    async def _profile_route(self, params: dict) -> str:
+        seconds = float(params.get("seconds", PROFILE_SECONDS))
+        return await self.profile(seconds, params.get("mode", "cprofile"))
+
+    async def _tasks_route(self, params: dict) -> str:
+        return await self.dump()
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        loop.remove_signal_handler(signal.SIGUSR1)
+        loop.remove_signal_handler(signal.SIGUSR2)
+        if self._stop_early is not None:
+            self._stop_early.set()
+        await self.lag.stop()
@@ -0,0 +1,130 @@
+"""
+Per-signal scheduling.
+Each signal polls on its own cadence (interval + jitter, optionally only inside
+an active window) and the latest output of every signal is cached. Consumers
+get a fresh snapshot whenever any signal updates; outputs older than their
+cadence lose confidence as they age instead of being dropped.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+from dataclasses import replace
+from datetime import datetime
+
+from signal_runner import SignalRunner
+
+logger = logging.getLogger(__name__)
+
+
+def decay_confidence(output, age: float, fresh_for: float, half_life: float):
+    """Halve confidence every `half_life` seconds once an output is older than `fresh_for`."""
+    if age <= fresh_for:
+        return output
+    factor = 0.5 ** ((age - fresh_for) / half_life)
+    return replace(
+        output,
+        confidence=output.confidence * factor,
+        raw_value={**output.raw_value, "stale_s": round(age, 1)},
+    )
+
+
+class SignalScheduler:
+    """Runs each signal of a SignalRunner on its own cadence.
+
+    Signals declare `interval` and `jitter` (seconds) and may define
+    `is_active(now)`; `intervals` overrides the interval by signal name.
+    """
+
+    def __init__(self, runner: SignalRunner, intervals: dict = None, default_interval: float = 60.0):
+        self.runner = runner
+        self.signals = runner.signals
+        self.intervals = intervals or {}
+        self.default_interval = default_interval
+        # name -> (last usable SignalOutput, monotonic time it was fetched)
+        self.latest = {}
+        self.fetches = Counter()
+        self.errors = Counter()
+        self._updates = asyncio.Queue()
+        self._tasks = []
+
+    def interval_for(self, signal) -> float:
+        return self.intervals.get(signal.name, getattr(signal, "interval", self.default_interval))
+
+    def _delay(self, signal) -> float:
+        jitter = getattr(signal, "jitter", 0.0)
+        return max(0.1, self.interval_for(signal) + random.uniform(-jitter, jitter))
+
+    def _is_active(self, signal, now: datetime) -> bool:
+        is_active = getattr(signal, "is_active", None)
+        return is_active(now) if is_active else True
+
+    async def _fetch(self, signal):
+        now = datetime.utcnow()
+        if not self._is_active(signal, now):
+            output = self.runner._fallback(signal, {"reason": "outside_active_window"})
+        else:
+            output = await self.runner.run_one(signal)
+            self.fetches[signal.name] += 1
+
+        previous = self.latest.get(signal.name)
+        if "error" in output.raw_value and not output.confidence and previous is not None:
+            # Keep serving the last good output; it decays with age
+            self.errors[signal.name] += 1
+            logger.warning(f"Signal {signal.name} failed ({output.raw_value['error']}), keeping previous output")
+            return
+        self.latest[signal.name] = (output, time.monotonic())
+
+    def inject(self, signal, output):
+        """Replace a signal's cached output out of schedule (e.g. a pushed message) and wake consumers."""
+        self.latest[signal.name] = (output, time.monotonic())
+        self._updates.put_nowait(signal.name)
+
+    async def _loop(self, signal):
+        next_due = time.monotonic() + self._delay(signal)
+        while True:
+            await asyncio.sleep(max(0.0, next_due - time.monotonic()))
+            # Cadence is measured from start to start, so slow fetches don't stretch it
+            next_due = max(next_due + self._delay(signal), time.monotonic())
+            try:
+                await self._fetch(signal)
+            except Exception as e:
+                logger.error(f"Scheduled fetch of {signal.name} failed: {e}", exc_info=True)
+                continue
+            self._updates.put_nowait(signal.name)
+
+    async def start(self):
+        """Fetch every signal once, then hand each one to its own polling task."""
+        await asyncio.gather(*(self._fetch(s) for s in self.signals))
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._loop(s), name=f"schedule:{s.name}") for s in self.signals]
+        logger.info("Signal cadences: " + ", ".join(f"{s.name} {self.interval_for(s):g}s" for s in self.signals))
+
+    def snapshot(self) -> list:
+        """Latest output of every signal, in registration order, with staleness decay applied."""
+        now = time.monotonic()
+        outputs = []
+        for signal in self.signals:
+            if signal.name not in self.latest:
+                continue
+            output, fetched_at = self.latest[signal.name]
+            interval = self.interval_for(signal)
+            outputs.append(decay_confidence(output, now - fetched_at, fresh_for=interval * 1.5, half_life=interval))
+        return outputs
+
+    async def updates(self):
+        """Yield (snapshot, names updated) on every signal update; bursts are coalesced."""
+        yield self.snapshot(), {s.name for s in self.signals}
+        while True:
+            updated = {await self._updates.get()}
+            while not self._updates.empty():
+                updated.add(self._updates.get_nowait())
+            yield self.snapshot(), updated
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
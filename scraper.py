@@ -5,13 +5,25 @@ With duplicate detection - safe to restart without re-inserting old messages
 
 import asyncio
 import os
+import time
 from datetime import datetime
+from typing import Optional
 from dotenv import load_dotenv
-from telethon import TelegramClient, events
+from telethon import TelegramClient, events, utils
+from telethon.errors import FloodWaitError
 from telethon.tl.types import Channel, Message
-import clickhouse_connect
 import logging
 
+from dedup import DedupIndex
+from signals.telegram_signal import score_message
+from storage import Storage, create_storage
+from entity_cache import EntityCache, EntityInfo
+from writer import BatchWriter
+from spool import Spool
+from notify import MentionPublisher, NOTIFY_SOCKET
+from metrics import MetricsServer, counter, histogram
+from profiling import Profiler
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
@@ -24,111 +36,75 @@ API_ID = os.getenv('TELEGRAM_API_ID')
 API_HASH = os.getenv('TELEGRAM_API_HASH')
 PHONE_NUMBER = os.getenv('TELEGRAM_PHONE')
 
-CLICKHOUSE_HOST = os.getenv('CLICKHOUSE_HOST', 'localhost')
-CLICKHOUSE_PORT = int(os.getenv('CLICKHOUSE_PORT', 8443))
-CLICKHOUSE_USER = os.getenv('CLICKHOUSE_USER', 'default')
-CLICKHOUSE_PASSWORD = os.getenv('CLICKHOUSE_PASSWORD', '')
-CLICKHOUSE_DATABASE = os.getenv('CLICKHOUSE_DATABASE', 'telegram')
-
 CHANNELS_TO_MONITOR = os.getenv('CHANNELS_TO_MONITOR', '').split(',')
 CHANNELS_TO_MONITOR = [c.strip() for c in CHANNELS_TO_MONITOR if c.strip()]
 
+# Local /metrics endpoint; 0 disables it
+METRICS_PORT = int(os.getenv('SCRAPER_METRICS_PORT', 9101))
 
-class ClickHouseManager:
-    def __init__(self):
-        self.client = None
-    
-    def connect(self):
-        self.client = clickhouse_connect.get_client(
-            host=CLICKHOUSE_HOST,
-            port=CLICKHOUSE_PORT,
-            username=CLICKHOUSE_USER,
-            password=CLICKHOUSE_PASSWORD,
-            secure=True,
-        )
-        logger.info(f"Connected to ClickHouse at {CLICKHOUSE_HOST}:{CLICKHOUSE_PORT}")
-    
-    def setup_database(self):
-        self.client.command(f"CREATE DATABASE IF NOT EXISTS {CLICKHOUSE_DATABASE}")
-        
-        create_table_sql = f"""
-        CREATE TABLE IF NOT EXISTS {CLICKHOUSE_DATABASE}.messages (
-            message_id Int64,
-            channel_id Int64,
-            channel_username String,
-            channel_title String,
-            sender_id Nullable(Int64),
-            sender_username Nullable(String),
-            message_text String,
-            message_date DateTime64(3),
-            edit_date Nullable(DateTime64(3)),
-            views Nullable(Int32),
-            forwards Nullable(Int32),
-            replies Nullable(Int32),
-            has_media Bool,
-            media_type Nullable(String),
-            is_forwarded Bool,
-            forward_from_id Nullable(Int64),
-            reply_to_msg_id Nullable(Int64),
-            raw_json String,
-            scraped_at DateTime64(3) DEFAULT now64(3)
-        ) ENGINE = MergeTree()
-        PARTITION BY toYYYYMM(message_date)
-        ORDER BY (channel_id, message_date, message_id)
-        """
-        self.client.command(create_table_sql)
-        logger.info(f"Database and table setup complete in {CLICKHOUSE_DATABASE}")
-    
-    def message_exists(self, channel_id: int, message_id: int) -> bool:
-        """Check if message already exists in database."""
-        try:
-            result = self.client.query(
-                f"SELECT 1 FROM {CLICKHOUSE_DATABASE}.messages WHERE channel_id = {channel_id} AND message_id = {message_id} LIMIT 1"
-            )
-            return len(result.result_rows) > 0
-        except Exception as e:
-            logger.error(f"Error checking message existence: {e}")
-            return False
-    
-    def insert_message(self, message_data: dict):
-        columns = list(message_data.keys())
-        values = [list(message_data.values())]
-        
-        self.client.insert(
-            f"{CLICKHOUSE_DATABASE}.messages",
-            values,
-            column_names=columns
-        )
-    
-    def close(self):
-        if self.client:
-            self.client.close()
+MESSAGES = counter('scraper_messages_total', 'Messages handled by the scraper', labels=('result',))
+INSERTED = MESSAGES.labels('inserted')
+EDITED = MESSAGES.labels('edited')
+SKIPPED = MESSAGES.labels('skipped')
+FAILED = MESSAGES.labels('error')
+PROCESS_SECONDS = histogram('scraper_process_seconds', 'Time spent in _process_message per message').labels()
 
 
 class TelegramScraper:
-    def __init__(self, channels: list):
+    """Scrapes `channels` with one Telegram account.
+    
+    Standalone it owns the schema, the batched writer and the spool. With
+    `writer` given (a shard worker) rows go there instead, and storage is
+    only used for dedup and checkpoint reads. `storage` defaults to the
+    configured STORAGE_BACKEND.
+    """
+    
+    def __init__(self, channels: list, session: str = 'telegram_scraper_session',
+                 phone: str = PHONE_NUMBER, writer: BatchWriter = None, storage: Storage = None):
         self.channels = channels
-        self.client = TelegramClient('telegram_scraper_session', API_ID, API_HASH)
-        self.db = ClickHouseManager()
+        self.phone = phone
+        self.client = TelegramClient(session, API_ID, API_HASH)
+        self.db = storage or create_storage()
+        if writer is None:
+            # Rows ClickHouse can't take right now wait on disk, not in memory
+            self.spool = Spool()
+            self.writer = BatchWriter(self.db.insert_messages, name="messages", spool=self.spool)
+        else:
+            self.spool = None
+            self.writer = writer
+        self.dedup = DedupIndex()
+        self.entities = EntityCache()
         self.channel_entities = {}
         self.stats = {"inserted": 0, "skipped": 0}
+        # Pushes critical live messages straight to the index runner
+        self.publisher = MentionPublisher() if NOTIFY_SOCKET else None
+        self._ready = False
     
-    async def start(self):
-        self.db.connect()
-        self.db.setup_database()
+    async def setup(self):
+        """Connect to ClickHouse and Telegram and resolve channels (once)."""
+        if self._ready:
+            return
+        await self.db.connect()
+        if self.spool is not None:
+            await self.db.setup_database()
+            self.spool.start(self.db.insert_messages)
         
-        await self.client.start(phone=PHONE_NUMBER)
+        await self.client.start(phone=self.phone)
         logger.info("Connected to Telegram")
         
         await self._resolve_channels()
+        self._ready = True
+    
+    async def start(self):
+        await self.setup()
         
         @self.client.on(events.NewMessage(chats=list(self.channel_entities.values())))
         async def handle_new_message(event):
-            await self._process_message(event.message)
+            await self._process_message(event.message, live=True)
         
         @self.client.on(events.MessageEdited(chats=list(self.channel_entities.values())))
         async def handle_edited_message(event):
-            await self._process_message(event.message, is_edit=True)
+            await self._process_message(event.message, is_edit=True, live=True)
         
         logger.info(f"Listening for messages from {len(self.channel_entities)} channels...")
         logger.info(f"Channels: {list(self.channel_entities.keys())}")
@@ -141,22 +117,68 @@ class TelegramScraper:
                 entity = await self.client.get_entity(channel)
                 if isinstance(entity, Channel):
                     self.channel_entities[entity.username or str(entity.id)] = entity
+                    # Monitored channels never expire; they are both the chat and the sender of their posts
+                    self.entities.put(utils.get_peer_id(entity), EntityInfo.from_entity(entity), ttl=float('inf'))
                     logger.info(f"Resolved channel: {entity.title} (@{entity.username})")
                 else:
                     logger.warning(f"{channel} is not a channel, skipping")
             except Exception as e:
                 logger.error(f"Failed to resolve channel {channel}: {e}")
+        
+        await self._load_dedup_index()
+    
+    async def _load_dedup_index(self):
+        """One bulk query per channel instead of a SELECT per message."""
+        limit = self.dedup.max_ids_per_channel
+        for name, entity in self.channel_entities.items():
+            try:
+                ids = await self.db.known_message_ids(entity.id, limit)
+            except Exception as e:
+                logger.error(f"Failed to load known message ids for {name}: {e}")
+                continue
+            self.dedup.load(entity.id, ids, complete=len(ids) < limit)
+        logger.info(f"Dedup index: {self.dedup.report()}")
     
-    async def _process_message(self, message: Message, is_edit: bool = False):
+    async def _message_known(self, channel_id: int, message_id: int) -> bool:
+        known = self.dedup.contains(channel_id, message_id)
+        if known is None:
+            # Outside the in-memory window - ask the database
+            known = await self.db.message_exists(channel_id, message_id)
+            if known:
+                self.dedup.add(channel_id, message_id)
+        return known
+    
+    async def _chat_info(self, message: Message) -> EntityInfo:
+        info = self.entities.get(message.chat_id)
+        if info is None:
+            info = EntityInfo.from_entity(await message.get_chat())
+            self.entities.put(message.chat_id, info)
+        return info
+    
+    async def _sender_info(self, message: Message):
+        if not message.sender_id:
+            return None
+        info = self.entities.get(message.sender_id)
+        if info is None:
+            sender = await message.get_sender()
+            if sender is None:
+                return None
+            info = EntityInfo.from_entity(sender)
+            self.entities.put(message.sender_id, info)
+        return info
+    
+    async def _process_message(self, message: Message, is_edit: bool = False, live: bool = False):
+        started = time.perf_counter()
         try:
-            chat = await message.get_chat()
+            chat = await self._chat_info(message)
             
             # Skip if already exists (unless it's an edit)
-            if not is_edit and self.db.message_exists(chat.id, message.id):
+            if not is_edit and await self._message_known(chat.id, message.id):
                 self.stats["skipped"] += 1
+                SKIPPED.inc()
                 return
             
-            sender = await message.get_sender() if message.sender_id else None
+            sender = await self._sender_info(message)
             
             media_type = None
             if message.media:
@@ -168,7 +190,7 @@ class TelegramScraper:
                 'channel_username': chat.username or '',
                 'channel_title': chat.title or '',
                 'sender_id': message.sender_id,
-                'sender_username': sender.username if sender and hasattr(sender, 'username') else None,
+                'sender_username': sender.username if sender else None,
                 'message_text': message.text or '',
                 'message_date': message.date,
                 'edit_date': message.edit_date,
@@ -183,37 +205,117 @@ class TelegramScraper:
                 'raw_json': message.to_json(),
             }
             
-            self.db.insert_message(message_data)
+            self.writer.add(message_data)
+            self.dedup.add(chat.id, message.id)
             self.stats["inserted"] += 1
+            (EDITED if is_edit else INSERTED).inc()
+            
+            if live and self.publisher and message.text:
+                self._notify_if_critical(chat, message)
             
             action = "Updated" if is_edit else "New"
             logger.info(f"{action} message in {chat.title}: {message.text[:50] if message.text else '[media]'}...")
             
         except Exception as e:
+            FAILED.inc()
             logger.error(f"Error processing message: {e}", exc_info=True)
+        finally:
+            PROCESS_SECONDS.observe(time.perf_counter() - started)
     
-    async def fetch_history(self, limit_per_channel: int = 1000):
-        """Fetch historical messages from channels (skips duplicates)."""
-        for name, entity in self.channel_entities.items():
-            logger.info(f"Fetching history from {name}...")
-            channel_inserted = 0
-            channel_skipped = 0
-            
-            async for message in self.client.iter_messages(entity, limit=limit_per_channel):
-                # Check if exists before processing
-                if self.db.message_exists(entity.id, message.id):
-                    channel_skipped += 1
-                    continue
-                await self._process_message(message)
-                channel_inserted += 1
-            
-            logger.info(f"Finished {name}: {channel_inserted} new, {channel_skipped} skipped (already existed)")
+    def _notify_if_critical(self, chat: EntityInfo, message: Message):
+        """Score a live message as the index would and push critical hits to the runner."""
+        score = score_message(message.text)
+        if score >= 3:
+            self.publisher.publish(chat.id, message.id, chat.title or '', message.text, message.date, score,
+                                   edit_date=message.edit_date)
+    
+    async def fetch_history(self, limit_per_channel: int = 1000, concurrency: int = 4):
+        """Backfill channels concurrently, resuming each from its stored checkpoint (skips duplicates)."""
+        try:
+            checkpoints = await self.db.channel_checkpoints()
+        except Exception as e:
+            logger.error(f"Failed to load channel checkpoints, fetching from scratch: {e}")
+            checkpoints = {}
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def backfill(name, entity):
+            async with semaphore:
+                try:
+                    await self._backfill_channel(name, entity, checkpoints.get(entity.id), limit_per_channel)
+                except Exception as e:
+                    logger.error(f"History fetch failed for {name}: {e}", exc_info=True)
+        
+        await asyncio.gather(*(backfill(name, entity) for name, entity in self.channel_entities.items()))
         
+        await self.writer.flush()
         logger.info(f"History fetch complete. Total: {self.stats['inserted']} inserted, {self.stats['skipped']} skipped")
+        logger.info(f"Writer: {self.writer.report()}")
+        if self.spool is not None:
+            logger.info(f"Spool: {self.spool.report()}")
+        logger.info(f"Entity cache: {self.entities.report()}")
     
-    def stop(self):
-        self.db.close()
-        self.client.disconnect()
+    async def _backfill_channel(self, name: str, entity: Channel, checkpoint, limit: int):
+        """Fetch only the gap: every message newer than the checkpoint, then older ones up to `limit` stored."""
+        if checkpoint is None:
+            logger.info(f"Fetching history from {name} (no checkpoint)...")
+            inserted, skipped = await self._fetch_range(name, entity, limit)
+        else:
+            logger.info(f"Fetching history from {name} after message {checkpoint.max_id}...")
+            # Uncapped and oldest-first: anything left out here, by a cap or a crash part way
+            # through, would sit below the next run's max_id and never be fetched
+            inserted, skipped = await self._fetch_range(name, entity, None, min_id=checkpoint.max_id, reverse=True)
+            
+            remaining = limit - checkpoint.count - inserted
+            if remaining > 0:
+                older_inserted, older_skipped = await self._fetch_range(
+                    name, entity, remaining, offset_id=checkpoint.min_id
+                )
+                inserted += older_inserted
+                skipped += older_skipped
+        
+        logger.info(f"Finished {name}: {inserted} new, {skipped} skipped (already existed)")
+    
+    async def _fetch_range(self, name: str, entity: Channel, limit: Optional[int], min_id: int = 0, offset_id: int = 0,
+                           reverse: bool = False):
+        """Iterate newest-first from offset_id down to min_id, or oldest-first up from min_id with reverse,
+        at most `limit` messages (None for all), resuming after FloodWait."""
+        fetched = 0
+        inserted = 0
+        skipped = 0
+        
+        while limit is None or fetched < limit:
+            try:
+                async for message in self.client.iter_messages(
+                    entity, limit=None if limit is None else limit - fetched, min_id=min_id, offset_id=offset_id,
+                    reverse=reverse
+                ):
+                    offset_id = message.id
+                    fetched += 1
+                    if await self._message_known(entity.id, message.id):
+                        skipped += 1
+                        continue
+                    await self._process_message(message)
+                    inserted += 1
+                break
+            except FloodWaitError as e:
+                logger.warning(f"FloodWait while fetching {name}: sleeping {e.seconds}s, resuming past message {offset_id}")
+                await asyncio.sleep(e.seconds + 1)
+        
+        return inserted, skipped
+    
+    async def stop(self):
+        await self.writer.close()
+        if self.spool is not None:
+            await self.spool.close()
+            logger.info(f"Spool: {self.spool.report()}")
+        if self.publisher:
+            self.publisher.close()
+            logger.info(f"Notifications: {self.publisher.stats}")
+        logger.info(f"Writer: {self.writer.report()}")
+        logger.info(f"Entity cache: {self.entities.report()}")
+        await self.db.close()
+        await self.client.disconnect()
 
 
 async def main():
@@ -226,13 +328,15 @@ async def main():
         return
     
     scraper = TelegramScraper(CHANNELS_TO_MONITOR)
+    metrics = MetricsServer(METRICS_PORT)
+    profiler = Profiler("scraper")
     
     try:
+        profiler.install(metrics)
+        await metrics.start()
+        
         # Connect and setup
-        scraper.db.connect()
-        scraper.db.setup_database()
-        await scraper.client.start(phone=PHONE_NUMBER)
-        await scraper._resolve_channels()
+        await scraper.setup()
         
         # Fetch history (safe to run - skips duplicates)
         await scraper.fetch_history(limit_per_channel=1000)
@@ -242,7 +346,9 @@ async def main():
     except KeyboardInterrupt:
         logger.info("Shutting down...")
     finally:
-        scraper.stop()
+        await scraper.stop()
+        await profiler.close()
+        await metrics.close()
 
 
 if __name__ == '__main__':
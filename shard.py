@@ -0,0 +1,378 @@
+"""
+Sharded scraping across Telegram accounts.
+Channels are spread over one worker process per account with a consistent hash
+ring, so an account dropping out only moves its own channels. Each worker runs
+a TelegramScraper on its own session and ships row batches to the supervisor,
+which owns the single batched storage writer (and its spool). The supervisor
+restarts workers that exit; one that keeps failing is taken out of the ring and
+its channels are reassigned until it has cooled down.
+
+    SCRAPER_ACCOUNTS=main:+98912...,alt:+98935... python shard.py
+    python shard.py --login alt     # interactive first login for one account
+    python shard.py --plan          # print the channel assignment and exit
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing as mp
+import os
+import queue
+import signal
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+
+from metrics import MetricsServer
+from profiling import Profiler
+from scraper import TelegramScraper, CHANNELS_TO_MONITOR, API_ID, API_HASH, METRICS_PORT
+from spool import Spool
+from storage import create_storage
+from writer import BatchWriter
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# name:phone pairs; each account keeps its session in telegram_scraper_<name>.session
+SCRAPER_ACCOUNTS = [a.strip() for a in os.getenv('SCRAPER_ACCOUNTS', '').split(',') if a.strip()]
+
+
+@dataclass
+class Account:
+    name: str
+    phone: str
+
+    @property
+    def session(self) -> str:
+        return f"telegram_scraper_{self.name}"
+
+    @classmethod
+    def parse(cls, spec: str) -> "Account":
+        name, _, phone = spec.partition(':')
+        return cls(name=name, phone=phone or None)
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hashing with virtual nodes; removing a node only moves its keys."""
+
+    def __init__(self, nodes: list = (), replicas: int = 128):
+        self.replicas = replicas
+        self._points = []
+        self._owners = []
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        keep = [i for i, owner in enumerate(self._owners) if owner != node]
+        self._points = [self._points[i] for i in keep]
+        self._owners = [self._owners[i] for i in keep]
+
+    def node_for(self, key: str) -> str:
+        if not self._points:
+            raise LookupError("hash ring is empty")
+        index = bisect.bisect(self._points, _hash(key.lower())) % len(self._points)
+        return self._owners[index]
+
+    def assign(self, keys: list) -> dict:
+        """node -> sorted keys, for every node in the ring (possibly empty); {} for an empty ring."""
+        assignment = {node: [] for node in self.nodes}
+        if not assignment:
+            return assignment
+        for key in keys:
+            assignment[self.node_for(key)].append(key)
+        return {node: sorted(keys) for node, keys in assignment.items()}
+
+
+def _run_worker(account: Account, channels: list, rows: mp.Queue, history_limit: int):
+    """Worker process entry point: scrape `channels` with `account`, shipping batches to the supervisor."""
+    # Shutdown comes from the supervisor as SIGTERM, not from Ctrl-C on the process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker(account, channels, rows, history_limit))
+
+
+async def _worker(account: Account, channels: list, rows: mp.Queue, history_limit: int):
+    # Small, frequent batches: the supervisor re-batches for ClickHouse
+    writer = BatchWriter(rows.put, name=f"shard:{account.name}", max_rows=500, max_latency=0.2)
+    scraper = TelegramScraper(channels, session=account.session, phone=account.phone, writer=writer)
+
+    task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    # `kill -USR1 <worker pid>` profiles the worker's Telethon handlers
+    profiler = Profiler(f"shard-{account.name}")
+    profiler.install()
+    try:
+        await scraper.setup()
+        await scraper.fetch_history(limit_per_channel=history_limit)
+        await scraper.start()
+    except asyncio.CancelledError:
+        logger.info(f"Worker {account.name} stopping")
+    finally:
+        # Flushes the last batch onto the queue before the process exits
+        await scraper.stop()
+        await profiler.close()
+
+
+@dataclass
+class Worker:
+    account: Account
+    channels: list
+    process: mp.Process
+    started: float = field(default_factory=time.monotonic)
+
+
+class ShardSupervisor:
+    """Runs one worker per account and feeds their rows through one BatchWriter.
+
+    A worker that exits more than `max_restarts` times within `restart_window`
+    seconds is taken out of the ring for `cooldown` seconds.
+    """
+
+    def __init__(self, accounts: list, channels: list, history_limit: int = 1000,
+                 check_interval: float = 5.0, max_restarts: int = 5, restart_window: float = 300.0,
+                 cooldown: float = 600.0):
+        self.accounts = {a.name: a for a in accounts}
+        self.channels = channels
+        self.history_limit = history_limit
+        self.check_interval = check_interval
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.cooldown = cooldown
+
+        self.ring = HashRing(self.accounts)
+        self.ctx = mp.get_context('spawn')
+        self.rows = self.ctx.Queue(maxsize=10000)
+        self.workers = {}
+        self.exits = {name: deque() for name in self.accounts}
+        # account name -> monotonic time it was taken out of the ring
+        self.benched = {}
+
+        self.db = create_storage()
+        self.spool = Spool()
+        self.writer = BatchWriter(self.db.insert_messages, name="messages", spool=self.spool)
+        self.stats = Counter()
+        # Serves the supervisor's storage metrics; workers run without an endpoint
+        self.metrics = MetricsServer(METRICS_PORT)
+        self.profiler = Profiler("shard")
+        self._stopping = False
+        self._closed = False
+
+    def _spawn(self, name: str, channels: list):
+        account = self.accounts[name]
+        process = self.ctx.Process(
+            target=_run_worker,
+            args=(account, channels, self.rows, self.history_limit),
+            name=f"shard-{name}",
+            daemon=True,
+        )
+        process.start()
+        self.workers[name] = Worker(account=account, channels=channels, process=process)
+        logger.info(f"Started worker {name} (pid {process.pid}) for {len(channels)} channels")
+
+    async def _stop_worker(self, name: str, timeout: float = 30.0):
+        worker = self.workers.pop(name, None)
+        if worker is None:
+            return
+        if worker.process.is_alive():
+            worker.process.terminate()
+            await asyncio.to_thread(worker.process.join, timeout)
+            if worker.process.is_alive():
+                worker.process.kill()
+                await asyncio.to_thread(worker.process.join)
+
+    async def _rebalance(self):
+        """Bring the running workers in line with the ring; only workers whose channels changed restart."""
+        assignment = self.ring.assign(self.channels)
+        for name in list(self.workers):
+            if name not in assignment:
+                await self._stop_worker(name)
+        for name, channels in assignment.items():
+            worker = self.workers.get(name)
+            if worker is not None and worker.channels == channels:
+                continue
+            if worker is not None:
+                self.stats["reassignments"] += 1
+                await self._stop_worker(name)
+            if channels:
+                self._spawn(name, channels)
+        logger.info("Assignment: " + ", ".join(f"{name} {len(ch)}" for name, ch in sorted(assignment.items())))
+
+    async def _check_workers(self):
+        now = time.monotonic()
+        changed = False
+        for name, worker in list(self.workers.items()):
+            if worker.process.is_alive():
+                continue
+            exitcode = worker.process.exitcode
+            del self.workers[name]
+            exits = self.exits[name]
+            exits.append(now)
+            while exits and now - exits[0] > self.restart_window:
+                exits.popleft()
+
+            if len(exits) > self.max_restarts:
+                logger.error(f"Worker {name} exited {len(exits)} times in {self.restart_window:.0f}s, "
+                             f"reassigning its {len(worker.channels)} channels for {self.cooldown:.0f}s")
+                self.ring.remove(name)
+                self.benched[name] = now
+                changed = True
+            else:
+                logger.warning(f"Worker {name} exited with code {exitcode}, restarting")
+                self.stats["restarts"] += 1
+                self._spawn(name, worker.channels)
+
+        for name, benched_at in list(self.benched.items()):
+            if now - benched_at >= self.cooldown:
+                logger.info(f"Account {name} cooled down, adding it back")
+                del self.benched[name]
+                self.exits[name].clear()
+                self.ring.add(name)
+                changed = True
+
+        if changed:
+            if not self.ring.nodes:
+                logger.error("Every account is benched; waiting for one to cool down")
+            await self._rebalance()
+
+    async def _monitor(self):
+        while not self._stopping:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self._check_workers()
+            except Exception as e:
+                logger.error(f"Worker check failed: {e}", exc_info=True)
+
+    def _next_batch(self):
+        try:
+            return self.rows.get(timeout=0.5)
+        except queue.Empty:
+            return None
+
+    async def _pump(self):
+        """Move row batches from the workers into the shared writer."""
+        while not self._closed:
+            batch = await asyncio.to_thread(self._next_batch)
+            if batch:
+                self._add(batch)
+
+    def _add(self, batch: list):
+        for row in batch:
+            self.writer.add(row)
+        self.stats["batches_received"] += 1
+        self.stats["rows_received"] += len(batch)
+
+    async def _log_reports(self, interval: float = 60.0):
+        while not self._stopping:
+            await asyncio.sleep(interval)
+            logger.info(f"Shards: {self.report()}")
+
+    def report(self) -> dict:
+        return {
+            "workers": {name: len(w.channels) for name, w in self.workers.items()},
+            "benched": sorted(self.benched),
+            **self.stats,
+            "writer": self.writer.report(),
+            "spool": self.spool.report(),
+        }
+
+    async def run(self):
+        self.profiler.install(self.metrics)
+        await self.metrics.start()
+        await self.db.connect()
+        await self.db.setup_database()
+        self.spool.start(self.db.insert_messages)
+        await self._rebalance()
+        await asyncio.gather(self._pump(), self._monitor(), self._log_reports())
+
+    async def stop(self):
+        self._stopping = True
+        # Keep reading while workers flush: a worker can't exit until its queue feeder has written everything
+        pump = asyncio.get_running_loop().create_task(self._pump())
+        await asyncio.gather(*(self._stop_worker(name) for name in list(self.workers)))
+        self._closed = True
+        await pump
+        while (batch := self._next_batch()) is not None:
+            self._add(batch)
+        await self.writer.close()
+        await self.spool.close()
+        logger.info(f"Shards: {self.report()}")
+        await self.db.close()
+        await self.profiler.close()
+        await self.metrics.close()
+
+
+async def login(account: Account):
+    """Interactive first login; workers can't prompt for the code."""
+    scraper = TelegramScraper([], session=account.session, phone=account.phone)
+    await scraper.client.start(phone=account.phone)
+    me = await scraper.client.get_me()
+    logger.info(f"Session {account.session} logged in as {me.username or me.id}")
+    await scraper.client.disconnect()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--login', metavar='NAME', help='log one account in interactively and exit')
+    parser.add_argument('--plan', action='store_true', help='print the channel assignment and exit')
+    parser.add_argument('--history', type=int, default=1000, help='history to backfill per channel')
+    args = parser.parse_args()
+
+    if not API_ID or not API_HASH:
+        logger.error("Please set TELEGRAM_API_ID and TELEGRAM_API_HASH in .env file")
+        return
+    accounts = [Account.parse(spec) for spec in SCRAPER_ACCOUNTS]
+    if not accounts:
+        logger.error("Please set SCRAPER_ACCOUNTS (name:phone,...) in .env file")
+        return
+
+    if args.login:
+        account = next((a for a in accounts if a.name == args.login), None)
+        if account is None:
+            logger.error(f"No account named {args.login} in SCRAPER_ACCOUNTS")
+            return
+        await login(account)
+        return
+
+    if args.plan:
+        for name, channels in sorted(HashRing([a.name for a in accounts]).assign(CHANNELS_TO_MONITOR).items()):
+            print(f"{name}: {len(channels)} channels")
+            for channel in channels:
+                print(f"  {channel}")
+        return
+
+    supervisor = ShardSupervisor(accounts, CHANNELS_TO_MONITOR, history_limit=args.history)
+    try:
+        await supervisor.run()
+    except asyncio.CancelledError:
+        logger.info("Shutting down...")
+    finally:
+        await supervisor.stop()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,94 @@
+"""
+Concurrent signal execution.
+Runs every signal at the same time - async fetches natively, blocking ones on a
+thread pool - each under its own timeout, so a tick takes about as long as the
+slowest signal instead of the sum of all of them.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from metrics import counter, gauge, histogram
+from signals import SignalOutput
+
+logger = logging.getLogger(__name__)
+
+FETCH_SECONDS = histogram('signal_fetch_seconds', 'Signal fetch latency, timeouts included', labels=('signal',))
+FETCH_ERRORS = counter('signal_fetch_errors_total', 'Signal fetches that fell back', labels=('signal', 'reason'))
+SIGNAL_VALUE = gauge('signal_value', 'Last value returned by each signal', labels=('signal',))
+SIGNAL_CONFIDENCE = gauge('signal_confidence', 'Confidence of the last value of each signal', labels=('signal',))
+
+
+class SignalRunner:
+    """Fans out signal fetches and collects one SignalOutput per signal."""
+
+    def __init__(self, signals: list, timeouts: dict = None, default_timeout: float = 20.0):
+        self.signals = signals
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(signals)), thread_name_prefix="signal")
+        # name -> last fetch latency in ms (timeouts record the timeout)
+        self.latencies = {}
+        # Blocking fetches that outlived their timeout; a thread can't be cancelled
+        self._inflight = {}
+
+    def timeout_for(self, signal) -> float:
+        return self.timeouts.get(signal.name, self.default_timeout)
+
+    async def run_one(self, signal) -> SignalOutput:
+        timeout = self.timeout_for(signal)
+        started = time.perf_counter()
+
+        pending = self._inflight.get(signal.name)
+        if pending is not None and not pending.done():
+            self.latencies[signal.name] = None
+            FETCH_ERRORS.labels(signal.name, "still_running").inc()
+            return self._fallback(signal, {"error": "previous_fetch_still_running"})
+
+        try:
+            if inspect.iscoroutinefunction(signal.fetch):
+                result = await asyncio.wait_for(signal.fetch(), timeout)
+            else:
+                future = asyncio.get_running_loop().run_in_executor(self.executor, signal.fetch)
+                self._inflight[signal.name] = future
+                result = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.latencies[signal.name] = round(timeout * 1000, 1)
+            FETCH_SECONDS.labels(signal.name).observe(timeout)
+            FETCH_ERRORS.labels(signal.name, "timeout").inc()
+            logger.warning(f"Signal {signal.name} timed out after {timeout}s")
+            return self._fallback(signal, {"error": "timeout", "timeout_s": timeout})
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            self.latencies[signal.name] = round(elapsed * 1000, 1)
+            FETCH_SECONDS.labels(signal.name).observe(elapsed)
+            FETCH_ERRORS.labels(signal.name, "error").inc()
+            logger.error(f"Signal {signal.name} failed: {e}", exc_info=True)
+            return self._fallback(signal, {"error": str(e)})
+
+        elapsed = time.perf_counter() - started
+        self.latencies[signal.name] = round(elapsed * 1000, 1)
+        FETCH_SECONDS.labels(signal.name).observe(elapsed)
+        SIGNAL_VALUE.labels(signal.name).set(result.value)
+        SIGNAL_CONFIDENCE.labels(signal.name).set(result.confidence)
+        return result
+
+    async def run_all(self) -> list:
+        """Fetch all signals concurrently, in the order they were registered."""
+        return list(await asyncio.gather(*(self.run_one(s) for s in self.signals)))
+
+    def _fallback(self, signal, raw_value: dict) -> SignalOutput:
+        return SignalOutput(
+            name=signal.name,
+            value=0,
+            raw_value=raw_value,
+            confidence=0,
+            timestamp=datetime.utcnow()
+        )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
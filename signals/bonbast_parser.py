@@ -0,0 +1,140 @@
+"""
+Bonbast rate extraction.
+Tries cheap targeted lookups before building a full BeautifulSoup DOM:
+a precompiled regex over the raw page, then lxml XPath when lxml is
+installed, then the original html.parser selectors.
+"""
+
+import re
+
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import html as lxml_html
+except ImportError:
+    lxml_html = None
+
+
+def _to_int(text: str) -> int:
+    return int(text.strip().replace(',', ''))
+
+
+def _rate_regex(code: str):
+    # usd_sell" ...>612,300</ - only a plain number directly inside the tag. Starting
+    # with the literal id lets re skip ahead with a substring search.
+    return re.compile(re.escape(code) + r'_sell["\'][^<>]*>\s*([\d,]+)\s*</')
+
+
+_ID_ATTR = re.compile(r'\bid\s*=\s*["\']$')
+_RATE_REGEXES = {}
+
+
+def _parse_regex(html: str, code: str):
+    regex = _RATE_REGEXES.get(code)
+    if regex is None:
+        regex = _RATE_REGEXES[code] = _rate_regex(code)
+    for match in regex.finditer(html):
+        # Only an id attribute counts, not e.g. class="usd_sell"
+        if not _ID_ATTR.search(html, max(0, match.start() - 16), match.start()):
+            continue
+        try:
+            return _to_int(match.group(1))
+        except ValueError:
+            return None
+    return None
+
+
+def _parse_lxml(tree, code: str):
+    nodes = tree.xpath(f'//*[@id="{code}_sell"]')
+    if not nodes:
+        nodes = [
+            row.xpath('.//td')[1] for row in tree.xpath('//tr[@id]')
+            if code in row.get('id').lower() and len(row.xpath('.//td')) >= 3
+        ][:1]
+    if not nodes:
+        nodes = tree.xpath(f'//*[@data-currency="{code}"]//*[contains(concat(" ", normalize-space(@class), " "), " sell ")]')
+    if not nodes:
+        return None
+    try:
+        return _to_int(nodes[0].text_content())
+    except ValueError:
+        return None
+
+
+def _parse_soup(soup, code: str):
+    """The original selector chain. Raises ValueError on a malformed number."""
+    # Bonbast changes layout sometimes
+    # Method 1: Direct ID
+    sell = soup.select_one(f'#{code}_sell')
+    if sell:
+        return _to_int(sell.text), "soup_id"
+
+    # Method 2: Table row
+    for row in soup.select('tr'):
+        cells = row.select('td')
+        if len(cells) >= 3 and code in row.get('id', '').lower():
+            return _to_int(cells[1].text), "soup_row"
+
+    # Method 3: Data attribute
+    elem = soup.select_one(f'[data-currency="{code}"]')
+    if elem:
+        sell = elem.select_one('.sell')
+        if sell:
+            return _to_int(sell.text), "soup_data"
+
+    return None, None
+
+
+def parse_sell_rates(html: str, codes) -> dict:
+    """Return {code: (rate, strategy)} for several currencies on one page.
+
+    Each slower stage parses the page at most once, and only for the codes the
+    previous stage missed. A malformed number gives (None, "malformed").
+    """
+    results = {}
+    missing = []
+    for code in codes:
+        rate = _parse_regex(html, code)
+        if rate:
+            results[code] = (rate, "regex")
+        else:
+            missing.append(code)
+
+    if missing and lxml_html is not None:
+        try:
+            tree = lxml_html.fromstring(html)
+        except (ValueError, TypeError):
+            tree = None
+        if tree is not None:
+            for code in list(missing):
+                rate = _parse_lxml(tree, code)
+                if rate:
+                    results[code] = (rate, "lxml")
+                    missing.remove(code)
+
+    if missing:
+        soup = BeautifulSoup(html, 'html.parser')
+        for code in missing:
+            try:
+                results[code] = _parse_soup(soup, code)
+            except ValueError:
+                results[code] = (None, "malformed")
+    return results
+
+
+def parse_sell_rate(html: str, code: str = "usd"):
+    """Return (rate, strategy) for a currency's sell rate; (None, None) if nothing matched.
+
+    Raises ValueError if the rate element is there but doesn't hold a number.
+    """
+    rate = _parse_regex(html, code)
+    if rate:
+        return rate, "regex"
+    if lxml_html is not None:
+        try:
+            rate = _parse_lxml(lxml_html.fromstring(html), code)
+        except (ValueError, TypeError):
+            rate = None
+        if rate:
+            return rate, "lxml"
+    return _parse_soup(BeautifulSoup(html, 'html.parser'), code)
@@ -0,0 +1,135 @@
+"""
+Multi-pattern keyword matcher for Persian text.
+Compiled once from the keyword lists; returns the set of every keyword that
+occurs in a message so the scoring rules never rescan the text.
+"""
+
+import re
+
+# Zero-width non-joiner / joiner, no-break space and friends are written
+# interchangeably with a plain space in Persian news copy.
+_SPACE_VARIANTS = {
+    '\u200c': ' ',  # zero-width non-joiner
+    '\u200d': ' ',  # zero-width joiner
+    '\u00a0': ' ',  # no-break space
+    '\u202f': ' ',  # narrow no-break space
+    '\u2009': ' ',  # thin space
+    '\u064a': '\u06cc',  # Arabic yeh -> Persian yeh
+    '\u0649': '\u06cc',  # Arabic alef maksura -> Persian yeh
+    '\u0643': '\u06a9',  # Arabic kaf -> Persian keheh
+}
+_VARIANT_CHARS = re.compile('[' + ''.join(_SPACE_VARIANTS) + ']')
+# What normalization writes in place of other characters; any other character
+# in normalized text was already there, with the same neighbours
+_FOLDED_CHARS = re.compile('[' + ''.join(set(_SPACE_VARIANTS.values())) + ' ]')
+
+
+def normalize_text(text: str) -> str:
+    """Fold ZWNJ/spacing and Arabic letter variants so spellings compare equal."""
+    # replace() stays in C; str.translate with a dict is several times slower on non-ASCII text
+    if _VARIANT_CHARS.search(text) is not None:
+        for variant, canonical in _SPACE_VARIANTS.items():
+            if variant in text:
+                text = text.replace(variant, canonical)
+    if '  ' in text or not text.isprintable():
+        text = ' '.join(text.split())
+    return text
+
+
+def _trie_regex(patterns) -> str:
+    """Regex for the pattern set with common prefixes factored out (a trie)."""
+    trie = {}
+    for pattern in patterns:
+        node = trie
+        for ch in pattern:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Greedy optional tail: each match is the longest pattern starting there
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+
+def _anchors(patterns):
+    """Substrings, one shared by each pattern, that normalization can't have produced.
+
+    If a pattern occurs in the normalized text its anchor occurs verbatim in the
+    raw text, so their absence rules every pattern out before normalizing.
+    None when some pattern has no such run (it is all spaces and folded letters).
+    """
+    anchors = []
+    for pattern in sorted(patterns, key=len):
+        runs = [run for run in _FOLDED_CHARS.split(pattern) if run]
+        if not runs:
+            return None
+        if not any(anchor in run for anchor in anchors for run in runs):
+            anchors.append(max(runs, key=len))
+    return tuple(anchors)
+
+
+class KeywordMatcher:
+    """Finds every pattern present in a text in one pass.
+
+    The pattern set is compiled into a single trie-shaped regex that the C regex
+    engine runs over the text once. A match is the longest pattern starting at
+    that position, and implies every pattern it contains. The scan doesn't
+    overlap matches, so patterns that could start inside a match and run past
+    its end are precomputed per pattern and confirmed with startswith() at the
+    exact offset. may_occur() screens raw text with a few substring checks first,
+    which is what makes the matcher cheaper than scanning for every keyword when
+    most messages mention none of them.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = tuple(dict.fromkeys(normalize_text(p) for p in patterns if p))
+        self._regex = re.compile(_trie_regex(self.patterns))
+        self.anchors = _anchors(self.patterns)
+
+        self._implied = {
+            p: frozenset(q for q in self.patterns if q in p) for p in self.patterns
+        }
+        self._straddlers = {}
+        for p in self.patterns:
+            self._straddlers[p] = tuple(
+                (offset, q)
+                for offset in range(1, len(p))
+                for q in self.patterns
+                if len(q) > len(p) - offset and q.startswith(p[offset:])
+            )
+
+    def may_occur(self, text: str) -> bool:
+        """False if no pattern can occur in text, even once normalized. Takes raw text."""
+        if self.anchors is None:
+            return True
+        for anchor in self.anchors:
+            if anchor in text:
+                return True
+        return False
+
+    def find(self, text: str, normalized: bool = False) -> set:
+        """Set of (normalized) patterns occurring anywhere in text."""
+        if not normalized:
+            text = normalize_text(text)
+
+        hits = set()
+        for match in self._regex.finditer(text):
+            pattern = match.group()
+            hits |= self._implied[pattern]
+            straddlers = self._straddlers[pattern]
+            if straddlers:
+                start = match.start()
+                for offset, other in straddlers:
+                    if text.startswith(other, start + offset):
+                        hits |= self._implied[other]
+        return hits
+
+    def find_any(self, text: str, normalized: bool = False) -> bool:
+        if not normalized:
+            text = normalize_text(text)
+        return self._regex.search(text) is not None
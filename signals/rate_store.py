@@ -0,0 +1,192 @@
+"""
+Time-indexed rate history.
+Each currency is a pair of parallel, time-sorted arrays (timestamps, rates) so
+"rate as of t" is a bisect. Samples are appended to a local tab-separated file
+and replayed on startup (and by backtests); retention is a time span, not a
+sample count.
+"""
+
+import logging
+import os
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+RATE_HISTORY_PATH = os.getenv('RATE_HISTORY_PATH', 'rate_history.tsv')
+RATE_FILE_RETENTION_DAYS = float(os.getenv('RATE_FILE_RETENTION_DAYS', 90))
+
+
+def _epoch(when: datetime) -> float:
+    """Seconds since the epoch for a naive UTC datetime (as produced by utcnow)."""
+    return when.replace(tzinfo=timezone.utc).timestamp()
+
+
+class RateSeries:
+    """One currency's samples, sorted by time."""
+
+    def __init__(self):
+        self.timestamps = []
+        self.rates = []
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def add(self, ts: float, rate: int):
+        if not self.timestamps or ts >= self.timestamps[-1]:
+            self.timestamps.append(ts)
+            self.rates.append(rate)
+        else:
+            i = bisect_right(self.timestamps, ts)
+            self.timestamps.insert(i, ts)
+            self.rates.insert(i, rate)
+
+    def at_or_before(self, ts: float):
+        """Latest rate sampled at or before ts, or None."""
+        i = bisect_right(self.timestamps, ts)
+        return self.rates[i - 1] if i else None
+
+    def span_until(self, ts: float, max_seconds: float) -> float:
+        """Seconds covered by samples in [ts - max_seconds, ts]."""
+        end = bisect_right(self.timestamps, ts)
+        start = bisect_left(self.timestamps, ts - max_seconds)
+        return self.timestamps[end - 1] - self.timestamps[start] if end > start else 0.0
+
+    def prune(self, cutoff: float) -> int:
+        """Drop samples older than cutoff; returns how many were removed."""
+        i = bisect_left(self.timestamps, cutoff)
+        if i:
+            del self.timestamps[:i]
+            del self.rates[:i]
+        return i
+
+    def span_seconds(self) -> float:
+        return self.timestamps[-1] - self.timestamps[0] if self.timestamps else 0.0
+
+
+class RateStore:
+    """Per-currency rate history persisted to an append-only file.
+
+    path: tab-separated `epoch  currency  rate` lines; None keeps history in memory only.
+    retention_hours: what the signal looks back over, kept in memory.
+    file_retention_days: what the file keeps for replays; older lines are compacted away
+    once they outnumber the live ones, so a rewrite happens about once per retention span.
+    read_only: load the file but never write or compact it (backtests).
+    """
+
+    def __init__(self, path: str = RATE_HISTORY_PATH, retention_hours: float = 6,
+                 file_retention_days: float = RATE_FILE_RETENTION_DAYS, read_only: bool = False,
+                 since: datetime = None):
+        self.path = path
+        self.retention_seconds = retention_hours * 3600
+        self.file_retention_seconds = file_retention_days * 86400
+        self.read_only = read_only
+        self.series = {}
+        # Sorted timestamp of every line in the file, to count expired lines without reading it
+        self._file_ts = []
+        if path:
+            self.load(since)
+
+    def _series(self, currency: str) -> RateSeries:
+        series = self.series.get(currency)
+        if series is None:
+            series = self.series[currency] = RateSeries()
+        return series
+
+    @staticmethod
+    def _read(path: str):
+        """Yield (ts, currency, rate) from a history file, skipping torn lines."""
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    ts, currency, rate = line.rstrip('\n').split('\t')
+                    yield float(ts), currency, int(rate)
+                except ValueError:
+                    # A torn last line from a crash mid-write
+                    continue
+
+    def load(self, since: datetime = None):
+        """Replay the history file from `since` (default: the retention window)."""
+        if not os.path.exists(self.path):
+            return
+        now = _epoch(datetime.utcnow())
+        cutoff = _epoch(since) if since else now - self.retention_seconds
+        loaded = 0
+        file_ts = []
+        for ts, currency, rate in self._read(self.path):
+            file_ts.append(ts)
+            if ts >= cutoff:
+                self._series(currency).add(ts, rate)
+                loaded += 1
+        logger.info(f"Loaded {loaded} rate samples for {len(self.series)} currencies from {self.path}")
+        if not self.read_only:
+            self._file_ts = sorted(file_ts)
+            self._maybe_compact(now)
+
+    def append(self, when: datetime, rates: dict):
+        """Record one sample per currency at `when` and persist it."""
+        ts = _epoch(when)
+        for currency, rate in rates.items():
+            self._series(currency).add(ts, rate)
+
+        cutoff = ts - self.retention_seconds
+        for series in self.series.values():
+            series.prune(cutoff)
+
+        if not self.path or self.read_only:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(f"{ts:.3f}\t{currency}\t{rate}\n" for currency, rate in rates.items())
+        if self._file_ts and ts < self._file_ts[-1]:
+            for _ in rates:
+                insort(self._file_ts, ts)
+        else:
+            self._file_ts.extend([ts] * len(rates))
+        self._maybe_compact(ts)
+
+    def _maybe_compact(self, now: float):
+        expired = bisect_left(self._file_ts, now - self.file_retention_seconds)
+        if expired > len(self._file_ts) - expired:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the file without lines older than the file retention."""
+        now = _epoch(datetime.utcnow())
+        cutoff = now - self.file_retention_seconds
+        tmp = f"{self.path}.tmp"
+        kept = 0
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for ts, currency, rate in self._read(self.path):
+                if ts >= cutoff:
+                    f.write(f"{ts:.3f}\t{currency}\t{rate}\n")
+                    kept += 1
+        os.replace(tmp, self.path)
+        del self._file_ts[:bisect_left(self._file_ts, cutoff)]
+        logger.info(f"Compacted {self.path} to {kept} samples")
+
+    def sample_count(self) -> int:
+        return sum(len(series) for series in self.series.values())
+
+    def rate_at(self, currency: str, when: datetime):
+        """Latest rate recorded at or before `when`, or None."""
+        series = self.series.get(currency)
+        return series.at_or_before(_epoch(when)) if series else None
+
+    def sample_at(self, currency: str, when: datetime):
+        """(sampled_at, rate) of the latest sample at or before `when`, or None."""
+        series = self.series.get(currency)
+        if not series:
+            return None
+        i = bisect_right(series.timestamps, _epoch(when))
+        if not i:
+            return None
+        return datetime.utcfromtimestamp(series.timestamps[i - 1]), series.rates[i - 1]
+
+    def span_minutes(self, currency: str, until: datetime = None) -> float:
+        """How much history we hold for a currency; as of `until`, at most the retention span."""
+        series = self.series.get(currency)
+        if not series:
+            return 0.0
+        if until is None:
+            return series.span_seconds() / 60
+        return series.span_until(_epoch(until), self.retention_seconds) / 60
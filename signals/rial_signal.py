@@ -5,96 +5,141 @@ Detects sudden currency crashes indicating insider capital flight.
 """
 
 import httpx
-from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
-from collections import deque
 from . import SignalOutput
+from .bonbast_parser import parse_sell_rates
+from .rate_store import RateStore
+from http_client import create_http_client, timed_request
+from profiling import DEBUG_TIMING, Timings
+
+BONBAST_URL = "https://bonbast.com/"
+# Bonbast element codes: US dollar, euro, Emami gold coin. USD drives the signal.
+CURRENCIES = ("usd", "eur", "emami")
 
 
 class RialSignal:
     """Monitors Rial black market rate for sudden crashes."""
     
-    def __init__(self, history_hours: int = 6):
-        # Store recent prices: (timestamp, rate)
-        self.price_history = deque(maxlen=history_hours * 12)  # 5-min intervals
+    name = "rial_crash"
+    # Scheduler cadence (seconds): Bonbast updates a few times an hour
+    interval = 300
+    jitter = 30
+    
+    def __init__(self, history_hours: int = 6, client: httpx.AsyncClient = None, store: RateStore = None):
+        # Rate history by time, reloaded from disk so a restart keeps the 1h/4h baselines
+        self.store = store if store is not None else RateStore(retention_hours=history_hours)
         self.last_fetch_rate = None
+        self.last_rates = {}
+        # Pooled client owned by the runner; fall back to a private one
+        self.client = client
+        self._owns_client = client is None
+        # Validators and body fingerprint of the last page we parsed
+        self._etag = None
+        self._last_modified = None
+        self._body_hash = None
+        self._last_response = None
+        # Per-fetch breakdown, attached to the output when INDEX_DEBUG_TIMING=1
+        self._timings = Timings()
+        self.last_timings = {}
+        # Which extraction strategy found the rate on the last parsed page
+        self.last_strategy = None
+        
+    async def _get_rate(self):
+        """Return ({currency: rate}, source); source says whether the page was parsed or reused."""
+        if self.client is None:
+            self.client = create_http_client()
+        
+        headers = {"Accept": "text/html,application/xhtml+xml"}
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
+        
+        with self._timings.section("http"):
+            r, self.last_timings = await timed_request(self.client, "GET", BONBAST_URL, headers=headers)
+        self._last_response = r
+        
+        if r.status_code == 304 and self.last_rates:
+            return self.last_rates, "not_modified"
+        r.raise_for_status()
         
+        self._etag = r.headers.get("ETag")
+        self._last_modified = r.headers.get("Last-Modified")
+        
+        # Most responses carry no validators; an identical body is just as good
+        body_hash = hash(r.content)
+        if body_hash == self._body_hash and self.last_rates:
+            return self.last_rates, "unchanged"
+        
+        with self._timings.section("parse"):
+            parsed = parse_sell_rates(r.text, CURRENCIES)
+        rate, self.last_strategy = parsed["usd"]
+        if self.last_strategy == "malformed":
+            raise ValueError("usd_sell does not hold a number")
+        rates = {code: rate for code, (rate, _) in parsed.items() if rate}
+        if rate:
+            self._body_hash = body_hash
+        return rates, "parsed"
+    
     async def fetch(self) -> SignalOutput:
         now = datetime.utcnow()
+        self._timings = Timings()
         
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
-                r = await client.get(
-                    "https://bonbast.com/",
-                    headers={
-                        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36",
-                        "Accept": "text/html,application/xhtml+xml",
-                        "Accept-Language": "en-US,en;q=0.9",
-                    }
-                )
-                r.raise_for_status()
-        except Exception as e:
+            rates, source = await self._get_rate()
+            current_rate = rates.get("usd")
+        except (ValueError, AttributeError) as e:
             return SignalOutput(
-                name="rial_crash",
+                name=self.name,
                 value=0,
-                raw_value={"error": f"fetch_failed: {str(e)}"},
+                raw_value={"error": f"parse_failed: {str(e)}", "html_snippet": self._html_snippet()},
                 confidence=0,
                 timestamp=now
             )
-        
-        soup = BeautifulSoup(r.text, 'html.parser')
-        
-        # Bonbast structure: look for USD sell rate
-        current_rate = None
-        
-        try:
-            # Try multiple selectors (Bonbast changes layout sometimes)
-            # Method 1: Direct ID
-            usd_sell = soup.select_one('#usd_sell')
-            if usd_sell:
-                current_rate = int(usd_sell.text.strip().replace(',', ''))
-            
-            # Method 2: Table row
-            if not current_rate:
-                for row in soup.select('tr'):
-                    cells = row.select('td')
-                    if len(cells) >= 3 and 'usd' in row.get('id', '').lower():
-                        current_rate = int(cells[1].text.strip().replace(',', ''))
-                        break
-            
-            # Method 3: Data attribute
-            if not current_rate:
-                usd_elem = soup.select_one('[data-currency="usd"]')
-                if usd_elem:
-                    sell = usd_elem.select_one('.sell')
-                    if sell:
-                        current_rate = int(sell.text.strip().replace(',', ''))
-                        
-        except (ValueError, AttributeError) as e:
+        except Exception as e:
             return SignalOutput(
-                name="rial_crash",
+                name=self.name,
                 value=0,
-                raw_value={"error": f"parse_failed: {str(e)}", "html_snippet": r.text[:500]},
+                raw_value={"error": f"fetch_failed: {str(e)}"},
                 confidence=0,
                 timestamp=now
             )
         
         if not current_rate:
             return SignalOutput(
-                name="rial_crash",
+                name=self.name,
                 value=0,
-                raw_value={"error": "rate_not_found", "html_snippet": r.text[:500]},
+                raw_value={"error": "rate_not_found", "html_snippet": self._html_snippet()},
                 confidence=0,
                 timestamp=now
             )
         
-        # Store current rate
-        self.price_history.append((now, current_rate))
+        # Recorded for unchanged / not-modified pages too: a sample means "the rate was
+        # this at `now`", and history depth (the confidence) and the retention window
+        # are measured in sample times, so a steady rate must keep adding them
+        self.store.append(now, rates)
+        self.last_rates = rates
         self.last_fetch_rate = current_rate
         
+        with self._timings.section("score"):
+            output = self._build_output(now, rates, source)
+        if DEBUG_TIMING:
+            output.raw_value["timings"] = self._timings.report()
+        return output
+    
+    def _html_snippet(self) -> str:
+        # None until a request has come back
+        if self._last_response is None:
+            return ""
+        return self._last_response.text[:500]
+    
+    def _build_output(self, now: datetime, rates: dict, source: str) -> SignalOutput:
+        """Score the USD rate at `now` against the stored history."""
+        current_rate = rates["usd"]
+        
         # Calculate % change vs 1 hour ago
         one_hour_ago = now - timedelta(hours=1)
-        past_rate = self._get_rate_at(one_hour_ago)
+        past_rate = self.store.rate_at("usd", one_hour_ago)
         
         if past_rate:
             pct_change_1h = ((current_rate - past_rate) / past_rate) * 100
@@ -103,7 +148,7 @@ class RialSignal:
         
         # Calculate % change vs 4 hours ago
         four_hours_ago = now - timedelta(hours=4)
-        past_rate_4h = self._get_rate_at(four_hours_ago)
+        past_rate_4h = self.store.rate_at("usd", four_hours_ago)
         pct_change_4h = ((current_rate - past_rate_4h) / past_rate_4h) * 100 if past_rate_4h else 0
         
         # Normalize: 5% crash in 1hr = 100
@@ -112,26 +157,28 @@ class RialSignal:
         else:
             normalized = 0
         
-        # Confidence based on history depth
-        history_minutes = len(self.price_history) * 5
+        # Confidence based on how far back the history reaches
+        history_minutes = round(self.store.span_minutes("usd", until=now))
         confidence = min(0.95, 0.5 + (history_minutes / 120) * 0.45)
         
         return SignalOutput(
-            name="rial_crash",
+            name=self.name,
             value=normalized,
             raw_value={
                 "rate": current_rate,
+                "rates": rates,
                 "change_1h_pct": round(pct_change_1h, 2),
                 "change_4h_pct": round(pct_change_4h, 2),
-                "history_depth_minutes": history_minutes
+                "history_depth_minutes": history_minutes,
+                "source": source,
+                "parser": self.last_strategy,
+                "http": self.last_timings,
             },
             confidence=confidence,
             timestamp=now
         )
     
-    def _get_rate_at(self, target_time: datetime):
-        """Find closest historical rate at or before target time."""
-        for ts, rate in reversed(self.price_history):
-            if ts <= target_time:
-                return rate
-        return None
\ No newline at end of file
+    async def close(self):
+        if self._owns_client and self.client is not None:
+            await self.client.aclose()
+            self.client = None
@@ -4,9 +4,10 @@ State media silence detection signal.
 Monitors regime-affiliated Telegram channels for unusual posting gaps.
 """
 
-import clickhouse_connect
 from datetime import datetime, timedelta
+from typing import Optional
 from . import SignalOutput
+from profiling import DEBUG_TIMING, Timings
 
 
 # Regime-affiliated channels (must be indexed in ClickHouse)
@@ -23,23 +24,86 @@ MAX_PLAUSIBLE_GAP_HOURS = 24  # 1 week
 class SilenceSignal:
     """Detects unusual silence from regime media channels."""
     
-    def __init__(self, ch_client: clickhouse_connect.driver.Client, database: str):
-        self.client = ch_client
-        self.database = database
+    name = "state_media_silence"
+    # Scheduler cadence (seconds); only polled during Tehran business hours
+    interval = 60
+    jitter = 5
+    
+    def __init__(self, storage):
+        # storage.Storage: ClickHouse in production, SQLite offline
+        self.storage = storage
         self.regime_channels = REGIME_CHANNELS
+        # regime channel name -> channel_ids it matched; only resolved channels are cached
+        self.channel_ids = {}
+    
+    async def _resolve_channel_ids(self):
+        """Map regime channel names to channel_ids once, by username or title."""
+        unresolved = [c for c in self.regime_channels if c not in self.channel_ids]
+        if not unresolved:
+            return
+        
+        known = await self.storage.channels()
+        
+        for channel in unresolved:
+            name = channel.lower()
+            ids = [
+                channel_id for channel_id, username, title in known
+                if (username or '').lower() == name or name in (title or '').lower()
+            ]
+            if ids:
+                self.channel_ids[channel] = ids
+    
+    async def _last_posts(self) -> dict:
+        """channel_id -> last message_date for every resolved regime channel, in one query."""
+        ids = sorted({cid for channel_ids in self.channel_ids.values() for cid in channel_ids})
+        if not ids:
+            return {}
+        
+        return await self.storage.last_posts(ids)
         
-    def fetch(self) -> SignalOutput:
+    async def fetch(self) -> SignalOutput:
         now = datetime.utcnow()
+        if not self._is_business_hours(now):
+            return self._build_output(now, {})
         
-        # Check if we're in Tehran business hours (8am-11pm Tehran = UTC+3:30)
-        tehran_offset = timedelta(hours=3, minutes=30)
-        tehran_time = now + tehran_offset
-        tehran_hour = tehran_time.hour
-        is_business_hours = 8 <= tehran_hour <= 23
+        # Get last post time for each regime channel (one grouped query)
+        timings = Timings()
+        try:
+            with timings.section("query"):
+                await self._resolve_channel_ids()
+                last_posts = await self._last_posts()
+            error = None
+        except Exception as e:
+            last_posts = {}
+            error = f"error: {str(e)}"
+        
+        with timings.section("score"):
+            output = self._build_output(now, last_posts, error)
+        if DEBUG_TIMING:
+            output.raw_value["timings"] = timings.report()
+        return output
+    
+    @staticmethod
+    def _tehran_hour(now: datetime) -> int:
+        # Tehran = UTC+3:30
+        return (now + timedelta(hours=3, minutes=30)).hour
+    
+    def _is_business_hours(self, now: datetime) -> bool:
+        # 8am-11pm Tehran
+        return 8 <= self._tehran_hour(now) <= 23
+    
+    def is_active(self, now: datetime) -> bool:
+        """Scheduler hook: silence only means something during business hours."""
+        return self._is_business_hours(now)
+    
+    def _build_output(self, now: datetime, last_posts: dict, error: Optional[str] = None) -> SignalOutput:
+        """Score silence as of `now` from channel_id -> last message_date."""
+        tehran_hour = self._tehran_hour(now)
+        is_business_hours = self._is_business_hours(now)
         
         if not is_business_hours:
             return SignalOutput(
-                name="state_media_silence",
+                name=self.name,
                 value=0,
                 raw_value={
                     "reason": "outside_tehran_hours",
@@ -49,37 +113,30 @@ class SilenceSignal:
                 timestamp=now
             )
         
-        # Get last post time for each regime channel
         silence_data = {}
         max_silence_hours = 0
         channels_checked = 0
         
         for channel in self.regime_channels:
-            query = f"""
-            SELECT 
-                max(message_date) as last_post
-            FROM {self.database}.messages
-            WHERE lower(channel_username) = lower('{channel}')
-               OR lower(channel_title) LIKE '%{channel.lower()}%'
-            """
+            if error:
+                silence_data[channel] = error
+                continue
+            
+            posts = [last_posts[cid] for cid in self.channel_ids.get(channel, []) if last_posts.get(cid)]
+            if not posts:
+                silence_data[channel] = "no_data"
+                continue
             
-            try:
-                result = self.client.query(query)
-                if result.result_rows and result.result_rows[0][0]:
-                    last_post = result.result_rows[0][0]
-                    if isinstance(last_post, str):
-                        last_post = datetime.fromisoformat(last_post)
-                    hours_silent = (now - last_post).total_seconds() / 3600
-                    silence_data[channel] = round(hours_silent, 2)
-                    # Only factor into index if gap is plausible (channel actually indexed recently)
-                    if hours_silent <= MAX_PLAUSIBLE_GAP_HOURS:
-                        max_silence_hours = max(max_silence_hours, hours_silent)
-                        channels_checked += 1
-                    # else: gap too long = channel not recently indexed, don't drive signal
-                else:
-                    silence_data[channel] = "no_data"
-            except Exception as e:
-                silence_data[channel] = f"error: {str(e)}"
+            last_post = max(posts)
+            if isinstance(last_post, str):
+                last_post = datetime.fromisoformat(last_post)
+            hours_silent = (now - last_post).total_seconds() / 3600
+            silence_data[channel] = round(hours_silent, 2)
+            # Only factor into index if gap is plausible (channel actually indexed recently)
+            if hours_silent <= MAX_PLAUSIBLE_GAP_HOURS:
+                max_silence_hours = max(max_silence_hours, hours_silent)
+                channels_checked += 1
+            # else: gap too long = channel not recently indexed, don't drive signal
         
         # Normalize: 3+ hours silence during business hours = 100
         if max_silence_hours <= 1:
@@ -94,7 +151,7 @@ class SilenceSignal:
             confidence = min(0.8, 0.4 + (channels_checked / len(self.regime_channels)) * 0.4)
         
         return SignalOutput(
-            name="state_media_silence",
+            name=self.name,
             value=normalized,
             raw_value={
                 "max_silence_hours": round(max_silence_hours, 2),
@@ -3,9 +3,15 @@ Telegram signal with smart relevance scoring.
 Not just counting keywords - assesses if message indicates actual threat.
 """
 
-import clickhouse_connect
+import bisect
+import itertools
+from collections import Counter, deque
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Optional
 from . import SignalOutput
+from .keyword_matcher import KeywordMatcher, normalize_text
+from profiling import DEBUG_TIMING, Timings
 
 KHAMENEI_KEYWORDS = [
     'خامنه‌ای',
@@ -88,68 +94,240 @@ ROUTINE_KEYWORDS = [
     'انتصاب',
 ]
 
+SLOGAN_PATTERNS = ['مرگ بر خامنه', 'مرگ بر']
+ILLNESS_KEYWORDS = ['بیمارستان', 'بستری', 'سکته']
+SEVERITY_KEYWORDS = ['وخیم', 'بحرانی', 'حال']
+DEATH_KEYWORDS = ['فوت', 'درگذشت']
+
+# Compiled once at import; scoring below only does set lookups on the hits
+_KHAMENEI = frozenset(normalize_text(kw) for kw in KHAMENEI_KEYWORDS)
+# keyword -> number of list entries it stands for (after normalization)
+_CRITICAL = Counter(normalize_text(kw) for kw in CRITICAL_KEYWORDS)
+_ROUTINE = Counter(normalize_text(kw) for kw in ROUTINE_KEYWORDS)
+_SLOGANS = frozenset(normalize_text(kw) for kw in SLOGAN_PATTERNS)
+_ILLNESS = frozenset(normalize_text(kw) for kw in ILLNESS_KEYWORDS)
+_SEVERITY = frozenset(normalize_text(kw) for kw in SEVERITY_KEYWORDS)
+_DEATH = frozenset(normalize_text(kw) for kw in DEATH_KEYWORDS)
+_DEATH_WORD = normalize_text('مرگ')
+_SUCCESSOR = normalize_text('جانشین')
+_ASSEMBLY = normalize_text('خبرگان')
+
+KHAMENEI_MATCHER = KeywordMatcher(KHAMENEI_KEYWORDS)
+KEYWORD_MATCHER = KeywordMatcher(
+    CRITICAL_KEYWORDS + ROUTINE_KEYWORDS + SLOGAN_PATTERNS
+    + ILLNESS_KEYWORDS + SEVERITY_KEYWORDS + DEATH_KEYWORDS + ['جانشین', 'خبرگان']
+)
+
+
+def score_message(text: str) -> int:
+    """Score a message for threat level. Filters out slogans."""
+    # Most messages are rejected here, on the raw text, without normalizing it
+    if not text or not KHAMENEI_MATCHER.may_occur(text):
+        return -1
+    
+    text = normalize_text(text)
+    if not KHAMENEI_MATCHER.find_any(text, normalized=True):
+        return -1
+    
+    # One pass over the text finds every keyword the rules below look at
+    hits = KEYWORD_MATCHER.find(text, normalized=True)
+    score = 0
+    
+    is_slogan = not hits.isdisjoint(_SLOGANS)
+    
+    for kw in hits:
+        if kw in _CRITICAL and not (kw == _DEATH_WORD and is_slogan):
+            score += 2 * _CRITICAL[kw]
+        if kw in _ROUTINE:
+            score -= _ROUTINE[kw]
+    
+    if not hits.isdisjoint(_ILLNESS):
+        if not hits.isdisjoint(_SEVERITY):
+            score += 3
+    
+    if _SUCCESSOR in hits and _ASSEMBLY in hits:
+        score += 3
+    
+    if not hits.isdisjoint(_DEATH) and not is_slogan:
+        score = max(score, 4)
+    
+    return max(-1, min(5, score))
+
+
+# Seconds of inserts each incremental poll re-reads before its watermark
+OVERLAP_SECONDS = 120
+
+
+@dataclass(eq=False)
+class WindowEntry:
+    """A scored Khamenei mention held in the sliding window."""
+    date: datetime
+    key: tuple  # (channel_id, message_id)
+    channel: str
+    score: Optional[int]
+    text: str
+    version: Optional[datetime] = None  # edit_date, else message_date
+
 
 class TelegramSignal:
-    """Smart relevance scoring for Khamenei-related messages."""
+    """Smart relevance scoring for Khamenei-related messages.
     
-    def __init__(self, ch_client: clickhouse_connect.driver.Client, database: str):
-        self.client = ch_client
-        self.database = database
+    Keeps the last `window_hours` of scored mentions in memory and each tick only
+    queries rows written to storage since the last one, so per-tick cost scales
+    with new messages rather than the window size. The watermark is the store's
+    insert time, not message_date, so backfills, spool replays and late flushes
+    of older messages are still picked up, and a newer version of a message
+    (an edit) replaces the scored entry.
+    """
+    
+    name = "telegram_velocity"
+    # Scheduler cadence (seconds): incremental queries are cheap, so refresh often
+    interval = 15
+    jitter = 2
+    
+    def __init__(self, storage, window_hours: int = 24, incremental: bool = True, overlap_seconds: int = OVERLAP_SECONDS):
+        # storage.Storage: ClickHouse in production, SQLite offline
+        self.storage = storage
         self.baseline_critical_per_day = 1.0
-        
-    def fetch(self) -> SignalOutput:
+        self.window_hours = window_hours
+        self.incremental = incremental
+        # Re-read this much before the watermark so inserts that were stamped
+        # before it but committed after the last query aren't missed
+        self.overlap_seconds = overlap_seconds
+        self._reset_window()
+    
+    def _reset_window(self):
+        self._window = deque()
+        self._critical = deque()
+        # key -> WindowEntry
+        self._entries = {}
+        # Newest scraped_at (store insert time) read so far
+        self._watermark = None
+        self._routine_count = 0
+        self._unclear_count = 0
+        self._critical_channels = Counter()
+    
+    async def fetch(self) -> SignalOutput:
         now = datetime.utcnow()
-        window_hours = 24
-        since = now - timedelta(hours=window_hours)
+        since = now - timedelta(hours=self.window_hours)
         
-        khamenei_conditions = " OR ".join([
-            f"message_text LIKE '%{kw}%'" for kw in KHAMENEI_KEYWORDS
-        ])
+        if not self.incremental:
+            self._reset_window()
         
-        query = f"""
-        SELECT message_text, message_date, channel_title
-        FROM {self.database}.messages
-        WHERE message_date >= toDateTime64('{since.strftime('%Y-%m-%d %H:%M:%S')}', 3)
-          AND ({khamenei_conditions})
-        ORDER BY message_date DESC
-        LIMIT 500
-        """
+        written_since = None
+        if self._watermark is not None:
+            written_since = self._watermark - timedelta(seconds=self.overlap_seconds)
         
+        timings = Timings()
         try:
-            result = self.client.query(query)
-            messages = result.result_rows
+            with timings.section("query"):
+                rows = await self.storage.mention_updates(since, written_since)
         except Exception as e:
             return SignalOutput(
-                name="telegram_velocity",
+                name=self.name,
                 value=0,
                 raw_value={"error": str(e)},
                 confidence=0,
                 timestamp=now
             )
         
-        critical_messages = []
-        routine_messages = []
-        unclear_messages = []
+        with timings.section("score"):
+            for channel_id, message_id, msg_text, msg_date, channel, version, scraped_at in rows:
+                self._add(msg_date, (channel_id, message_id), channel, msg_text, version)
+                if self._watermark is None or scraped_at > self._watermark:
+                    self._watermark = scraped_at
+            self._expire(since)
         
-        for msg_text, msg_date, channel in messages:
-            if not msg_text:
-                continue
-                
+        with timings.section("build"):
+            output = self._build_output(now)
+        if DEBUG_TIMING:
+            output.raw_value["timings"] = {**timings.report(), "rows": len(rows)}
+        return output
+    
+    def push(self, msg_date: datetime, key: tuple, channel: str, msg_text: str,
+             score: Optional[int] = None, version: Optional[datetime] = None) -> SignalOutput:
+        """Add a message pushed by the scraper ahead of the next poll and rebuild the output.
+        
+        `score` is the scraper's, on the full text; `msg_text` may be truncated.
+        The poll that later reads the same row from storage skips it by key and version.
+        """
+        now = datetime.utcnow()
+        self._add(msg_date, key, channel, msg_text, version, score)
+        self._expire(now - timedelta(hours=self.window_hours))
+        return self._build_output(now)
+    
+    def _add(self, msg_date: datetime, key: tuple, channel: str, msg_text: str,
+             version: Optional[datetime] = None, score: Optional[int] = None):
+        """Score a message (unless `score` is given) and add it to the window; a newer
+        version replaces the entry, others are no-ops."""
+        version = version or msg_date
+        existing = self._entries.get(key)
+        if existing is not None:
+            if version <= existing.version:
+                return
+            self._remove(existing)
+        
+        if score is None and msg_text:
             score = self._score_message(msg_text)
-            
-            if score >= 3:
-                critical_messages.append({
-                    "text": msg_text[:100],
-                    "score": score,
-                    "channel": channel,
-                    "date": str(msg_date)
-                })
-            elif score <= 0:
-                routine_messages.append(msg_text[:50])
+        entry = WindowEntry(date=msg_date, key=key, channel=channel, score=score,
+                            text=msg_text[:100] if msg_text else '', version=version)
+        self._entries[key] = entry
+        
+        if self._window and msg_date < self._window[-1].date:
+            bisect.insort(self._window, entry, key=lambda e: e.date)
+        else:
+            self._window.append(entry)
+        
+        if score is None:
+            return
+        if score >= 3:
+            if self._critical and msg_date < self._critical[-1].date:
+                bisect.insort(self._critical, entry, key=lambda e: e.date)
+            else:
+                self._critical.append(entry)
+            self._critical_channels[channel] += 1
+        elif score <= 0:
+            self._routine_count += 1
+        else:
+            self._unclear_count += 1
+    
+    def _remove(self, entry: WindowEntry):
+        """Take a superseded entry out of the window and the counts (edits are rare; O(window))."""
+        del self._entries[entry.key]
+        self._window.remove(entry)
+        if entry.score is None:
+            return
+        if entry.score >= 3:
+            self._critical.remove(entry)
+            self._uncount_critical(entry.channel)
+        elif entry.score <= 0:
+            self._routine_count -= 1
+        else:
+            self._unclear_count -= 1
+    
+    def _uncount_critical(self, channel: str):
+        self._critical_channels[channel] -= 1
+        if not self._critical_channels[channel]:
+            del self._critical_channels[channel]
+    
+    def _expire(self, since: datetime):
+        """Drop entries that slid out of the window."""
+        while self._window and self._window[0].date < since:
+            entry = self._window.popleft()
+            del self._entries[entry.key]
+            if entry.score is None or entry.score >= 3:
+                continue
+            if entry.score <= 0:
+                self._routine_count -= 1
             else:
-                unclear_messages.append(msg_text[:50])
+                self._unclear_count -= 1
         
-        critical_count = len(critical_messages)
+        while self._critical and self._critical[0].date < since:
+            entry = self._critical.popleft()
+            self._uncount_critical(entry.channel)
+    
+    def _build_output(self, now: datetime) -> SignalOutput:
+        critical_count = len(self._critical)
         
         if critical_count == 0:
             normalized = 0
@@ -162,13 +340,13 @@ class TelegramSignal:
         else:
             normalized = 100
         
-        critical_channels = len(set(m["channel"] for m in critical_messages))
+        critical_channels = len(self._critical_channels)
         if critical_channels >= 2:
             normalized = min(100, normalized * 1.3)
         if critical_channels >= 3:
             normalized = min(100, normalized * 1.5)
         
-        total_messages = len(messages)
+        total_messages = len(self._window)
         if total_messages == 0:
             confidence = 0.3
         elif total_messages < 10:
@@ -176,57 +354,30 @@ class TelegramSignal:
         else:
             confidence = 0.9
         
+        # Most recent first
+        critical_messages = [
+            {"text": e.text, "score": e.score, "channel": e.channel, "date": str(e.date)}
+            for e in list(itertools.islice(reversed(self._critical), 5))
+        ]
+        
         return SignalOutput(
-            name="telegram_velocity",
+            name=self.name,
             value=normalized,
             raw_value={
                 "critical_count": critical_count,
-                "critical_messages": critical_messages[:5],
-                "routine_count": len(routine_messages),
-                "unclear_count": len(unclear_messages),
+                "critical_messages": critical_messages,
+                "routine_count": self._routine_count,
+                "unclear_count": self._unclear_count,
                 "total_khamenei_mentions": total_messages,
                 "channels_reporting_critical": critical_channels,
-                "window_hours": window_hours
+                "window_hours": self.window_hours
             },
             confidence=confidence,
             timestamp=now
         )
     
     def _score_message(self, text: str) -> int:
-        """Score a message for threat level. Filters out slogans."""
-        if not text:
-            return -1
-        
-        score = 0
-        
-        has_khamenei = any(kw in text for kw in KHAMENEI_KEYWORDS)
-        if not has_khamenei:
-            return -1
-        
-        slogan_patterns = ['مرگ بر خامنه', 'مرگ بر']
-        is_slogan = any(pattern in text for pattern in slogan_patterns)
-        
-        for kw in CRITICAL_KEYWORDS:
-            if kw in text:
-                if kw == 'مرگ' and is_slogan:
-                    continue
-                score += 2
-        
-        for kw in ROUTINE_KEYWORDS:
-            if kw in text:
-                score -= 1
-        
-        if any(kw in text for kw in ['بیمارستان', 'بستری', 'سکته']):
-            if any(kw in text for kw in ['وخیم', 'بحرانی', 'حال']):
-                score += 3
-        
-        if 'جانشین' in text and 'خبرگان' in text:
-            score += 3
-        
-        if any(kw in text for kw in ['فوت', 'درگذشت']) and not is_slogan:
-            score = max(score, 4)
-        
-        return max(-1, min(5, score))
+        return score_message(text)
     
     def get_baseline(self, hours: int = 24) -> float:
         return self.baseline_critical_per_day
\ No newline at end of file
@@ -0,0 +1,509 @@
+"""
+Local durable spool for rows ClickHouse couldn't take.
+Batches are pickled, compressed (zstd, else lz4) and appended as frames to
+segment files on disk. A background task drains the oldest segments back to
+ClickHouse in bulk once it recovers; a segment is deleted only after every
+frame in it has been inserted. File I/O runs on worker threads, so callers on
+the event loop never block on the disk.
+
+Frames the server will never accept (bad rows, a schema mismatch) or that
+can't be read back (corruption, a codec that is no longer installed) are moved
+to DEAD_LETTER_DIR so they don't hold up everything queued behind them. Dead
+letter files keep the segment format: point a Spool at that directory to
+replay them once the cause is fixed.
+"""
+
+import asyncio
+import logging
+import os
+import pickle
+import re
+import sqlite3
+import struct
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - ships with clickhouse-connect
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover
+    lz4 = None
+
+try:
+    from clickhouse_connect.driver.exceptions import DatabaseError, DataError, OperationalError, ProgrammingError
+except ImportError:  # pragma: no cover - SQLite-only installs
+    DatabaseError = DataError = OperationalError = ProgrammingError = None
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = os.getenv('SPOOL_DIR', 'spool')
+SPOOL_SEGMENT_MB = int(os.getenv('SPOOL_SEGMENT_MB', 16))
+# Failed drains of one frame, while the server is answering, before it goes to the dead letter directory
+SPOOL_MAX_ATTEMPTS = int(os.getenv('SPOOL_MAX_ATTEMPTS', 5))
+
+# payload length, row count, spooled at (epoch seconds)
+FRAME_HEADER = struct.Struct("<IId")
+CURSOR_FILE = "cursor"
+DEAD_LETTER_DIR = "dead"
+
+# ClickHouse errors for rows that no retry will get in: parse failures, type
+# mismatches, unknown columns, values out of range
+PERMANENT_CLICKHOUSE_CODES = {6, 16, 27, 32, 33, 38, 41, 53, 69, 70, 117}
+_CLICKHOUSE_CODE = re.compile(r"code:? (\d+)", re.IGNORECASE)
+
+
+def is_unavailable(error: Exception) -> bool:
+    """The store couldn't be reached or is busy; says nothing about the rows."""
+    if isinstance(error, (OSError, asyncio.TimeoutError, sqlite3.OperationalError)):
+        return True
+    return OperationalError is not None and isinstance(error, OperationalError)
+
+
+def is_permanent(error: Exception) -> bool:
+    """The store rejected the rows themselves, so retrying the same batch can't succeed."""
+    if isinstance(error, (TypeError, ValueError, KeyError, OverflowError, sqlite3.IntegrityError, sqlite3.InterfaceError)):
+        # Rows the client couldn't serialize, or SQLite wouldn't bind or store
+        return True
+    if DatabaseError is None or not isinstance(error, DatabaseError) or isinstance(error, OperationalError):
+        return False
+    if isinstance(error, (DataError, ProgrammingError)):
+        return True
+    match = _CLICKHOUSE_CODE.search(str(error))
+    return match is not None and int(match.group(1)) in PERMANENT_CLICKHOUSE_CODES
+
+
+def default_codec() -> str:
+    if zstandard is not None:
+        return "zst"
+    if lz4 is not None:
+        return "lz4"
+    return "raw"
+
+
+def codec_available(codec: str) -> bool:
+    if codec == "zst":
+        return zstandard is not None
+    if codec == "lz4":
+        return lz4 is not None
+    return codec == "raw"
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == "zst":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == "lz4":
+        return lz4.frame.compress(data)
+    return data
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zst":
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "lz4":
+        return lz4.frame.decompress(data)
+    return data
+
+
+class FrameError(Exception):
+    """Frames at the front of a segment that can't be read back; `end` is where they stop."""
+
+    def __init__(self, segment, end: int, rows: int, reason: str):
+        super().__init__(reason)
+        self.segment = segment
+        self.end = end
+        self.rows = rows
+
+
+@dataclass
+class Segment:
+    path: str
+    seq: int
+    codec: str
+    rows: int = 0
+    frames: int = 0
+    oldest: float = None
+    # Bytes/rows already drained from the front of the segment
+    offset: int = 0
+    drained_rows: int = 0
+
+
+class Spool:
+    """Segmented append-only spool with a bulk drainer.
+
+    Call start(insert_fn) once on the event loop; append() from anywhere on it.
+    insert_fn takes a list of row dicts, like BatchWriter's.
+    A batch that keeps failing while the store is up is retried one frame at a
+    time; a frame rejected outright, or max_attempts times, is dead-lettered.
+    """
+
+    def __init__(self, directory: str = SPOOL_DIR, segment_bytes: int = SPOOL_SEGMENT_MB * 1024 * 1024,
+                 codec: str = None, drain_rows: int = 20000, fsync: bool = True,
+                 max_backoff: float = 30.0, max_attempts: int = SPOOL_MAX_ATTEMPTS):
+        self.directory = directory
+        self.dead_letter_dir = os.path.join(directory, DEAD_LETTER_DIR)
+        self.segment_bytes = segment_bytes
+        self.codec = codec or default_codec()
+        self.drain_rows = drain_rows
+        self.fsync = fsync
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+
+        self._lock = threading.Lock()
+        self._segments = deque()
+        self._active = None
+        self._file = None
+        self._wakeup = None
+        self._task = None
+        self._closed = False
+        self._backoff = 1.0
+        # Failed drains of the batch at the front while the store was answering
+        self._attempts = 0
+        # (segment, offset): after a batch failed for good, drain one frame at a time up to here
+        self._isolate_until = None
+
+        self.stats = {
+            "spilled_rows": 0,
+            "spilled_batches": 0,
+            "drained_rows": 0,
+            "drain_batches": 0,
+            "drain_errors": 0,
+            "drain_rows_per_s": 0.0,
+            "total_drain_s": 0.0,
+            "replay_lag_s": 0.0,
+            "torn_frames": 0,
+            "dead_letter_rows": 0,
+            "dead_letter_frames": 0,
+        }
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    # --- disk ---
+
+    def _recover(self):
+        """Index segments left by a previous run and resume from the saved cursor."""
+        names = sorted(n for n in os.listdir(self.directory) if n.split(".")[0].isdigit())
+        cursor = self._read_cursor()
+        for name in names:
+            seq, codec = name.split(".", 1)
+            segment = Segment(path=os.path.join(self.directory, name), seq=int(seq), codec=codec)
+            self._scan(segment)
+            if cursor and cursor[0] == name:
+                segment.offset, segment.drained_rows = cursor[1], cursor[2]
+            if segment.rows > segment.drained_rows:
+                self._segments.append(segment)
+            else:
+                os.unlink(segment.path)
+        if self._segments:
+            logger.warning(f"Spool has {self.pending_rows()} rows in {len(self._segments)} segments from a previous run")
+
+    def _scan(self, segment: Segment):
+        """Count frames from headers only; truncates a torn frame left by a crash mid-write."""
+        size = os.path.getsize(segment.path)
+        position = 0
+        with open(segment.path, "rb") as f:
+            while position + FRAME_HEADER.size <= size:
+                length, rows, spooled_at = FRAME_HEADER.unpack(f.read(FRAME_HEADER.size))
+                if position + FRAME_HEADER.size + length > size:
+                    break
+                f.seek(length, os.SEEK_CUR)
+                position += FRAME_HEADER.size + length
+                segment.rows += rows
+                segment.frames += 1
+                if segment.oldest is None:
+                    segment.oldest = spooled_at
+        if position < size:
+            self.stats["torn_frames"] += 1
+            logger.warning(f"Truncating torn frame at byte {position} of {segment.path}")
+            with open(segment.path, "r+b") as f:
+                f.truncate(position)
+
+    def _read_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                name, offset, rows = f.read().split()
+            return name, int(offset), int(rows)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cursor(self, segment: Segment):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write(f"{os.path.basename(segment.path)} {segment.offset} {segment.drained_rows}")
+        os.replace(path + ".tmp", path)
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._active = None
+
+    def _write(self, rows: list):
+        data = _compress(self.codec, pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL))
+        now = time.time()
+        with self._lock:
+            if self._active is None:
+                seq = self._segments[-1].seq + 1 if self._segments else 1
+                self._active = Segment(path=os.path.join(self.directory, f"{seq:08d}.{self.codec}"), seq=seq, codec=self.codec)
+                self._segments.append(self._active)
+                self._file = open(self._active.path, "ab")
+            self._file.write(FRAME_HEADER.pack(len(data), len(rows), now))
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._active.rows += len(rows)
+            self._active.frames += 1
+            if self._active.oldest is None:
+                self._active.oldest = now
+            if self._file.tell() >= self.segment_bytes:
+                self._rotate()
+
+    def _read_batch(self, max_frames: int = None):
+        """Up to drain_rows rows (and max_frames frames) from the front of the oldest segment:
+        (segment, rows, end offset, oldest, frames). Raises FrameError if the first frame is unreadable."""
+        with self._lock:
+            if not self._segments:
+                return None
+            segment = self._segments[0]
+            if segment is self._active:
+                # Close it so new spills go to a fresh segment while this one drains
+                self._rotate()
+        if not codec_available(segment.codec):
+            raise FrameError(segment, os.path.getsize(segment.path), segment.rows - segment.drained_rows,
+                             f"the {segment.codec} codec is not installed")
+        rows = []
+        offset = segment.offset
+        oldest = None
+        frames = 0
+        with open(segment.path, "rb") as f:
+            f.seek(offset)
+            while len(rows) < self.drain_rows and (max_frames is None or frames < max_frames):
+                header = f.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    break
+                length, count, spooled_at = FRAME_HEADER.unpack(header)
+                try:
+                    batch = pickle.loads(_decompress(segment.codec, f.read(length)))
+                except Exception as e:
+                    if frames:
+                        # Hand back the good frames; the bad one is first on the next read
+                        break
+                    raise FrameError(segment, offset + FRAME_HEADER.size + length, count, f"unreadable frame: {e!r}")
+                rows.extend(batch)
+                offset += FRAME_HEADER.size + length
+                frames += 1
+                if oldest is None:
+                    oldest = spooled_at
+        return segment, rows, offset, oldest, frames
+
+    def _dead_letter(self, segment: Segment, end: int, rows: int):
+        """Move the frames from the segment's cursor up to `end` to the dead letter directory, then skip them."""
+        os.makedirs(self.dead_letter_dir, exist_ok=True)
+        path = os.path.join(self.dead_letter_dir, os.path.basename(segment.path))
+        with open(segment.path, "rb") as src, open(path, "ab") as dst:
+            src.seek(segment.offset)
+            dst.write(src.read(end - segment.offset))
+            dst.flush()
+            if self.fsync:
+                os.fsync(dst.fileno())
+        self._commit(segment, rows, end, done=end >= os.path.getsize(segment.path))
+        return path
+
+    def _commit(self, segment: Segment, rows: int, offset: int, done: bool = False):
+        with self._lock:
+            segment.offset = offset
+            segment.drained_rows += rows
+            if segment.drained_rows < segment.rows and not done:
+                self._write_cursor(segment)
+                return
+            self._segments.popleft()
+        try:
+            os.unlink(segment.path)
+        except FileNotFoundError:
+            pass
+        cursor = os.path.join(self.directory, CURSOR_FILE)
+        if os.path.exists(cursor):
+            os.unlink(cursor)
+
+    # --- event loop side ---
+
+    async def append(self, rows: list):
+        """Spill a batch to disk."""
+        await asyncio.to_thread(self._write, rows)
+        self.stats["spilled_rows"] += len(rows)
+        self.stats["spilled_batches"] += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending(self) -> bool:
+        return bool(self._segments)
+
+    def draining(self) -> bool:
+        """Whether the drain task is alive to work off the backlog."""
+        return self._task is not None and not self._task.done()
+
+    def pending_rows(self) -> int:
+        return sum(s.rows - s.drained_rows for s in self._segments)
+
+    def pending_bytes(self) -> int:
+        total = 0
+        for s in list(self._segments):
+            try:
+                total += os.path.getsize(s.path) - s.offset
+            except OSError:
+                pass
+        return total
+
+    def start(self, insert_fn):
+        self.insert_fn = insert_fn
+        self._wakeup = asyncio.Event()
+        if self._segments:
+            self._wakeup.set()
+        self._task = asyncio.get_running_loop().create_task(self._drain_loop())
+        self._task.add_done_callback(self._drain_stopped)
+
+    def _drain_stopped(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Spool drain task died, {self.pending_rows()} rows stay on disk", exc_info=task.exception())
+
+    async def _drain_loop(self):
+        while not self._closed:
+            if not self._segments:
+                self._wakeup.clear()
+                self.stats["replay_lag_s"] = 0.0
+                await self._wakeup.wait()
+                continue
+            try:
+                await self._drain_once()
+            except Exception:
+                # Never let the drainer die quietly: the writer would queue behind it for good
+                self.stats["drain_errors"] += 1
+                logger.exception(f"Spool drain failed, retrying in {self._backoff:.0f}s")
+                await self._sleep_backoff()
+
+    async def _sleep_backoff(self):
+        await asyncio.sleep(self._backoff)
+        self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    async def _drain_once(self):
+        front = self._segments[0]
+        isolate = self._isolate_until is not None and self._isolate_until[0] is front \
+            and front.offset < self._isolate_until[1]
+        if not isolate:
+            self._isolate_until = None
+        try:
+            batch = await asyncio.to_thread(self._read_batch, 1 if isolate else None)
+        except FrameError as e:
+            path = await asyncio.to_thread(self._dead_letter, e.segment, e.end, e.rows)
+            self._count_dead_letter(e.rows)
+            logger.error(f"Moved {e.rows} unreadable spooled rows from {e.segment.path} to {path}: {e}")
+            return
+        except FileNotFoundError:
+            logger.error(f"Spool segment {front.path} disappeared, dropping it")
+            await asyncio.to_thread(self._commit, front, 0, front.offset, True)
+            return
+        if batch is None:
+            return
+        segment, rows, offset, oldest, frames = batch
+        if oldest is not None:
+            self.stats["replay_lag_s"] = round(time.time() - oldest, 1)
+        if not rows:
+            # Header counts disagree with the frames on disk; nothing more to read here
+            logger.error(f"Spool segment {segment.path} ended early, dropping it")
+            await asyncio.to_thread(self._commit, segment, 0, offset, True)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.insert_fn(rows)
+        except Exception as e:
+            await self._drain_failed(segment, rows, offset, frames, e)
+            return
+        elapsed = time.perf_counter() - started
+        self._backoff = 1.0
+        self._attempts = 0
+        self.stats["drained_rows"] += len(rows)
+        self.stats["drain_batches"] += 1
+        self.stats["total_drain_s"] += elapsed
+        self.stats["drain_rows_per_s"] = round(len(rows) / elapsed, 1) if elapsed else 0.0
+        await asyncio.to_thread(self._commit, segment, len(rows), offset)
+        logger.info(
+            f"Spool drained {len(rows)} rows ({self.stats['drain_rows_per_s']:.0f} rows/s), "
+            f"{self.pending_rows()} pending, replay lag {self.stats['replay_lag_s']}s"
+        )
+        if not self._segments:
+            logger.info(f"Spool drained: {self.report()}")
+
+    async def _drain_failed(self, segment: Segment, rows: list, offset: int, frames: int, error: Exception):
+        self.stats["drain_errors"] += 1
+        permanent = is_permanent(error)
+        if not permanent and is_unavailable(error):
+            # An outage: keep the rows and wait it out however long it takes
+            logger.warning(f"Spool drain of {len(rows)} rows failed, retrying in {self._backoff:.0f}s: {error}")
+            await self._sleep_backoff()
+            return
+
+        self._attempts += 1
+        if not permanent and self._attempts < self.max_attempts:
+            logger.warning(
+                f"Spool drain of {len(rows)} rows failed ({self._attempts}/{self.max_attempts}), "
+                f"retrying in {self._backoff:.0f}s: {error}"
+            )
+            await self._sleep_backoff()
+            return
+
+        self._attempts = 0
+        self._backoff = 1.0
+        if frames > 1:
+            # Find the frame(s) at fault instead of dead-lettering the whole batch
+            logger.warning(f"Spool batch of {len(rows)} rows rejected, retrying it frame by frame: {error}")
+            self._isolate_until = (segment, offset)
+            return
+        path = await asyncio.to_thread(self._dead_letter, segment, offset, len(rows))
+        self._count_dead_letter(len(rows))
+        logger.error(f"Store rejected {len(rows)} spooled rows, moved them to {path}: {error}")
+
+    def _count_dead_letter(self, rows: int):
+        self.stats["dead_letter_rows"] += rows
+        self.stats["dead_letter_frames"] += 1
+
+    def report(self) -> dict:
+        """Spool size, drain throughput and how far behind the replay is."""
+        total_s = self.stats["total_drain_s"]
+        oldest = self._segments[0].oldest if self._segments else None
+        return {
+            "segments": len(self._segments),
+            "pending_rows": self.pending_rows(),
+            "pending_bytes": self.pending_bytes(),
+            "spilled_rows": self.stats["spilled_rows"],
+            "drained_rows": self.stats["drained_rows"],
+            "drain_errors": self.stats["drain_errors"],
+            "last_drain_rows_per_s": self.stats["drain_rows_per_s"],
+            "avg_drain_rows_per_s": round(self.stats["drained_rows"] / total_s, 1) if total_s else 0,
+            "oldest_pending_s": round(time.time() - oldest, 1) if oldest else 0,
+            "replay_lag_s": self.stats["replay_lag_s"],
+            "dead_letter_rows": self.stats["dead_letter_rows"],
+            "draining": self.draining(),
+        }
+
+    async def close(self):
+        """Stop draining; anything still pending stays on disk for the next run."""
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self._close_file)
+        if self._segments:
+            logger.warning(f"Spool closed with {self.pending_rows()} rows pending in {self.directory}")
+
+    def _close_file(self):
+        with self._lock:
+            self._rotate()
@@ -0,0 +1,744 @@
+"""
+Message storage behind one interface.
+The scraper and the signals only need a handful of operations: insert a batch,
+check existence and checkpoints, read the keyword window and the last post per
+channel. ClickHouseStorage is the production store. SQLiteStorage implements
+the same reads with the same semantics (latest edit wins, same filters and
+ordering) on a local file or in memory, so the pipeline and its benchmarks run
+without a server.
+"""
+
+import asyncio
+import calendar
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from db import Database
+from metrics import counter, histogram
+from signals.telegram_signal import KHAMENEI_KEYWORDS, CRITICAL_KEYWORDS, ROUTINE_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# clickhouse | sqlite
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'clickhouse')
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'telegram.sqlite3')
+
+# Tag Khamenei mentions into a small pre-filtered table at insert time
+KEYWORD_VIEW_ENABLED = os.getenv('CLICKHOUSE_KEYWORD_VIEW', '0') == '1'
+
+# FINAL reads the latest version of edited messages. Without this setting FINAL
+# disables the ngram skip index; with it an edit that drops every keyword can
+# still surface its older matching version until the parts merge.
+FINAL_SETTINGS = "SETTINGS use_skip_indexes_if_final = 1"
+
+STORAGE_SECONDS = histogram('storage_call_seconds', 'Latency of hot storage calls', labels=('backend', 'op'))
+STORAGE_ERRORS = counter('storage_errors_total', 'Failed storage calls', labels=('backend', 'op'))
+INSERTED_ROWS = counter('storage_inserted_rows_total', 'Message rows inserted', labels=('backend',))
+
+
+TEXT_INDEX_NAME = 'idx_message_text'
+# ngrambf_v1's n counts UTF-8 code points, so these are 8-character ngrams;
+# short ones are so common in Persian text every granule matches
+TEXT_INDEX_NGRAM = 8
+TEXT_INDEX_TYPE = f'ngrambf_v1({TEXT_INDEX_NGRAM}, 262144, 3, 0)'
+# A LIKE pattern shorter than n yields no ngram to look up, so the index can't
+# skip for it, and one such keyword in the OR makes every mention query read all granules
+TEXT_INDEX_SHORT_KEYWORDS = [kw for kw in KHAMENEI_KEYWORDS if len(kw) < TEXT_INDEX_NGRAM]
+
+# name -> (column, type). The sort key is (channel_id, message_id), so range
+# filters on anything else only prune through these.
+SKIP_INDEXES = {
+    TEXT_INDEX_NAME: ('message_text', TEXT_INDEX_TYPE),
+    # message_id grows with time within a channel, so under the sort key each
+    # granule spans one stretch of one channel's history; without this a window
+    # query can only prune by month partition and runs FINAL over all of it
+    'idx_message_date': ('message_date', 'minmax'),
+    # Incremental mention polls read only rows written since the last one
+    'idx_scraped_at': ('scraped_at', 'minmax'),
+}
+
+
+def messages_table_sql(table: str) -> str:
+    """DDL for the messages table.
+
+    Edits are inserted as new rows; ReplacingMergeTree keeps the latest version
+    of each (channel_id, message_id) on merge, and readers use FINAL until then.
+    The version column is materialized because edit_date is NULL until an edit.
+    scraped_at is never sent by the scraper: it is the server's insert time.
+    """
+    indexes = ",\n        ".join(
+        f"INDEX {name} {column} TYPE {index_type} GRANULARITY 1" for name, (column, index_type) in SKIP_INDEXES.items()
+    )
+    return f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        message_id Int64,
+        channel_id Int64,
+        channel_username LowCardinality(String),
+        channel_title LowCardinality(String),
+        sender_id Nullable(Int64),
+        sender_username Nullable(String),
+        message_text String CODEC(ZSTD(3)),
+        message_date DateTime64(3),
+        edit_date Nullable(DateTime64(3)),
+        views Nullable(Int32),
+        forwards Nullable(Int32),
+        replies Nullable(Int32),
+        has_media Bool,
+        media_type LowCardinality(Nullable(String)),
+        is_forwarded Bool,
+        forward_from_id Nullable(Int64),
+        reply_to_msg_id Nullable(Int64),
+        raw_json String CODEC(ZSTD(6)),
+        scraped_at DateTime64(3) DEFAULT now64(3),
+        version DateTime64(3) MATERIALIZED coalesce(edit_date, message_date),
+        {indexes}
+    ) ENGINE = ReplacingMergeTree(version)
+    PARTITION BY toYYYYMM(message_date)
+    ORDER BY (channel_id, message_id)
+    """
+
+
+def _sql_array(words: list) -> str:
+    escaped = [w.replace('\\', '\\\\').replace("'", "\\'") for w in words]
+    return "[" + ", ".join(f"'{w}'" for w in escaped) + "]"
+
+
+def _ch_time(value: datetime) -> str:
+    return f"toDateTime64('{value.strftime('%Y-%m-%d %H:%M:%S')}', 3)"
+
+
+@dataclass
+class ChannelCheckpoint:
+    """Range of message ids already stored for a channel."""
+    min_id: int
+    max_id: int
+    count: int
+
+
+class Storage:
+    """Operations the scraper and signals need from the message store.
+
+    Dates are naive UTC on the way out, like ClickHouse returns them; rows are
+    the scraper's message dicts on the way in.
+    """
+
+    async def connect(self):
+        pass
+
+    async def setup_database(self):
+        pass
+
+    async def insert_messages(self, rows: list):
+        raise NotImplementedError
+
+    async def insert_message(self, message_data: dict):
+        await self.insert_messages([message_data])
+
+    async def message_exists(self, channel_id: int, message_id: int) -> bool:
+        raise NotImplementedError
+
+    async def known_message_ids(self, channel_id: int, limit: int) -> list:
+        """Newest `limit` message ids stored for a channel."""
+        raise NotImplementedError
+
+    async def channel_checkpoints(self) -> dict:
+        """channel_id -> ChannelCheckpoint for every channel with stored messages."""
+        raise NotImplementedError
+
+    async def mention_window(self, lower: datetime, upper: Optional[datetime] = None) -> list:
+        """(channel_id, message_id, message_text, message_date, channel_title) of the latest
+        version of every Khamenei mention in [lower, upper], by message_date then message_id."""
+        raise NotImplementedError
+
+    async def mention_updates(self, lower: datetime, written_since: Optional[datetime] = None) -> list:
+        """mention_window rows plus (version, scraped_at), limited to mentions whose latest
+        version was written at or after `written_since` (store insert time); None reads all."""
+        raise NotImplementedError
+
+    async def channels(self) -> list:
+        """(channel_id, channel_username, channel_title) for every stored channel."""
+        raise NotImplementedError
+
+    async def last_posts(self, channel_ids: list) -> dict:
+        """channel_id -> last message_date, for the given channels that have posts."""
+        raise NotImplementedError
+
+    async def post_minutes(self, channel_ids: list, lower: datetime, upper: datetime) -> list:
+        """(channel_id, last post) for every minute with a post in [lower, upper], by time."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class ClickHouseStorage(Storage):
+    """The production store: SQL against ClickHouse through the shared Database client.
+
+    mentions_table: pre-filtered table fed by the keyword view; None reads `messages`.
+    last_post_table: per-channel last post table fed by a view; None aggregates `messages`.
+    """
+
+    # Metric children, looked up once
+    _insert_seconds = STORAGE_SECONDS.labels('clickhouse', 'insert')
+    _insert_errors = STORAGE_ERRORS.labels('clickhouse', 'insert')
+    _exists_seconds = STORAGE_SECONDS.labels('clickhouse', 'exists')
+    _exists_errors = STORAGE_ERRORS.labels('clickhouse', 'exists')
+    _inserted_rows = INSERTED_ROWS.labels('clickhouse')
+
+    def __init__(self, db: Database = None, mentions_table: Optional[str] = None,
+                 last_post_table: Optional[str] = 'channel_last_post'):
+        self.db = db or Database()
+        self.database = self.db.database
+        self.mentions_table = mentions_table
+        self.last_post_table = last_post_table
+
+    async def connect(self):
+        await self.db.connect()
+
+    async def setup_database(self):
+        await self.db.command(f"CREATE DATABASE IF NOT EXISTS {self.database}")
+
+        if await self._table_engine('messages') == 'MergeTree':
+            raise RuntimeError(
+                f"{self.database}.messages uses the old MergeTree schema; run `python migrate.py` first"
+            )
+        await self.db.command(messages_table_sql(f"{self.database}.messages"))
+        await self._setup_skip_indexes()
+        await self._setup_last_post_view()
+        if KEYWORD_VIEW_ENABLED:
+            await self._setup_keyword_view()
+        logger.info(f"Database and table setup complete in {self.database}")
+
+    async def _table_exists(self, table: str) -> bool:
+        return await self._table_engine(table) is not None
+
+    async def _table_engine(self, table: str) -> Optional[str]:
+        result = await self.db.query(
+            f"SELECT engine FROM system.tables WHERE database = '{self.database}' AND name = '{table}'"
+        )
+        return result.result_rows[0][0] if result.result_rows else None
+
+    async def _setup_skip_indexes(self):
+        """Add skip indexes to tables created before they existed."""
+        result = await self.db.query(
+            f"SELECT name FROM system.data_skipping_indices "
+            f"WHERE database = '{self.database}' AND table = 'messages'"
+        )
+        existing = {row[0] for row in result.result_rows}
+        if TEXT_INDEX_SHORT_KEYWORDS:
+            logger.warning(
+                f"{TEXT_INDEX_NAME} can't prune mention queries: keywords shorter than "
+                f"{TEXT_INDEX_NGRAM} characters: {TEXT_INDEX_SHORT_KEYWORDS}"
+            )
+        for name, (column, index_type) in SKIP_INDEXES.items():
+            if name in existing:
+                continue
+            await self.db.command(
+                f"ALTER TABLE {self.database}.messages "
+                f"ADD INDEX IF NOT EXISTS {name} {column} TYPE {index_type} GRANULARITY 1"
+            )
+            # Existing parts only get the index once it's materialized (runs as a background mutation)
+            await self.db.command(f"ALTER TABLE {self.database}.messages MATERIALIZE INDEX {name}")
+            logger.info(f"Added {name} to {self.database}.messages, materializing in background")
+
+    async def _setup_last_post_view(self):
+        """One row per channel with its last post time, for SilenceSignal."""
+        table_existed = await self._table_exists('channel_last_post')
+
+        await self.db.command(f"""
+        CREATE TABLE IF NOT EXISTS {self.database}.channel_last_post (
+            channel_id Int64,
+            channel_username SimpleAggregateFunction(anyLast, String),
+            channel_title SimpleAggregateFunction(anyLast, String),
+            last_post SimpleAggregateFunction(max, DateTime64(3))
+        ) ENGINE = AggregatingMergeTree()
+        ORDER BY channel_id
+        """)
+
+        select_sql = f"""
+        SELECT
+            channel_id,
+            anyLast(channel_username) AS channel_username,
+            anyLast(channel_title) AS channel_title,
+            max(message_date) AS last_post
+        FROM {self.database}.messages
+        GROUP BY channel_id
+        """
+        await self.db.command(
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS {self.database}.channel_last_post_mv "
+            f"TO {self.database}.channel_last_post AS {select_sql}"
+        )
+
+        if not table_existed:
+            await self.db.command(f"INSERT INTO {self.database}.channel_last_post {select_sql}")
+            logger.info("Backfilled channel_last_post from existing messages")
+
+    async def _setup_keyword_view(self):
+        """Materialized view copying Khamenei mentions, tagged with matched keywords, at insert time."""
+        engine = await self._table_engine('khamenei_mentions')
+        if engine == 'MergeTree':
+            raise RuntimeError(
+                f"{self.database}.khamenei_mentions uses the old MergeTree schema; run `python migrate.py` first"
+            )
+        table_existed = engine is not None
+
+        # Edited mentions are replaced like in `messages`; message_date never changes, so it can lead the key
+        await self.db.command(f"""
+        CREATE TABLE IF NOT EXISTS {self.database}.khamenei_mentions (
+            channel_id Int64,
+            message_id Int64,
+            channel_title LowCardinality(String),
+            message_text String CODEC(ZSTD(3)),
+            message_date DateTime64(3),
+            critical_hits Array(String),
+            routine_hits Array(String),
+            version DateTime64(3),
+            scraped_at DateTime64(3) DEFAULT now64(3),
+            INDEX idx_scraped_at scraped_at TYPE minmax GRANULARITY 1
+        ) ENGINE = ReplacingMergeTree(version)
+        PARTITION BY toYYYYMM(message_date)
+        ORDER BY (message_date, channel_id, message_id)
+        """)
+        if table_existed:
+            await self._add_mentions_scraped_at()
+
+        select_sql = f"""
+        SELECT
+            channel_id,
+            message_id,
+            channel_title,
+            message_text,
+            message_date,
+            arrayFilter(kw -> position(message_text, kw) > 0, {_sql_array(CRITICAL_KEYWORDS)}) AS critical_hits,
+            arrayFilter(kw -> position(message_text, kw) > 0, {_sql_array(ROUTINE_KEYWORDS)}) AS routine_hits,
+            coalesce(edit_date, message_date) AS version,
+            scraped_at
+        FROM {self.database}.messages
+        WHERE multiSearchAny(message_text, {_sql_array(KHAMENEI_KEYWORDS)})
+        """
+        await self.db.command(
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS {self.database}.khamenei_mentions_mv "
+            f"TO {self.database}.khamenei_mentions AS {select_sql}"
+        )
+
+        if not table_existed:
+            # MV only sees new inserts; copy what's already there once
+            await self.db.command(f"INSERT INTO {self.database}.khamenei_mentions {select_sql}")
+            logger.info("Backfilled khamenei_mentions from existing messages")
+
+    async def _add_mentions_scraped_at(self):
+        """Give a khamenei_mentions table from before incremental polls its insert time column."""
+        result = await self.db.query(
+            f"SELECT count() FROM system.columns "
+            f"WHERE database = '{self.database}' AND table = 'khamenei_mentions' AND name = 'scraped_at'"
+        )
+        if result.result_rows[0][0]:
+            return
+        # An older view doesn't select scraped_at; the column default stamps its inserts instead
+        await self.db.command(
+            f"ALTER TABLE {self.database}.khamenei_mentions "
+            f"ADD COLUMN IF NOT EXISTS scraped_at DateTime64(3) DEFAULT now64(3)"
+        )
+        # Pin existing rows to one time instead of now64() on every read; polls re-read them once
+        await self.db.command(f"ALTER TABLE {self.database}.khamenei_mentions MATERIALIZE COLUMN scraped_at")
+        await self.db.command(
+            f"ALTER TABLE {self.database}.khamenei_mentions "
+            f"ADD INDEX IF NOT EXISTS idx_scraped_at scraped_at TYPE minmax GRANULARITY 1"
+        )
+        await self.db.command(f"ALTER TABLE {self.database}.khamenei_mentions MATERIALIZE INDEX idx_scraped_at")
+        logger.info(f"Added scraped_at to {self.database}.khamenei_mentions")
+
+    async def message_exists(self, channel_id: int, message_id: int) -> bool:
+        """Check if message already exists in database."""
+        started = time.perf_counter()
+        try:
+            result = await self.db.query(
+                f"SELECT 1 FROM {self.database}.messages WHERE channel_id = {channel_id} AND message_id = {message_id} LIMIT 1"
+            )
+            return len(result.result_rows) > 0
+        except Exception as e:
+            self._exists_errors.inc()
+            logger.error(f"Error checking message existence: {e}")
+            return False
+        finally:
+            self._exists_seconds.observe(time.perf_counter() - started)
+
+    async def known_message_ids(self, channel_id: int, limit: int) -> list:
+        """Newest `limit` message ids stored for a channel, in one query."""
+        result = await self.db.query(
+            f"SELECT message_id FROM {self.database}.messages FINAL WHERE channel_id = {channel_id} ORDER BY message_id DESC LIMIT {limit}"
+        )
+        return [row[0] for row in result.result_rows]
+
+    async def channel_checkpoints(self) -> dict:
+        """channel_id -> ChannelCheckpoint for every channel with stored messages."""
+        result = await self.db.query(
+            f"SELECT channel_id, min(message_id), max(message_id), count() FROM {self.database}.messages FINAL GROUP BY channel_id"
+        )
+        return {
+            channel_id: ChannelCheckpoint(min_id=min_id, max_id=max_id, count=count)
+            for channel_id, min_id, max_id, count in result.result_rows
+        }
+
+    async def insert_messages(self, rows: list):
+        """Insert a batch of message rows in one INSERT (one MergeTree part)."""
+        if not rows:
+            return
+        columns = list(rows[0].keys())
+        values = [[row[c] for c in columns] for row in rows]
+
+        started = time.perf_counter()
+        try:
+            await self.db.insert(
+                f"{self.database}.messages",
+                values,
+                column_names=columns
+            )
+        except Exception:
+            self._insert_errors.inc()
+            raise
+        finally:
+            self._insert_seconds.observe(time.perf_counter() - started)
+        self._inserted_rows.inc(len(rows))
+
+    def mention_query(self, lower: datetime, upper: Optional[datetime] = None, settings: str = FINAL_SETTINGS,
+                      written_since: Optional[datetime] = None, versions: bool = False) -> str:
+        """Latest version of mentions since `lower` (up to `upper`); served by the ngram skip index or the mentions table.
+
+        written_since keeps only rows inserted since then; versions adds the version and scraped_at columns.
+        """
+        if self.mentions_table:
+            source = f"{self.database}.{self.mentions_table}"
+            conditions = ""
+        else:
+            source = f"{self.database}.messages"
+            khamenei_conditions = " OR ".join([
+                f"message_text LIKE '%{kw}%'" for kw in KHAMENEI_KEYWORDS
+            ])
+            conditions = f"AND ({khamenei_conditions})"
+        if upper is not None:
+            conditions += f"\n          AND message_date <= {_ch_time(upper)}"
+        if written_since is not None:
+            conditions += f"\n          AND scraped_at >= {_ch_time(written_since)}"
+        columns = "channel_id, message_id, message_text, message_date, channel_title"
+        if versions:
+            columns += ", version, scraped_at"
+
+        return f"""
+        SELECT {columns}
+        FROM {source} FINAL
+        WHERE message_date >= {_ch_time(lower)}
+          {conditions}
+        ORDER BY message_date, message_id
+        {settings}
+        """
+
+    async def mention_window(self, lower: datetime, upper: Optional[datetime] = None) -> list:
+        return (await self.db.query(self.mention_query(lower, upper))).result_rows
+
+    async def mention_updates(self, lower: datetime, written_since: Optional[datetime] = None) -> list:
+        query = self.mention_query(lower, written_since=written_since, versions=True)
+        return (await self.db.query(query)).result_rows
+
+    async def channels(self) -> list:
+        if self.last_post_table:
+            query = f"""
+            SELECT channel_id, anyLast(channel_username), anyLast(channel_title)
+            FROM {self.database}.{self.last_post_table}
+            GROUP BY channel_id
+            """
+        else:
+            query = f"""
+            SELECT channel_id, any(channel_username), any(channel_title)
+            FROM {self.database}.messages
+            GROUP BY channel_id
+            """
+        return (await self.db.query(query)).result_rows
+
+    async def last_posts(self, channel_ids: list) -> dict:
+        if not channel_ids:
+            return {}
+        id_list = ", ".join(str(i) for i in channel_ids)
+        if self.last_post_table:
+            query = f"""
+            SELECT channel_id, max(last_post)
+            FROM {self.database}.{self.last_post_table}
+            WHERE channel_id IN ({id_list})
+            GROUP BY channel_id
+            """
+        else:
+            query = f"""
+            SELECT channel_id, max(message_date)
+            FROM {self.database}.messages
+            WHERE channel_id IN ({id_list})
+            GROUP BY channel_id
+            """
+        return dict((await self.db.query(query)).result_rows)
+
+    async def post_minutes(self, channel_ids: list, lower: datetime, upper: datetime) -> list:
+        if not channel_ids:
+            return []
+        result = await self.db.query(f"""
+        SELECT channel_id, max(message_date) AS last_post
+        FROM {self.database}.messages
+        WHERE channel_id IN ({", ".join(str(i) for i in channel_ids)})
+          AND message_date >= {_ch_time(lower)}
+          AND message_date <= {_ch_time(upper)}
+        GROUP BY channel_id, toStartOfMinute(message_date)
+        ORDER BY last_post
+        """)
+        return result.result_rows
+
+    async def close(self):
+        await self.db.close()
+
+
+MESSAGE_COLUMNS = [
+    "message_id", "channel_id", "channel_username", "channel_title", "sender_id", "sender_username",
+    "message_text", "message_date", "edit_date", "views", "forwards", "replies", "has_media",
+    "media_type", "is_forwarded", "forward_from_id", "reply_to_msg_id", "raw_json",
+]
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_ms(value: Optional[datetime]) -> Optional[int]:
+    """Epoch milliseconds, truncated like DateTime64(3); naive datetimes are UTC."""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return calendar.timegm(value.timetuple()) * 1000 + value.microsecond // 1000
+
+
+def _bound_ms(value: datetime) -> int:
+    # ClickHouse queries format bounds to the second
+    return _to_ms(value.replace(microsecond=0))
+
+
+def _from_ms(ms: int) -> datetime:
+    return _EPOCH + timedelta(milliseconds=ms)
+
+
+class SQLiteStorage(Storage):
+    """Local stand-in for ClickHouse: one SQLite file, or ':memory:'.
+
+    Rows are upserted on (channel_id, message_id) keeping the newest version,
+    which is what ClickHouse's ReplacingMergeTree + FINAL returns. Mentions are
+    flagged at insert time, like the keyword view, and read through a partial
+    index on message_date. All calls run on one dedicated thread, so the event
+    loop never waits on SQLite. scraped_at is stamped by _insert, standing in
+    for ClickHouse's insert-time default.
+    """
+
+    # Metric children, looked up once
+    _insert_seconds = STORAGE_SECONDS.labels('sqlite', 'insert')
+    _insert_errors = STORAGE_ERRORS.labels('sqlite', 'insert')
+    _exists_seconds = STORAGE_SECONDS.labels('sqlite', 'exists')
+    _exists_errors = STORAGE_ERRORS.labels('sqlite', 'exists')
+    _inserted_rows = INSERTED_ROWS.labels('sqlite')
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self.conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def connect(self):
+        await self._call(self._connect)
+        logger.info(f"Opened SQLite storage at {self.path}")
+
+    def _connect(self):
+        self.conn = sqlite3.connect(self.path)
+        if self.path != ':memory:':
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+
+    async def setup_database(self):
+        await self._call(self._setup)
+
+    def _setup(self):
+        self.conn.executescript(f"""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY,
+            {", ".join(MESSAGE_COLUMNS)},
+            version INTEGER NOT NULL,
+            is_mention INTEGER NOT NULL,
+            scraped_at INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (channel_id, message_id)
+        );
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(messages)")}
+        if "scraped_at" not in columns:
+            # Files from before incremental polls; their rows are read by the first full fetch
+            self.conn.execute("ALTER TABLE messages ADD COLUMN scraped_at INTEGER NOT NULL DEFAULT 0")
+        self.conn.executescript("""
+        CREATE INDEX IF NOT EXISTS messages_channel_date ON messages (channel_id, message_date);
+        CREATE INDEX IF NOT EXISTS messages_mention_date ON messages (message_date) WHERE is_mention;
+        CREATE INDEX IF NOT EXISTS messages_mention_scraped ON messages (scraped_at) WHERE is_mention;
+        """)
+        self.conn.commit()
+
+    async def insert_messages(self, rows: list):
+        if not rows:
+            return
+        started = time.perf_counter()
+        try:
+            await self._call(self._insert, rows)
+        except Exception:
+            self._insert_errors.inc()
+            raise
+        finally:
+            self._insert_seconds.observe(time.perf_counter() - started)
+        self._inserted_rows.inc(len(rows))
+
+    def _insert(self, rows: list):
+        names = MESSAGE_COLUMNS + ["version", "is_mention", "scraped_at"]
+        updates = ", ".join(f"{c} = excluded.{c}" for c in names if c not in ("channel_id", "message_id"))
+        sql = (
+            f"INSERT INTO messages ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+            f"ON CONFLICT (channel_id, message_id) DO UPDATE SET {updates} "
+            # Same rule as ReplacingMergeTree: the highest version wins, the last insert on a tie
+            f"WHERE excluded.version >= messages.version"
+        )
+        values = []
+        scraped_at = int(time.time() * 1000)
+        for row in rows:
+            message_date = _to_ms(row["message_date"])
+            edit_date = _to_ms(row.get("edit_date"))
+            text = row.get("message_text") or ''
+            values.append([
+                *(row.get(c) for c in MESSAGE_COLUMNS[:7]),
+                message_date,
+                edit_date,
+                *(row.get(c) for c in MESSAGE_COLUMNS[9:]),
+                edit_date if edit_date is not None else message_date,
+                # Substring match, same as LIKE '%kw%' in the ClickHouse query
+                any(kw in text for kw in KHAMENEI_KEYWORDS),
+                scraped_at,
+            ])
+        with self.conn:
+            self.conn.executemany(sql, values)
+
+    def _query(self, sql: str, params=()) -> list:
+        return self.conn.execute(sql, params).fetchall()
+
+    async def message_exists(self, channel_id: int, message_id: int) -> bool:
+        started = time.perf_counter()
+        try:
+            rows = await self._call(
+                self._query, "SELECT 1 FROM messages WHERE channel_id = ? AND message_id = ?", (channel_id, message_id)
+            )
+        except Exception:
+            self._exists_errors.inc()
+            raise
+        finally:
+            self._exists_seconds.observe(time.perf_counter() - started)
+        return bool(rows)
+
+    async def known_message_ids(self, channel_id: int, limit: int) -> list:
+        rows = await self._call(
+            self._query,
+            "SELECT message_id FROM messages WHERE channel_id = ? ORDER BY message_id DESC LIMIT ?",
+            (channel_id, limit),
+        )
+        return [row[0] for row in rows]
+
+    async def channel_checkpoints(self) -> dict:
+        rows = await self._call(
+            self._query, "SELECT channel_id, min(message_id), max(message_id), count(*) FROM messages GROUP BY channel_id"
+        )
+        return {
+            channel_id: ChannelCheckpoint(min_id=min_id, max_id=max_id, count=count)
+            for channel_id, min_id, max_id, count in rows
+        }
+
+    async def mention_window(self, lower: datetime, upper: Optional[datetime] = None) -> list:
+        sql = """
+        SELECT channel_id, message_id, message_text, message_date, channel_title
+        FROM messages
+        WHERE is_mention AND message_date >= ? AND message_date <= ?
+        ORDER BY message_date, message_id
+        """
+        upper_ms = _bound_ms(upper) if upper is not None else 2 ** 62
+        rows = await self._call(self._query, sql, (_bound_ms(lower), upper_ms))
+        return [(cid, mid, text, _from_ms(date), title) for cid, mid, text, date, title in rows]
+
+    async def mention_updates(self, lower: datetime, written_since: Optional[datetime] = None) -> list:
+        if written_since is None:
+            rows = await self._call(self._query, """
+            SELECT channel_id, message_id, message_text, message_date, channel_title, version, scraped_at
+            FROM messages
+            WHERE is_mention AND message_date >= ?
+            ORDER BY message_date, message_id
+            """, (_bound_ms(lower),))
+        else:
+            # Few rows are new since the last poll; don't let the planner walk the date index instead
+            rows = await self._call(self._query, """
+            SELECT channel_id, message_id, message_text, message_date, channel_title, version, scraped_at
+            FROM messages INDEXED BY messages_mention_scraped
+            WHERE is_mention AND scraped_at >= ? AND message_date >= ?
+            ORDER BY message_date, message_id
+            """, (_bound_ms(written_since), _bound_ms(lower)))
+        return [
+            (cid, mid, text, _from_ms(date), title, _from_ms(version), _from_ms(scraped_at))
+            for cid, mid, text, date, title, version, scraped_at in rows
+        ]
+
+    async def channels(self) -> list:
+        # Bare columns next to max() come from the channel's newest row
+        rows = await self._call(
+            self._query,
+            "SELECT channel_id, channel_username, channel_title, max(message_date) FROM messages GROUP BY channel_id",
+        )
+        return [row[:3] for row in rows]
+
+    async def last_posts(self, channel_ids: list) -> dict:
+        if not channel_ids:
+            return {}
+        placeholders = ", ".join("?" * len(channel_ids))
+        rows = await self._call(
+            self._query,
+            f"SELECT channel_id, max(message_date) FROM messages WHERE channel_id IN ({placeholders}) GROUP BY channel_id",
+            list(channel_ids),
+        )
+        return {channel_id: _from_ms(last) for channel_id, last in rows}
+
+    async def post_minutes(self, channel_ids: list, lower: datetime, upper: datetime) -> list:
+        if not channel_ids:
+            return []
+        placeholders = ", ".join("?" * len(channel_ids))
+        rows = await self._call(self._query, f"""
+        SELECT channel_id, max(message_date) AS last_post
+        FROM messages
+        WHERE channel_id IN ({placeholders}) AND message_date >= ? AND message_date <= ?
+        GROUP BY channel_id, message_date / 60000
+        ORDER BY last_post
+        """, [*channel_ids, _bound_ms(lower), _bound_ms(upper)])
+        return [(channel_id, _from_ms(last)) for channel_id, last in rows]
+
+    async def close(self):
+        if self.conn is not None:
+            await self._call(self.conn.close)
+            self.conn = None
+        self._executor.shutdown(wait=False)
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    """The configured backend; ClickHouse reads mentions from the keyword view when it's enabled."""
+    if backend == 'clickhouse':
+        return ClickHouseStorage(mentions_table='khamenei_mentions' if KEYWORD_VIEW_ENABLED else None)
+    if backend == 'sqlite':
+        return SQLiteStorage(SQLITE_PATH)
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}")
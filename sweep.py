@@ -0,0 +1,326 @@
+"""
+Parameter sweep over KhameneiAggregator configurations.
+Scores whole replayed signal series at once with NumPy - one pass per
+configuration instead of a Python loop per tick - across a process pool, and
+ranks configurations by alert count, time in RED and flapping.
+NumPy is only needed here, not by the scraper or the index runner, so it is
+not installed with them: `pip install numpy` before running a sweep.
+
+    python sweep.py --start 2026-01-01 --end 2026-02-01 --save-series series.npz
+    python sweep.py --series series.npz --yellow 30 35 40 --red 60 65 70 \\
+        --weights 0.6,0.4,0 0.5,0.3,0.2 --out sweep.npz
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    raise SystemExit("sweep.py needs NumPy, which the scraper and index runner don't use: pip install numpy") from None
+
+from aggregator import KhameneiAggregator
+from signals import SignalOutput
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SIGNAL_NAMES = ("telegram_velocity", "rial_crash", "state_media_silence")
+LEVELS = ("GREEN", "YELLOW", "RED")
+METRICS = ("alerts", "red_fraction", "yellow_fraction", "flaps_per_day", "max_score")
+
+
+def _epoch(when: datetime) -> float:
+    return when.replace(tzinfo=timezone.utc).timestamp()
+
+
+# --- Series -----------------------------------------------------------------
+
+def series_from_signals(signals: list) -> dict:
+    """Column arrays from Backtest.signals: timestamps plus value/confidence per signal."""
+    series = {"timestamp": np.array([_epoch(triple[0].timestamp) for triple in signals], dtype=np.float64)}
+    for i, name in enumerate(SIGNAL_NAMES):
+        series[f"{name}.value"] = np.array([triple[i].value for triple in signals], dtype=np.float64)
+        series[f"{name}.confidence"] = np.array([triple[i].confidence for triple in signals], dtype=np.float64)
+    return series
+
+
+def load_series(path: str) -> dict:
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def save_series(series: dict, path: str):
+    np.savez_compressed(path, **series)
+
+
+async def build_series(start: datetime, end: datetime, step_seconds: int) -> dict:
+    from backtest import Backtest
+    from storage import create_storage
+
+    storage = create_storage()
+    await storage.connect()
+    try:
+        backtest = Backtest(storage, start, end, step_seconds=step_seconds)
+        await backtest.load()
+    finally:
+        await storage.close()
+    return series_from_signals(backtest.build_signals())
+
+
+# --- Vectorized aggregator --------------------------------------------------
+
+def time_pressure_multipliers(days: np.ndarray) -> np.ndarray:
+    """aggregator.time_pressure_multiplier over an array of day counts."""
+    return np.select(
+        [days >= 60, days >= 30, days >= 14, days >= 7, days >= 3],
+        [
+            np.ones_like(days),
+            1.0 + (60 - days) / 150,
+            1.2 + (30 - days) / 53,
+            1.5 + (14 - days) / 14,
+            2.0 + (7 - days) / 4,
+        ],
+        default=3.0,
+    )
+
+
+def deadline_multipliers(timestamps: np.ndarray, deadline: str) -> np.ndarray:
+    """Time pressure multiplier at each tick, using whole days remaining like get_days_remaining."""
+    seconds_left = _epoch(datetime.strptime(deadline, "%Y-%m-%d")) - timestamps
+    return time_pressure_multipliers(np.maximum(0, np.floor(seconds_left / 86400)))
+
+
+def raw_scores(series: dict, weights: tuple):
+    """Confidence-weighted signal average and index confidence per tick."""
+    n = len(series["timestamp"])
+    weighted_sum = np.zeros(n)
+    weighted_confidence = np.zeros(n)
+    total_weight = np.zeros(n)
+    for name, weight in zip(SIGNAL_NAMES, weights):
+        confidence = series[f"{name}.confidence"]
+        effective = weight * confidence
+        weighted_sum += series[f"{name}.value"] * effective
+        weighted_confidence += confidence * weight
+        total_weight += effective
+
+    active = total_weight > 0
+    raw = np.divide(weighted_sum, total_weight, out=np.zeros(n), where=active)
+    weight_total = sum(weights)
+    confidence = np.where(active, weighted_confidence / weight_total if weight_total else 0.0, 0.0)
+    return raw, confidence
+
+
+def score_config(series: dict, config: dict, raw: np.ndarray = None, multiplier: np.ndarray = None) -> dict:
+    """Levels, alerts and summary metrics of one configuration over the whole series."""
+    timestamps = series["timestamp"]
+    n = len(timestamps)
+    if raw is None:
+        raw, _ = raw_scores(series, config["weights"])
+    if multiplier is None:
+        multiplier = deadline_multipliers(timestamps, config["deadline"])
+
+    score = np.minimum(100, raw * multiplier)
+    level = np.where(score >= config["red"], 2, np.where(score >= config["yellow"], 1, 0))
+
+    # should_alert: every level change re-arms last_alerted_level, so it always equals the
+    # previous tick's level; RED alerts every tick; plus the rate-of-change rule over the
+    # aggregator's bounded history
+    previous = np.concatenate(([0], level[:-1]))
+    index = np.arange(n)
+    first = np.searchsorted(timestamps, timestamps - config["roc_minutes"] * 60, side="left")
+    first = np.maximum(first, index - (config["max_history"] - 1))
+    roc = score - score[first]
+    alert = (level != previous) | (level == 2) | ((index - first >= 1) & (roc > config["roc_points"]))
+
+    span_days = (timestamps[-1] - timestamps[0]) / 86400 if n > 1 else 0
+    flaps = int(np.count_nonzero(level[1:] != level[:-1]))
+    return {
+        "alerts": int(np.count_nonzero(alert)),
+        "red_fraction": float(np.mean(level == 2)) if n else 0.0,
+        "yellow_fraction": float(np.mean(level == 1)) if n else 0.0,
+        "flaps_per_day": flaps / span_days if span_days else float(flaps),
+        "max_score": float(score.max()) if n else 0.0,
+        "_level": level,
+        "_alert": alert,
+        "_score": score,
+    }
+
+
+# --- Pool -------------------------------------------------------------------
+
+_series = None
+
+
+def _init_worker(series: dict):
+    global _series
+    _series = series
+
+
+def _score_chunk(configs: list) -> list:
+    """Score configs in one worker, reusing raw scores and multipliers shared between them."""
+    raws = {}
+    multipliers = {}
+    results = []
+    for config in configs:
+        weights = config["weights"]
+        if weights not in raws:
+            raws[weights] = raw_scores(_series, weights)[0]
+        if config["deadline"] not in multipliers:
+            multipliers[config["deadline"]] = deadline_multipliers(_series["timestamp"], config["deadline"])
+        metrics = score_config(_series, config, raws[weights], multipliers[config["deadline"]])
+        results.append({k: v for k, v in metrics.items() if not k.startswith("_")})
+    return results
+
+
+def make_configs(weights: list, yellow: list, red: list, deadlines: list,
+                 roc_minutes: list, roc_points: list) -> list:
+    max_history = KhameneiAggregator().max_history
+    return [
+        {
+            "weights": w, "yellow": y, "red": r, "deadline": d,
+            "roc_minutes": m, "roc_points": p, "max_history": max_history,
+        }
+        for w, y, r, d, m, p in itertools.product(weights, yellow, red, deadlines, roc_minutes, roc_points)
+        if y < r
+    ]
+
+
+def run_sweep(series: dict, configs: list, workers: int = None, chunk_size: int = 64) -> list:
+    """Metrics for every config, in config order."""
+    # Configs sharing weights and deadline land in the same chunk, so their arrays are reused
+    order = sorted(range(len(configs)), key=lambda i: (configs[i]["weights"], configs[i]["deadline"]))
+    chunks = [[configs[i] for i in order[j:j + chunk_size]] for j in range(0, len(order), chunk_size)]
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(series,)) as pool:
+        chunk_results = list(pool.map(_score_chunk, chunks))
+
+    results = [None] * len(configs)
+    flat = [metrics for chunk in chunk_results for metrics in chunk]
+    for i, metrics in zip(order, flat):
+        results[i] = metrics
+    return results
+
+
+def rank(configs: list, results: list, keys: list) -> list:
+    """Indices of configs, best first. Keys are metric names, '-' prefix for descending."""
+    def sort_key(i):
+        return tuple(-results[i][k[1:]] if k.startswith("-") else results[i][k] for k in keys)
+    return sorted(range(len(configs)), key=sort_key)
+
+
+def save_results(configs: list, results: list, path: str):
+    """One array per column: weights (n x signals), parameters and metrics."""
+    np.savez_compressed(
+        path,
+        signal_names=np.array(SIGNAL_NAMES),
+        weights=np.array([c["weights"] for c in configs], dtype=np.float32),
+        yellow=np.array([c["yellow"] for c in configs], dtype=np.float32),
+        red=np.array([c["red"] for c in configs], dtype=np.float32),
+        deadline=np.array([c["deadline"] for c in configs], dtype="datetime64[D]"),
+        roc_minutes=np.array([c["roc_minutes"] for c in configs], dtype=np.int16),
+        roc_points=np.array([c["roc_points"] for c in configs], dtype=np.float32),
+        **{m: np.array([r[m] for r in results], dtype=np.int32 if m == "alerts" else np.float32) for m in METRICS},
+    )
+
+
+def verify(series: dict, config: dict) -> int:
+    """Replay one config through the real aggregator; returns the number of ticks that disagree."""
+    aggregator = KhameneiAggregator(market_deadline=config["deadline"])
+    aggregator.weights = dict(zip(SIGNAL_NAMES, config["weights"]))
+    aggregator.thresholds = {"yellow": config["yellow"], "red": config["red"]}
+    aggregator.roc_alert = {"minutes": config["roc_minutes"], "points": config["roc_points"]}
+    vectorized = score_config(series, config)
+
+    last_alerted_level = "GREEN"
+    mismatches = 0
+    for i, ts in enumerate(series["timestamp"]):
+        now = datetime.utcfromtimestamp(ts)
+        signals = [
+            SignalOutput(name=name, value=float(series[f"{name}.value"][i]), raw_value={},
+                         confidence=float(series[f"{name}.confidence"][i]), timestamp=now)
+            for name in SIGNAL_NAMES
+        ]
+        index = aggregator.aggregate(signals, now=now)
+        alert = aggregator.should_alert(index, last_alerted_level)
+        if alert:
+            last_alerted_level = index.level
+        if LEVELS.index(index.level) != vectorized["_level"][i] or alert != bool(vectorized["_alert"][i]):
+            mismatches += 1
+    return mismatches
+
+
+def _weights(text: str) -> tuple:
+    weights = tuple(float(w) for w in text.split(','))
+    if len(weights) != len(SIGNAL_NAMES):
+        raise argparse.ArgumentTypeError(f"expected {len(SIGNAL_NAMES)} weights ({', '.join(SIGNAL_NAMES)})")
+    return weights
+
+
+def main():
+    defaults = KhameneiAggregator()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--series', help='load replayed signal series from this .npz')
+    parser.add_argument('--start', type=datetime.fromisoformat, help='replay from ClickHouse instead (UTC)')
+    parser.add_argument('--end', type=datetime.fromisoformat)
+    parser.add_argument('--step', type=int, default=60)
+    parser.add_argument('--save-series', help='write the replayed series to this .npz')
+    parser.add_argument('--weights', type=_weights, nargs='+', default=[tuple(defaults.weights[n] for n in SIGNAL_NAMES)])
+    parser.add_argument('--yellow', type=float, nargs='+', default=[defaults.thresholds["yellow"]])
+    parser.add_argument('--red', type=float, nargs='+', default=[defaults.thresholds["red"]])
+    parser.add_argument('--deadline', nargs='+', default=[defaults.market_deadline])
+    parser.add_argument('--roc-minutes', type=int, nargs='+', default=[defaults.roc_alert["minutes"]])
+    parser.add_argument('--roc-points', type=float, nargs='+', default=[defaults.roc_alert["points"]])
+    parser.add_argument('--rank', default='alerts,flaps_per_day,-red_fraction',
+                        help=f"comma-separated metrics ({', '.join(METRICS)}); '-' sorts descending")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--verify', type=int, default=0, help='cross-check N configs against the real aggregator')
+    parser.add_argument('--out', help='write all results as columnar .npz')
+    args = parser.parse_args()
+
+    if args.series:
+        series = load_series(args.series)
+    elif args.start and args.end:
+        series = asyncio.run(build_series(args.start, args.end, args.step))
+    else:
+        parser.error("pass --series or --start/--end")
+    if args.save_series:
+        save_series(series, args.save_series)
+
+    configs = make_configs(args.weights, args.yellow, args.red, args.deadline, args.roc_minutes, args.roc_points)
+    logger.info(f"Sweeping {len(configs)} configurations over {len(series['timestamp'])} ticks")
+
+    started = time.perf_counter()
+    results = run_sweep(series, configs, workers=args.workers)
+    elapsed = time.perf_counter() - started
+    print(f"{len(configs)} configurations in {elapsed:.2f}s ({elapsed / max(len(configs), 1) * 1000:.1f}ms each)")
+
+    for i in rank(configs, results, args.rank.split(','))[:args.top]:
+        c, r = configs[i], results[i]
+        print(
+            f"  w={c['weights']} y={c['yellow']:g} r={c['red']:g} {c['deadline']} roc={c['roc_points']:g}/{c['roc_minutes']}m"
+            f"  alerts={r['alerts']} red={r['red_fraction']:.1%} flaps/day={r['flaps_per_day']:.2f}"
+        )
+
+    # Spread the cross-checks over the grid rather than its first corner
+    for config in configs[::max(1, len(configs) // args.verify)][:args.verify] if args.verify else []:
+        print(f"Verify {config['weights']} y={config['yellow']:g} r={config['red']:g}: {verify(series, config)} mismatched ticks")
+
+    if args.out:
+        save_results(configs, results, args.out)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Buffered batch writer for ClickHouse.
+Collects rows in memory and flushes them in a single INSERT when a row count,
+byte size or latency threshold is reached - whichever comes first.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_row_bytes(row: dict) -> int:
+    """Rough in-memory size of a row, dominated by text/json columns."""
+    size = 0
+    for value in row.values():
+        if isinstance(value, str):
+            size += len(value)
+        else:
+            size += 8
+    return size
+
+
+class BatchWriter:
+    """Gathers rows and hands them to `insert_fn` in batches.
+
+    insert_fn: callable taking a list of row dicts - a coroutine function, or a
+    blocking function that is run on a worker thread so the event loop never
+    waits on the network round-trip.
+    spool: optional Spool. Failed batches go to disk instead of back into memory,
+    and so does the buffer once it passes `max_buffer_rows` behind a slow flush.
+    While the spool has a backlog new batches join it, and it drains in bulk;
+    if its drain task has died they go straight to the store again.
+    """
+
+    def __init__(self, insert_fn, name: str = "messages", max_rows: int = 1000,
+                 max_bytes: int = 4 * 1024 * 1024, max_latency: float = 0.5,
+                 spool=None, max_buffer_rows: int = None):
+        self.insert_fn = insert_fn
+        self.name = name
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.spool = spool
+        self.max_buffer_rows = max_buffer_rows or max_rows * 10
+
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._oldest = None
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._spills = set()
+        self._closed = False
+
+        self.stats = {
+            "flushes": 0,
+            "rows_written": 0,
+            "flush_errors": 0,
+            "last_flush_rows": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+            "rows_spooled": 0,
+        }
+
+    def add(self, row: dict):
+        """Queue a row. Never blocks; the flush happens in the background."""
+        if self._closed:
+            raise RuntimeError(f"BatchWriter({self.name}) is closed")
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+        if not self._buffer:
+            self._oldest = time.monotonic()
+            self._wakeup.set()
+        self._buffer.append(row)
+        self._buffer_bytes += estimate_row_bytes(row)
+
+        if self.spool is not None and len(self._buffer) >= self.max_buffer_rows:
+            # A flush is stuck on a slow server; move the backlog to disk
+            rows = self._take()
+            task = asyncio.get_running_loop().create_task(self._spill(rows))
+            self._spills.add(task)
+            task.add_done_callback(self._spills.discard)
+        elif self._is_full():
+            self._wakeup.set()
+
+    def _is_full(self) -> bool:
+        return len(self._buffer) >= self.max_rows or self._buffer_bytes >= self.max_bytes
+
+    async def _run(self):
+        while not self._closed:
+            if self._buffer:
+                timeout = max(0.0, self._oldest + self.max_latency - time.monotonic())
+            else:
+                timeout = None
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            if self._buffer and (self._is_full() or time.monotonic() - self._oldest >= self.max_latency):
+                await self.flush()
+
+    def _take(self):
+        rows = self._buffer
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._oldest = None
+        return rows
+
+    async def _spill(self, rows: list):
+        try:
+            await self.spool.append(rows)
+        except OSError as e:
+            # Disk trouble too: keep the rows in memory for the next flush
+            self._buffer = rows + self._buffer
+            self._buffer_bytes += sum(estimate_row_bytes(row) for row in rows)
+            self._oldest = time.monotonic()
+            logger.error(f"Spooling {len(rows)} rows for {self.name} failed: {e}")
+            return
+        self.stats["rows_spooled"] += len(rows)
+
+    async def flush(self):
+        """Write everything currently buffered in one INSERT."""
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+
+            rows_bytes = self._buffer_bytes
+            rows = self._take()
+
+            if self.spool is not None and self.spool.pending() and self.spool.draining():
+                # ClickHouse was down recently: queue behind the backlog rather than retry per batch
+                await self._spill(rows)
+                return
+
+            started = time.perf_counter()
+            try:
+                if inspect.iscoroutinefunction(self.insert_fn):
+                    await self.insert_fn(rows)
+                else:
+                    await asyncio.to_thread(self.insert_fn, rows)
+            except Exception as e:
+                if self.spool is not None:
+                    self.stats["flush_errors"] += 1
+                    logger.error(f"Flush of {len(rows)} rows to {self.name} failed, spooling to disk: {e}")
+                    await self._spill(rows)
+                    return
+                # Put the batch back in front of anything queued meanwhile and retry on the next flush
+                self._buffer = rows + self._buffer
+                self._buffer_bytes += rows_bytes
+                self._oldest = time.monotonic()
+                self.stats["flush_errors"] += 1
+                logger.error(f"Flush of {len(rows)} rows to {self.name} failed: {e}")
+                return
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats["flushes"] += 1
+            self.stats["rows_written"] += len(rows)
+            self.stats["last_flush_rows"] = len(rows)
+            self.stats["last_flush_ms"] = round(elapsed_ms, 2)
+            self.stats["max_flush_ms"] = round(max(self.stats["max_flush_ms"], elapsed_ms), 2)
+            self.stats["total_flush_ms"] += elapsed_ms
+            logger.debug(f"Flushed {len(rows)} rows to {self.name} in {elapsed_ms:.1f}ms")
+
+    def report(self) -> dict:
+        """Buffer depth and flush timings, for tuning thresholds under real load."""
+        flushes = self.stats["flushes"]
+        return {
+            "buffer_rows": len(self._buffer),
+            "buffer_bytes": self._buffer_bytes,
+            "flushes": flushes,
+            "rows_written": self.stats["rows_written"],
+            "flush_errors": self.stats["flush_errors"],
+            "avg_batch_rows": round(self.stats["rows_written"] / flushes, 1) if flushes else 0,
+            "avg_flush_ms": round(self.stats["total_flush_ms"] / flushes, 2) if flushes else 0,
+            "last_flush_ms": self.stats["last_flush_ms"],
+            "max_flush_ms": self.stats["max_flush_ms"],
+            "rows_spooled": self.stats["rows_spooled"],
+        }
+
+    async def close(self):
+        """Stop the background task and flush whatever is left."""
+        self._closed = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        if self._spills:
+            await asyncio.gather(*self._spills)
+        await self.flush()
+        if self._buffer:
+            logger.error(f"{len(self._buffer)} rows could not be written to {self.name} on shutdown")